@@ -0,0 +1,154 @@
+"""
+Async JSON endpoints.
+
+DRF views are sync only; under ``cms/asgi.py`` each one holds a thread for
+its whole duration. ``AsyncAPIView`` is a plain async Django view that
+speaks the same dialect as the DRF views it replaces:
+
+* JSON, form and multipart bodies are parsed into ``self.data``;
+* ``ratelimit_scope`` is enforced (see ``cms.ratelimit``) before the handler;
+* a serializer ``ValidationError`` becomes a 400 with the usual error dict,
+  any other DRF ``APIException`` its usual status and ``detail``;
+* ``HashingBusy`` (see ``cms.hashing``) becomes a 503 with Retry-After.
+
+Serializers still run sync code (validation, ORM); ``validate()`` and
+``sync()`` hand that to Django's sync thread with ``sync_to_async``.
+
+``AsyncReadView`` serves GET/HEAD of a URL that a DRF viewset owns for the
+other methods: reads run here, on the event loop, and anything else is
+handed to the viewset (``fallback``) in Django's sync thread.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import classonlymethod
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from cms import hashing, ratelimit
+
+
+def parse_body(request):
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as exc:
+            raise exceptions.ParseError(f"JSON parse error - {exc}")
+    return request.POST
+
+
+async def sync(func, *args, **kwargs):
+    return await sync_to_async(func)(*args, **kwargs)
+
+
+async def cache_call(method, *args, **kwargs):
+    """
+    ``cache.<method>(...)`` from async code. Django's ``cache.a<method>`` runs
+    the sync method in a worker thread; for the in-process cache that hop
+    costs more than the call, so it is made inline.
+    """
+    if isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache):
+        return getattr(cache, method)(*args, **kwargs)
+    return await getattr(cache, f'a{method}')(*args, **kwargs)
+
+
+class DataResponse(HttpResponse):
+    """
+    JSON rendered like DRF's ``Response``, but already rendered: a response
+    with a ``render()`` method would cost a thread hop in the ASGI handler.
+    ``data`` is kept for the response cache and tests.
+    """
+
+    def __init__(self, data, status=200, headers=None):
+        super().__init__(JSONRenderer().render(data), status=status, headers=headers, content_type='application/json')
+        self.data = data
+
+
+def finalize(response):
+    if isinstance(response, Response):
+        headers = {name: value for name, value in response.items() if name.lower() != 'content-type'}
+        return DataResponse(response.data, status=response.status_code, headers=headers)
+    return response
+
+
+def exception_response(exc):
+    data = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    response = DataResponse(data, status=exc.status_code)
+    if getattr(exc, 'wait', None):
+        response['Retry-After'] = str(int(exc.wait))
+    return response
+
+
+class AsyncAPIView(View):
+    ratelimit_scope = None
+
+    # Token-authenticated API like the DRF views: no CSRF cookie involved
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            self.data = parse_body(request) if request.method in ('POST', 'PUT', 'PATCH') else {}
+            if self.ratelimit_scope:
+                wait = await ratelimit.acheck(self.ratelimit_scope, request, self.data)
+                if wait is not None:
+                    raise exceptions.Throttled(wait)
+            await self.initial(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except serializers.ValidationError as exc:
+            return JsonResponse(serializers.as_serializer_error(exc), status=400)
+        except exceptions.APIException as exc:
+            return self.exception_response(request, exc)
+        except hashing.HashingBusy:
+            response = JsonResponse({'detail': 'Server is busy. Please retry shortly.'}, status=503)
+            response['Retry-After'] = '1'
+            return response
+
+    async def initial(self, request):
+        """Runs before the handler; may raise ``APIException``."""
+
+    def exception_response(self, request, exc):
+        return exception_response(exc)
+
+    async def validate(self, serializer):
+        """``serializer.is_valid(raise_exception=True)``, off the event loop."""
+        await sync(serializer.is_valid, raise_exception=True)
+        return serializer.validated_data
+
+
+class AsyncReadView(AsyncAPIView):
+    """
+    GET/HEAD handlers receive a DRF ``Request`` (``query_params``, ``user``)
+    and may return a DRF ``Response``, which is rendered here.
+    """
+    fallback = None
+    authentication_classes = ()
+
+    async def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync(self.fallback, request, *args, **kwargs)
+
+        request = Request(request, authenticators=[auth() for auth in self.authentication_classes])
+        self.request = request
+        return finalize(await super().dispatch(request, *args, **kwargs))
+
+    async def initial(self, request):
+        if 'HTTP_AUTHORIZATION' in request.META:
+            # Token authentication may read the cache or the user row
+            await sync(getattr, request, 'user')
+        else:
+            request.user
+
+    def exception_response(self, request, exc):
+        response = exception_response(exc)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)) and request.authenticators:
+            response['WWW-Authenticate'] = request.authenticators[0].authenticate_header(request)
+        return response
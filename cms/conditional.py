@@ -0,0 +1,118 @@
+"""
+Conditional GET (ETag / Last-Modified) for DRF viewsets.
+
+Validators come from one aggregate query over the rows the request can see
+(``MAX(<timestamp>)`` and ``COUNT(*)``), or from the timestamp of the single
+row for ``retrieve``; viewsets with cheaper version stamps override the
+``*_validators`` methods (``post.views.PostViewset``). A matching
+``If-None-Match`` / ``If-Modified-Since`` is answered with 304 before
+anything is serialized.
+
+The ``a``-prefixed methods are the same steps for async views
+(``cms.asyncapi.AsyncReadView``), on the async ORM.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    last_modified_field = 'updated_at'
+
+    def get_related_last_modified(self):
+        """Latest change of related data embedded in the payload, if any."""
+        return None
+
+    async def aget_related_last_modified(self):
+        return None
+
+    def get_validator_queryset(self):
+        # Filtered like the response, but without the serializer loading plan
+        queryset = self.get_queryset()
+        for backend in list(self.filter_backends):
+            queryset = backend().filter_queryset(self.request, queryset, self)
+        return queryset.order_by()
+
+    def make_validators(self, last_modified, *parts, related=None):
+        if related is not None and (last_modified is None or related > last_modified):
+            last_modified = related
+
+        user = self.request.user
+        source = "|".join(str(part) for part in (
+            self.request.get_full_path(),
+            user.pk if user.is_authenticated else '',
+            last_modified.isoformat() if last_modified else '',
+            *parts,
+        ))
+        etag = quote_etag(hashlib.sha1(source.encode()).hexdigest())
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        return etag, timestamp
+
+    def list_validators(self):
+        aggregate = self.get_validator_queryset().aggregate(**self.list_aggregates())
+        return self.make_validators(
+            aggregate['last_modified'], aggregate['count'], related=self.get_related_last_modified()
+        )
+
+    async def alist_validators(self):
+        aggregate = await self.get_validator_queryset().aaggregate(**self.list_aggregates())
+        return self.make_validators(
+            aggregate['last_modified'], aggregate['count'], related=await self.aget_related_last_modified()
+        )
+
+    def list_aggregates(self):
+        return {'last_modified': Max(self.last_modified_field), 'count': Count('pk')}
+
+    def retrieve_validators(self):
+        row = self.retrieve_validator_queryset().first()
+        if row is None:
+            return None, None
+        return self.make_validators(row[1], row[0], related=self.get_related_last_modified())
+
+    async def aretrieve_validators(self):
+        row = await self.retrieve_validator_queryset().afirst()
+        if row is None:
+            return None, None
+        return self.make_validators(row[1], row[0], related=await self.aget_related_last_modified())
+
+    def retrieve_validator_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return (
+            self.get_validator_queryset()
+            .filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+            .values_list('pk', self.last_modified_field)
+        )
+
+    def conditional_response(self, validators, handler, request, *args, **kwargs):
+        etag, last_modified = validators
+        if etag is None:
+            return handler(request, *args, **kwargs)
+
+        response = self.not_modified(request, etag, last_modified) or handler(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    async def aconditional_response(self, validators, handler, request, *args, **kwargs):
+        etag, last_modified = validators
+        if etag is None:
+            return await handler(request, *args, **kwargs)
+
+        response = self.not_modified(request, etag, last_modified) or await handler(request, *args, **kwargs)
+        return self.set_validators(response, etag, last_modified)
+
+    def not_modified(self, request, etag, last_modified):
+        return get_conditional_response(request._request, etag=etag, last_modified=last_modified)
+
+    def set_validators(self, response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        patch_vary_headers(response, ['Authorization'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.list_validators(), super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(self.retrieve_validators(), super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,90 @@
+"""
+Serialized writes for SQLite.
+
+SQLite has one writer per database file. Connections configured with
+``transaction_mode: IMMEDIATE`` and a ``timeout`` (see ``DATABASES``) queue
+for the write lock inside SQLite, which polls with growing sleeps. With
+``SQLITE_WRITE_QUEUE`` on, ``write_transaction()`` makes the threads of a
+process queue on a lock here first, so at most one of them is waiting in
+SQLite, and each one gets the lock as soon as the previous one commits.
+
+``write_transaction()`` is ``transaction.atomic()`` otherwise, and always
+when it is nested in a transaction: the outer transaction already holds the
+write lock, and queueing behind another thread then could deadlock.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+
+class WriteQueue:
+    def __init__(self, alias):
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.waiting = 0
+        self.timeouts = 0
+        self.max_wait = 0.0
+
+    @contextmanager
+    def atomic(self):
+        timeout = connections[self.alias].settings_dict['OPTIONS'].get('timeout', 5)
+        started = time.monotonic()
+        with self._stats_lock:
+            self.waiting += 1
+        try:
+            acquired = self._lock.acquire(timeout=timeout)
+        finally:
+            with self._stats_lock:
+                self.waiting -= 1
+                if acquired:
+                    self.max_wait = max(self.max_wait, time.monotonic() - started)
+                else:
+                    self.timeouts += 1
+        if not acquired:
+            raise OperationalError("database is locked (write queue timeout)")
+
+        try:
+            with transaction.atomic(using=self.alias):
+                yield
+        finally:
+            self._lock.release()
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'waiting': self.waiting,
+                'timeouts': self.timeouts,
+                'max_wait_ms': round(self.max_wait * 1000, 1),
+            }
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_queue(using=None):
+    alias = using or DEFAULT_DB_ALIAS
+    with _queues_lock:
+        if alias not in _queues:
+            _queues[alias] = WriteQueue(alias)
+        return _queues[alias]
+
+
+def write_transaction(using=None):
+    """``transaction.atomic()`` for a short write, queued when enabled."""
+    alias = using or DEFAULT_DB_ALIAS
+    connection = connections[alias]
+    if not settings.SQLITE_WRITE_QUEUE or connection.vendor != 'sqlite' or connection.in_atomic_block:
+        return transaction.atomic(using=alias)
+    return get_queue(alias).atomic()
+
+
+def stats():
+    return {
+        'write_queue': settings.SQLITE_WRITE_QUEUE,
+        **get_queue().stats(),
+    }
@@ -0,0 +1,117 @@
+"""
+Runtime flags.
+
+``MAINTENANCE`` and ``ALLOW_REGISTRATION`` can be flipped without a
+redeploy. Overrides live in the JSON file ``FLAGS_FILE``, shared by every
+worker on the host; a flag missing from the file falls back to the setting
+of the same name.
+
+Each process re-checks the file at most once per ``FLAGS_TTL`` seconds, and
+reads it again only when its modification time changed, so ``get()`` is a
+dict lookup on the request path. ``set()`` (used by ``manage.py set_flag``)
+replaces the file atomically; every worker picks the change up within
+``FLAGS_TTL``.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+FLAGS = ('MAINTENANCE', 'ALLOW_REGISTRATION')
+
+
+class FileFlagStore:
+    def __init__(self, path):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._mtime = None
+        self._checked = float('-inf')
+
+    def values(self):
+        now = time.monotonic()
+        if now - self._checked < settings.FLAGS_TTL:
+            return self._values
+
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                self._values = self._read() if mtime is not None else {}
+                self._mtime = mtime
+            self._checked = now
+        return self._values
+
+    def _read(self):
+        try:
+            with open(self.path) as file:
+                values = json.load(file)
+        except (OSError, ValueError):
+            # Keep serving the last good values rather than flapping to defaults
+            logger.exception("Could not read runtime flags from %s", self.path)
+            return self._values
+        return values if isinstance(values, dict) else {}
+
+    def set(self, name, value):
+        with self._lock:
+            try:
+                with open(self.path) as file:
+                    values = json.load(file)
+            except FileNotFoundError:
+                values = {}
+            if value is None:
+                values.pop(name, None)
+            else:
+                values[name] = value
+
+            directory = os.path.dirname(self.path) or '.'
+            try:
+                mode = os.stat(self.path).st_mode & 0o777
+            except FileNotFoundError:
+                mode = 0o644
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.flags-')
+            try:
+                # mkstemp creates 0600: workers running as another user must still read it
+                os.fchmod(fd, mode)
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(values, file, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._checked = float('-inf')
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = str(settings.FLAGS_FILE)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = FileFlagStore(path)
+        return _stores[path]
+
+
+def get(name):
+    values = get_store().values()
+    return values[name] if name in values else getattr(settings, name)
+
+
+def set(name, value):
+    """Override ``name`` for every worker; ``None`` goes back to the setting."""
+    get_store().set(name, value)
+
+
+def current():
+    return {name: get(name) for name in FLAGS}
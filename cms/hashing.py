@@ -0,0 +1,125 @@
+"""
+Password hashing off the event loop.
+
+PBKDF2 costs on the order of 100 ms of CPU per call. The async auth views
+hand every hash to one bounded thread pool, so a burst of logins queues
+there instead of pinning request workers or the event loop:
+
+* at most ``PASSWORD_HASH_WORKERS`` hashes run at once (hashlib releases the
+  GIL, so they really do run in parallel with request handling);
+* at most ``PASSWORD_HASH_QUEUE`` more wait for a worker; beyond that
+  ``HashingBusy`` is raised and the view answers 503 with Retry-After;
+* ``stats()`` reports in-flight work, rejections, and queue and hash times.
+
+Jobs are pure CPU and never touch the database.
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    'in_flight': 0,
+    'submitted': 0,
+    'completed': 0,
+    'rejected': 0,
+    'wait_total': 0.0,
+    'wait_max': 0.0,
+    'hash_total': 0.0,
+}
+
+
+class HashingBusy(Exception):
+    """The hashing queue is full; the client should retry shortly."""
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                thread_name_prefix='password-hash',
+            )
+        return _executor
+
+
+def _record(wait, duration):
+    with _metrics_lock:
+        _metrics['completed'] += 1
+        _metrics['wait_total'] += wait
+        _metrics['wait_max'] = max(_metrics['wait_max'], wait)
+        _metrics['hash_total'] += duration
+
+
+def _finished(future):
+    with _metrics_lock:
+        _metrics['in_flight'] -= 1
+
+
+async def run(func, *args):
+    """Run ``func(*args)`` in the hashing pool and await its result."""
+    with _metrics_lock:
+        if _metrics['in_flight'] >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE:
+            _metrics['rejected'] += 1
+            logger.warning("Password hashing queue full (%d in flight)", _metrics['in_flight'])
+            raise HashingBusy()
+        _metrics['in_flight'] += 1
+        _metrics['submitted'] += 1
+
+    queued_at = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            _record(started - queued_at, time.perf_counter() - started)
+
+    future = get_executor().submit(job)
+    # Fires on completion or cancellation, so in_flight cannot leak
+    future.add_done_callback(_finished)
+    return await asyncio.wrap_future(future)
+
+
+def _verify(password, encoded):
+    must_update = []
+    valid = hashers.check_password(password, encoded, setter=lambda raw: must_update.append(True))
+    return valid, bool(must_update)
+
+
+async def check_password(password, encoded):
+    """Returns ``(valid, must_update)``; rehash and save when ``must_update``."""
+    return await run(_verify, password, encoded)
+
+
+async def make_password(password):
+    return await run(hashers.make_password, password)
+
+
+def stats():
+    with _metrics_lock:
+        metrics = dict(_metrics)
+    completed = metrics['completed']
+    return {
+        'workers': settings.PASSWORD_HASH_WORKERS,
+        'queue_limit': settings.PASSWORD_HASH_QUEUE,
+        'in_flight': metrics['in_flight'],
+        'submitted': metrics['submitted'],
+        'completed': completed,
+        'rejected': metrics['rejected'],
+        'avg_wait_ms': 1000 * metrics['wait_total'] / completed if completed else 0.0,
+        'max_wait_ms': 1000 * metrics['wait_max'],
+        'avg_hash_ms': 1000 * metrics['hash_total'] / completed if completed else 0.0,
+    }
@@ -0,0 +1,206 @@
+"""
+Responsive image derivatives.
+
+Once an image upload commits, a background thread pool renders it at each
+width in ``PRESETS`` and in each of ``FORMATS``, next to the original under
+``derivatives/``. The stored names go in the JSON field ``<field>_derivatives``
+of the same row, so serializers can build ``srcset`` values without touching
+storage:
+
+    {"sm": {"width": 320, "webp": "...-sm.webp", "jpeg": "...-sm.jpg"}, ...}
+
+The map is cleared as soon as the image changes, so a response never points
+at derivatives of a previous upload.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+
+logger = logging.getLogger(__name__)
+
+# (name, width in px), smallest first
+PRESETS = (('sm', 320), ('md', 640), ('lg', 1280))
+
+# format -> (extension, Pillow format, save options)
+FORMATS = {
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Sent from the worker once a row's derivative map is written; ``pk`` and
+# ``field_name`` identify the image.
+derivatives_ready = Signal()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def derivatives_field(field_name):
+    return f'{field_name}_derivatives'
+
+
+def derivative_name(name, preset, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, 'derivatives', f'{stem}-{preset}.{extension}')
+
+
+def image_changed(instance, field_name):
+    """Whether ``instance.<field_name>`` differs from the stored row."""
+    file = getattr(instance, field_name)
+    if file and not file._committed:
+        return True
+    if instance._state.adding:
+        return bool(file)
+    loaded = getattr(instance, '_loaded_values', {})
+    if field_name not in loaded:
+        return False
+    return (loaded[field_name] or '') != (file.name or '')
+
+
+def _flatten(image):
+    """RGB copy of ``image``, with any transparency laid on white (JPEG has no alpha)."""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_derivatives(storage, name):
+    """Write every preset/format of image ``name`` to ``storage`` and return the map."""
+    largest = PRESETS[-1][1]
+    with storage.open(name, 'rb') as source, Image.open(source) as original:
+        # JPEG sources decode straight at a reduced scale: camera images are
+        # many times larger than the biggest preset.
+        original.draft('RGB', (largest, largest))
+        image = _flatten(ImageOps.exif_transpose(original))
+
+    derivatives = {}
+    rendered_widths = set()
+    for preset, width in reversed(PRESETS):
+        # Never upscale; a small original yields fewer, smaller presets
+        width = min(width, image.width)
+        if width in rendered_widths:
+            continue
+        rendered_widths.add(width)
+        if width < image.width:
+            # Each size is reduced from the previous one, not from the original
+            image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+        entry = {'width': width}
+        for format_name, (extension, pil_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            target = derivative_name(name, preset, extension)
+            if storage.exists(target):
+                storage.delete(target)
+            entry[format_name] = storage.save(target, ContentFile(buffer.getvalue()))
+        derivatives[preset] = entry
+
+    return dict(reversed(derivatives.items()))
+
+
+def generate(model, pk, field_name, name):
+    """
+    Render the derivatives of image ``name`` and record them on row ``pk``,
+    unless the row's image changed in the meantime. Returns the map, or None.
+    """
+    storage = model._meta.get_field(field_name).storage
+    try:
+        derivatives = render_derivatives(storage, name)
+    except (OSError, Image.DecompressionBombError) as exc:
+        logger.warning("Could not render derivatives of %s: %s", name, exc)
+        return None
+
+    changes = {derivatives_field(field_name): derivatives}
+    # A direct UPDATE skips auto_now, which HTTP validators depend on
+    changes.update({
+        field.name: timezone.now()
+        for field in model._meta.concrete_fields if getattr(field, 'auto_now', False)
+    })
+    updated = model._base_manager.filter(pk=pk, **{field_name: name}).update(**changes)
+    if updated:
+        derivatives_ready.send(sender=model, pk=pk, field_name=field_name)
+    return derivatives
+
+
+def run_in_worker(model, pk, field_name, name):
+    """``generate`` for a pool thread, which must not keep its connection open."""
+    try:
+        return generate(model, pk, field_name, name)
+    except Exception:
+        logger.exception("Derivative generation failed for %s", name)
+    finally:
+        connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_DERIVATIVE_WORKERS,
+                thread_name_prefix='image-derivatives',
+            )
+        return _executor
+
+
+def schedule(instance, field_name):
+    """
+    Generate derivatives for ``instance.<field_name>`` after the current
+    transaction commits, in the worker pool (or inline when
+    ``IMAGE_DERIVATIVE_WORKERS`` is 0).
+    """
+    name = getattr(instance, field_name).name
+    if not name:
+        return
+    model, pk = type(instance), instance.pk
+
+    def submit():
+        if settings.IMAGE_DERIVATIVE_WORKERS:
+            get_executor().submit(run_in_worker, model, pk, field_name, name)
+        else:
+            generate(model, pk, field_name, name)
+
+    transaction.on_commit(submit, robust=True)
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """Renders a derivative map as ``{format: "url 320w, url 640w, ..."}``."""
+
+    def to_representation(self, derivatives):
+        if not derivatives:
+            return None
+
+        request = self.context.get('request')
+        entries = sorted(derivatives.values(), key=lambda entry: entry['width'])
+
+        srcset = {}
+        for format_name in FORMATS:
+            candidates = []
+            for entry in entries:
+                if format_name not in entry:
+                    continue
+                url = default_storage.url(entry[format_name])
+                if request:
+                    url = request.build_absolute_uri(url)
+                candidates.append(f"{url} {entry['width']}w")
+            if candidates:
+                srcset[format_name] = ", ".join(candidates)
+        return srcset
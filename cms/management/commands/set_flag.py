@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cms import flags
+
+
+VALUES = {'on': True, 'off': False, 'default': None}
+
+
+class Command(BaseCommand):
+    help = "Show or change runtime flags (maintenance mode, registration) for every worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', nargs='?', choices=flags.FLAGS)
+        parser.add_argument('value', nargs='?', choices=VALUES, help="'default' goes back to the setting.")
+
+    def handle(self, *args, **options):
+        name, value = options['name'], options['value']
+        if name is not None:
+            if value is None:
+                raise CommandError("Give a value: on, off or default.")
+            flags.set(name, VALUES[value])
+            self.stdout.write(self.style.SUCCESS(f"{name} set to {value}."))
+
+        for flag, current in flags.current().items():
+            self.stdout.write(f"{flag} = {current}")
@@ -0,0 +1,125 @@
+import copy
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+from cms.db import get_queue
+
+
+ALIAS = 'sqlite-stress'
+
+# name -> (connection OPTIONS, queue writes in cms.db)
+PROFILES = {
+    'default': (lambda: {}, False),
+    'production': (lambda: settings.DATABASES[DEFAULT_DB_ALIAS]['OPTIONS'], False),
+    'production+queue': (lambda: settings.DATABASES[DEFAULT_DB_ALIAS]['OPTIONS'], True),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent read-then-write transactions against a scratch SQLite file with the "
+        "default connection settings and with the production profile, and count lock errors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transactions', type=int, default=200, help="Per thread.")
+        parser.add_argument('--profile', action='append', choices=list(PROFILES),
+                            help="Profile to run; repeat for several. Default: all.")
+
+    def handle(self, *args, **options):
+        self.results = {}
+        for name in options['profile'] or list(PROFILES):
+            options_factory, queued = PROFILES[name]
+            with tempfile.TemporaryDirectory() as directory:
+                try:
+                    self.configure(os.path.join(directory, 'stress.sqlite3'), options_factory())
+                    self.results[name] = self.run(options['threads'], options['transactions'], queued)
+                finally:
+                    if ALIAS in connections.settings:
+                        connections[ALIAS].close()
+                        del connections[ALIAS]
+                        del connections.settings[ALIAS]
+
+            result = self.results[name]
+            self.stdout.write(
+                f"{name:<17} {result['committed']:6d} committed  {result['lock_errors']:6d} lock errors  "
+                f"{result['rate']:8.0f} tx/s  p99 {result['p99'] * 1000:8.1f} ms"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['threads']} threads x {options['transactions']} transactions per profile"
+        ))
+
+    def configure(self, path, options):
+        config = copy.deepcopy(connections[DEFAULT_DB_ALIAS].settings_dict)
+        config.update(ENGINE='django.db.backends.sqlite3', NAME=path, OPTIONS=dict(options), CONN_MAX_AGE=0)
+        connections.settings[ALIAS] = config
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+            cursor.execute("CREATE TABLE entry (id INTEGER PRIMARY KEY, thread INTEGER NOT NULL, value INTEGER NOT NULL)")
+            cursor.execute("INSERT INTO counter (id, value) VALUES (1, 0)")
+
+    def run(self, threads, transactions, queued):
+        atomic = get_queue(ALIAS).atomic if queued else (lambda: transaction.atomic(using=ALIAS))
+        latencies, lock_errors, failures = [], [0], []
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def worker(number):
+            connection = connections[ALIAS]
+            mine, errors = [], 0
+            try:
+                start.wait()
+                for _ in range(transactions):
+                    started = time.perf_counter()
+                    try:
+                        # Read, then write what was read: the shape of Post.save
+                        with atomic(), connection.cursor() as cursor:
+                            cursor.execute("SELECT value FROM counter WHERE id = 1")
+                            value = cursor.fetchone()[0] + 1
+                            cursor.execute("UPDATE counter SET value = %s WHERE id = 1", [value])
+                            cursor.execute("INSERT INTO entry (thread, value) VALUES (%s, %s)", [number, value])
+                    except OperationalError as exc:
+                        if 'locked' not in str(exc):
+                            raise
+                        errors += 1
+                    else:
+                        mine.append(time.perf_counter() - started)
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connection.close()
+                with lock:
+                    latencies.extend(mine)
+                    lock_errors[0] += errors
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if failures:
+            raise failures[0]
+
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute("SELECT value FROM counter WHERE id = 1")
+            value = cursor.fetchone()[0]
+        if value != len(latencies):
+            raise RuntimeError(f"Lost updates: counter is {value} after {len(latencies)} commits")
+
+        latencies.sort()
+        return {
+            'committed': len(latencies),
+            'lock_errors': lock_errors[0],
+            'rate': len(latencies) / elapsed,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0,
+        }
@@ -0,0 +1,47 @@
+import sqlite3
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def replica_path(name):
+    """The file behind a replica NAME, which may be a ``file:...?mode=ro`` URI."""
+    name = str(name)
+    return urlsplit(name).path if name.startswith('file:') else name
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the default SQLite database over the SQLite replicas in DATABASE_REPLICAS, "
+        "standing in for replication in development. Run it periodically to refresh them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('aliases', nargs='*', help="Replicas to refresh (default: all).")
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        for alias in aliases:
+            if alias not in settings.DATABASE_REPLICAS:
+                raise CommandError(f"{alias!r} is not in DATABASE_REPLICAS")
+            if connections[alias].vendor != 'sqlite' or connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+                raise CommandError(f"{alias!r}: only SQLite databases can be copied")
+
+        source = connections[DEFAULT_DB_ALIAS]
+        source.ensure_connection()
+        for alias in aliases:
+            started = time.perf_counter()
+            # Replicas are opened read-only; write the copy through a connection of our own
+            target = sqlite3.connect(replica_path(connections[alias].settings_dict['NAME']))
+            try:
+                source.connection.backup(target)
+                # Read-only connections cannot open a WAL database without its -shm file
+                target.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                target.close()
+            self.stdout.write(f"{alias}: copied in {time.perf_counter() - started:.2f}s")
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(aliases)} replica(s) from {DEFAULT_DB_ALIAS}."))
@@ -0,0 +1,184 @@
+"""
+Media file delivery.
+
+``serve`` answers GET/HEAD for files under ``MEDIA_ROOT`` with:
+
+* ``ETag`` / ``Last-Modified`` validators and 304 responses;
+* single-range ``Range`` requests (206 / 416), honouring ``If-Range``;
+* ``Cache-Control: immutable`` for names that can never change content:
+  uuid-named uploads (``post_upload_path``, ``user_profile_pic_path`` and
+  their image derivatives) and SHA-256-named gallery blobs. Other files
+  are revalidated on every use.
+
+With ``MEDIA_SENDFILE_BACKEND`` set, the body is left to the front server
+(``X-Sendfile`` for Apache/lighttpd, ``X-Accel-Redirect`` for nginx), which
+then also handles ranges. Otherwise the file goes out through
+``FileResponse``: under a server providing ``wsgi.file_wrapper`` (gunicorn)
+it is sent with ``os.sendfile``, ranges included, since ``FileRange`` keeps
+``fileno()`` and starts at the range offset.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# uuid4 or sha256 stem, optionally with a derivative suffix (-sm, -md...)
+_IMMUTABLE_NAME = re.compile(
+    r'^(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{64})'
+    r'(?:-[a-z]+)?(?:\.[A-Za-z0-9]+)?$'
+)
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """
+    ``length`` bytes of an open file, from its current position.
+
+    Keeps ``fileno()`` so ``wsgi.file_wrapper`` can use ``os.sendfile``: the
+    server starts at the file's current offset and sends Content-Length bytes.
+    """
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def is_immutable(path):
+    return bool(_IMMUTABLE_NAME.match(os.path.basename(path)))
+
+
+def parse_range(header, size):
+    """
+    ``(start, end)`` (inclusive) for a single-range ``Range`` header, None to
+    serve the whole file, or ``False`` if the range cannot be satisfied.
+    """
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # Malformed or multiple ranges: ignoring Range is always allowed
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if if_range is None:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        # Only a strong, exact match may resume a partial download
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _offload(response, path, relative_path):
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend == 'x-sendfile':
+        response['X-Sendfile'] = path
+    elif backend == 'x-accel-redirect':
+        # nginx decodes the URI, so names with spaces, '%' or '#' need quoting
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(relative_path.lstrip('/'))
+    return response
+
+
+@require_safe
+def serve(request, path):
+    relative_path = path.replace('\\', '/')
+    if any(part.startswith('.') for part in relative_path.split('/') if part):
+        # Dot directories hold upload staging files, never served
+        raise Http404()
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, relative_path)
+    except SuspiciousFileOperation:
+        raise Http404()
+
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404()
+    if not os.path.isfile(full_path):
+        raise Http404()
+
+    size = stat.st_size
+    last_modified = int(stat.st_mtime)
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': (
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable' if is_immutable(full_path) else 'no-cache'
+        ),
+    }
+    if encoding:
+        headers['Content-Encoding'] = encoding
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        for name in ('ETag', 'Last-Modified', 'Cache-Control'):
+            not_modified[name] = headers[name]
+        return not_modified
+
+    if settings.MEDIA_SENDFILE_BACKEND:
+        response = HttpResponse(content_type=content_type, headers=headers)
+        return _offload(response, full_path, relative_path)
+
+    byte_range = None
+    if 'Range' in request.headers and _if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.headers['Range'], size)
+
+    if byte_range is False:
+        headers['Content-Range'] = f'bytes */{size}'
+        return HttpResponse(status=416, headers=headers)
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        return FileResponse(file, content_type=content_type, headers=headers)
+
+    start, end = byte_range
+    file.seek(start)
+    response = FileResponse(FileRange(file, end - start + 1), status=206, content_type=content_type, headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
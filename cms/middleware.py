@@ -1,22 +1,45 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.http import JsonResponse
-from django.urls import resolve
-from django.conf import settings
+from django.urls import reverse
 
-class MaintenanceModeMiddleware:
+from cms import flags, routers
+
+
+class FlagGateMiddleware:
     """
-    Middleware to handle maintenance mode for admin and blog sections.
+    Answers a request itself when ``blocked()`` returns a response. Sync and
+    async capable: under ASGI the check runs on the event loop, with no
+    thread hop (flags are an in-memory lookup, see ``cms.flags``).
     """
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.blocked(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.blocked(request) or await self.get_response(request)
+
+    def blocked(self, request):
+        raise NotImplementedError
+
+
+class MaintenanceModeMiddleware(FlagGateMiddleware):
+    """
+    Middleware to handle maintenance mode for admin and blog sections.
+    """
+
+    def blocked(self, request):
         # Always allow Django admin
-        if request.path.startswith("/admin/"):
-            return self.get_response(request)
-        
-        if not settings.MAINTAINANCE:
-            return self.get_response(request)
+        if request.path.startswith("/admin/") or not flags.get('MAINTENANCE'):
+            return None
 
         return JsonResponse(
             {'detail': 'The site is under maintenance. Please try again later.', "key": "MAINTENANCE_MODE","CODE":"MAT503"},
@@ -24,18 +47,49 @@ class MaintenanceModeMiddleware:
         )
 
 
-class RegistrationCheckMiddleware:
+class RegistrationCheckMiddleware(FlagGateMiddleware):
     """
     Middleware to restrict access to registration endpoint when registration is disabled.
     """
 
+    def blocked(self, request):
+        if flags.get('ALLOW_REGISTRATION') or request.path != reverse('register'):
+            return None
+
+        return JsonResponse(
+            {'detail': 'User registration is currently disabled.', "key": "REGISTRATION_DISABLED","CODE":"REG403"},
+            status=403
+        )
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets ``cms.routers.ReplicaRouter`` send the reads of GET/HEAD requests
+    to a replica. Sync and async capable, like ``FlagGateMiddleware``.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def use_replicas(self, request):
+        return request.method in ('GET', 'HEAD') and not request.path.startswith('/admin/')
 
     def __call__(self, request):
-        if request.path == "/api/register/" and not settings.ALLOW_REGISTRATION:
-            return JsonResponse(
-                {'detail': 'User registration is currently disabled.', "key": "REGISTRATION_DISABLED","CODE":"REG403"},
-                status=403
-            )
-        return self.get_response(request)
\ No newline at end of file
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.begin(self.use_replicas(request))
+        try:
+            return self.get_response(request)
+        finally:
+            routers.end(token)
+
+    async def __acall__(self, request):
+        token = routers.begin(self.use_replicas(request))
+        try:
+            return await self.get_response(request)
+        finally:
+            routers.end(token)
@@ -0,0 +1,142 @@
+"""
+Serializer-driven queryset planner.
+
+Reads the fields a serializer will render (plain fields, dotted ``source=``
+paths and nested model serializers) and applies the matching
+``select_related`` / ``prefetch_related`` / ``only`` to a queryset, so list
+endpoints stay at a constant number of queries whatever the page size.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+_plans = {}
+
+
+class QueryPlan:
+    """What a serializer needs loaded for one model."""
+
+    def __init__(self):
+        self.only = set()
+        self.select = set()
+        self.prefetch = {}  # relation path -> (related model, QueryPlan)
+
+    def apply(self, queryset):
+        if self.select:
+            queryset = queryset.select_related(*sorted(self.select))
+
+        for path, (model, plan) in sorted(self.prefetch.items()):
+            queryset = queryset.prefetch_related(
+                Prefetch(path, queryset=plan.apply(model._default_manager.all()))
+            )
+
+        if self.only:
+            queryset = queryset.only(*sorted(self.only))
+        return queryset
+
+
+def _get_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        return None
+
+
+def _plan_source(plan, model, source_attrs, prefix=""):
+    """Walk a dotted source path (``author.username``) across the model graph."""
+    for index, attr in enumerate(source_attrs):
+        field = _get_field(model, attr)
+        if field is None:
+            # Property or method on the model: nothing we can plan.
+            return
+
+        path = f"{prefix}{attr}"
+        is_last = index == len(source_attrs) - 1
+
+        if field.many_to_many or field.one_to_many:
+            if is_last:
+                plan.prefetch.setdefault(path, (field.related_model, QueryPlan()))
+            # Traversing a to-many relation with a dotted source is not
+            # something DRF supports either; stop here.
+            return
+
+        if field.is_relation:
+            if is_last:
+                if field.concrete:
+                    plan.only.add(path)
+                return
+            if not field.concrete:
+                # Reverse one-to-one: select it, but load the whole row.
+                plan.select.add(path)
+                return
+            plan.select.add(path)
+            plan.only.add(path)
+            model = field.related_model
+            prefix = f"{path}__"
+            continue
+
+        plan.only.add(path)
+        return
+
+
+def build_plan(model, serializer, prefix="", plan=None):
+    """Collect the loading plan for ``serializer`` rendering ``model`` rows."""
+    plan = plan if plan is not None else QueryPlan()
+    plan.only.add(f"{prefix}{model._meta.pk.name}")
+
+    for field in serializer.fields.values():
+        if field.write_only or field.source == "*":
+            continue
+
+        source_attrs = field.source.split(".")
+
+        if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.ModelSerializer):
+            relation = _get_field(model, source_attrs[0])
+            if relation is None or len(source_attrs) != 1:
+                continue
+            child_model = field.child.Meta.model
+            plan.prefetch[f"{prefix}{source_attrs[0]}"] = (child_model, build_plan(child_model, field.child))
+            continue
+
+        if isinstance(field, serializers.ModelSerializer):
+            relation = _get_field(model, source_attrs[0])
+            if relation is None or len(source_attrs) != 1 or not relation.is_relation:
+                continue
+            path = f"{prefix}{source_attrs[0]}"
+            plan.select.add(path)
+            if relation.concrete:
+                plan.only.add(path)
+                build_plan(relation.related_model, field, prefix=f"{path}__", plan=plan)
+            continue
+
+        _plan_source(plan, model, source_attrs, prefix)
+
+    return plan
+
+
+def plan_queryset(queryset, serializer_class):
+    """Return ``queryset`` with loading tuned for ``serializer_class``."""
+    key = (queryset.model, serializer_class)
+    plan = _plans.get(key)
+    if plan is None:
+        plan = _plans[key] = build_plan(queryset.model, serializer_class())
+    return plan.apply(queryset)
+
+
+class QueryPlanMixin:
+    """
+    ViewSet mixin: plan the queryset from the serializer on read actions.
+
+    ``query_budget`` is the number of queries a list request may take; it is
+    checked by ``cms.testing.QueryBudgetMixin`` and must not depend on the
+    number of rows returned.
+    """
+    planned_actions = ('list', 'retrieve')
+    query_budget = None
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.action in self.planned_actions:
+            queryset = plan_queryset(queryset, self.get_serializer_class())
+        return queryset
@@ -0,0 +1,159 @@
+"""
+Sliding-window rate limits for the unauthenticated auth endpoints.
+
+Each view names a scope; ``RATELIMIT_RULES[scope]`` lists ``(key, limit,
+window)`` rules, where ``key`` is ``'ip'`` or ``'email'`` (from the request
+body). A rule keeps one counter per fixed window and estimates the sliding
+window from the current and previous ones:
+
+    count = previous * (1 - elapsed / window) + current
+
+A request over any rule is rejected before it is counted and before the
+serializer runs, with a 429 and ``Retry-After``. Counters live in the store
+named by ``RATELIMIT_STORE``:
+
+``LocalStore``
+    A dict in this process; exact and free, but per worker.
+``CacheStore``
+    The Django cache (``add`` + ``incr``), shared by every worker that uses
+    the same cache backend.
+
+DRF views use ``SlidingWindowThrottle`` with a ``ratelimit_scope``
+attribute; ``cms.asyncapi.AsyncAPIView`` checks the same attribute itself.
+"""
+import hashlib
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+from rest_framework.throttling import BaseThrottle
+
+
+class LocalStore:
+    blocking = False
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            entries = {key: self._counts.get(key) for key in keys}
+        return {key: entry[1] for key, entry in entries.items() if entry and entry[0] > now}
+
+    def incr(self, key, timeout):
+        now = time.monotonic()
+        with self._lock:
+            expires, count = self._counts.get(key, (0, 0))
+            if expires <= now:
+                expires, count = now + timeout, 0
+            self._counts[key] = (expires, count + 1)
+            if len(self._counts) > 100000:
+                self._counts = {k: v for k, v in self._counts.items() if v[0] > now}
+
+    def clear(self):
+        with self._lock:
+            self._counts.clear()
+
+
+class CacheStore:
+    blocking = True
+
+    def get_many(self, keys):
+        return cache.get_many(keys)
+
+    def incr(self, key, timeout):
+        cache.add(key, 0, timeout)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, 1, timeout)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store():
+    path = settings.RATELIMIT_STORE
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = import_string(path)()
+        return _stores[path]
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def identities(request, data):
+    email = data.get('email') if hasattr(data, 'get') else None
+    return {
+        'ip': client_ip(request),
+        'email': email.strip().lower() if isinstance(email, str) and email.strip() else None,
+    }
+
+
+def check(scope, request, data):
+    """
+    Count one request against ``scope``; returns ``None`` when it is allowed,
+    or the seconds to wait when it is not (and then it is not counted).
+    """
+    rules = settings.RATELIMIT_RULES.get(scope) if settings.RATELIMIT_ENABLED else None
+    if not rules:
+        return None
+
+    store, now = get_store(), time.time()
+    values = identities(request, data)
+    windows = []
+    for key, limit, window in rules:
+        if values.get(key) is None:
+            continue
+        digest = hashlib.sha256(values[key].encode()).hexdigest()[:32]
+        base = f'ratelimit:{scope}:{key}:{window}:{digest}'
+        bucket = int(now // window)
+        windows.append((f'{base}:{bucket}', f'{base}:{bucket - 1}', limit, window))
+
+    counts = store.get_many([key for current, previous, _, _ in windows for key in (current, previous)])
+    wait = 0
+    for current, previous, limit, window in windows:
+        elapsed = now % window
+        cur, prev = counts.get(current, 0), counts.get(previous, 0)
+        if prev * (1 - elapsed / window) + cur < limit:
+            continue
+        if cur >= limit or not prev:
+            # Only the next window can help
+            needed = window - elapsed
+        else:
+            # When the previous window's weight has decayed enough
+            needed = window * (1 - (limit - cur) / prev) - elapsed
+        wait = max(wait, needed, 1)
+    if wait:
+        return math.ceil(wait)
+
+    for current, _, _, window in windows:
+        store.incr(current, 2 * window)
+    return None
+
+
+async def acheck(scope, request, data):
+    if get_store().blocking:
+        return await sync_to_async(check, thread_sensitive=False)(scope, request, data)
+    return check(scope, request, data)
+
+
+class SlidingWindowThrottle(BaseThrottle):
+    """DRF throttle for views with a ``ratelimit_scope``."""
+
+    def allow_request(self, request, view):
+        self.retry_after = check(view.ratelimit_scope, request, request.data)
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,138 @@
+"""
+Read replicas.
+
+``DATABASE_REPLICAS`` lists aliases in ``DATABASES`` holding copies of
+``default``. ``ReplicaRoutingMiddleware`` marks each GET/HEAD request as
+replica-safe; while it runs, ``ReplicaRouter`` sends its reads to one
+replica, picked round-robin when the request first reads and kept for the
+rest of the request.
+
+Everything else reads from ``default``:
+
+* requests that are not GET/HEAD, and ``/admin/``;
+* the rest of a request once it has written anything (read-your-writes),
+  and reads inside a transaction on ``default``;
+* code outside a request (management commands, tasks);
+* reads inside ``primary()``: those whose results outlive the request, like
+  cache fills, so replica lag is not stored for a whole cache lifetime.
+
+A replica that cannot be connected to is skipped for
+``REPLICA_RETRY_AFTER`` seconds; with none available, reads go to
+``default``.
+"""
+import contextlib
+import contextvars
+import itertools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class RoutingState:
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.pinned = False
+        self.replica = None
+
+
+# Holds a mutable state, so a write made in a sync_to_async thread pins the
+# request that spawned it as well
+_state = contextvars.ContextVar('cms_db_routing', default=None)
+
+
+def begin(use_replicas):
+    return _state.set(RoutingState(use_replicas))
+
+
+def end(token):
+    _state.reset(token)
+
+
+@contextlib.contextmanager
+def primary():
+    """Send the reads of the enclosed block to ``default``."""
+    state = _state.get()
+    if state is None:
+        yield
+        return
+    use_replicas, state.use_replicas = state.use_replicas, False
+    try:
+        yield
+    finally:
+        state.use_replicas = use_replicas
+
+
+class ReplicaPool:
+    def __init__(self):
+        self._counter = itertools.count()
+        self._down = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        replicas = settings.DATABASE_REPLICAS
+        for _ in range(len(replicas)):
+            alias = replicas[next(self._counter) % len(replicas)]
+            if self._down.get(alias, 0) > time.monotonic():
+                continue
+            try:
+                connections[alias].ensure_connection()
+            except DatabaseError:
+                logger.warning("Replica %r is unavailable, reading from the others", alias, exc_info=True)
+                self.mark_down(alias)
+                continue
+            return alias
+        return None
+
+    def mark_down(self, alias):
+        with self._lock:
+            self._down[alias] = time.monotonic() + settings.REPLICA_RETRY_AFTER
+
+    def reset(self):
+        with self._lock:
+            self._down.clear()
+
+    def stats(self):
+        now = time.monotonic()
+        return {alias: 'down' if self._down.get(alias, 0) > now else 'up' for alias in settings.DATABASE_REPLICAS}
+
+
+pool = ReplicaPool()
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replicas or state.pinned or not settings.DATABASE_REPLICAS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if state.replica is None:
+            state.replica = pool.choose() or DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+def stats():
+    return pool.stats()
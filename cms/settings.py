@@ -4,6 +4,7 @@ Django settings for cms project.
 Generated by 'django-admin startproject' using Django 5.2.7.
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -36,6 +37,7 @@ INSTALLED_APPS = [
     'corsheaders',
 
     # Apps
+    'cms.apps.CmsConfig',
     'user_management.apps.UserManagementConfig',
     'post.apps.PostConfig',
     'fileGallery.apps.FileGalleryConfig',
@@ -43,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'cms.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Added CORS middleware
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'cms.middleware.MaintenanceModeMiddleware',  # Custom maintenance mode middleware
+    'cms.middleware.RegistrationCheckMiddleware',
 ]
 
 ROOT_URLCONF = 'cms.urls'
@@ -78,24 +82,86 @@ AUTH_USER_MODEL = "user_management.UserModel"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',           # readers and the writer don't block each other
+    'synchronous': 'NORMAL',         # fsync at checkpoints only; durable with WAL
+    'mmap_size': 256 * 1024 * 1024,  # bytes read through the page cache of the OS
+    'cache_size': -64 * 1024,        # negative: KiB per connection
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse a worker's connection across requests, checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock at BEGIN: a transaction that reads and then
+            # writes cannot be upgraded while another connection is writing,
+            # and SQLite fails that upgrade at once instead of waiting
+            'transaction_mode': 'IMMEDIATE',
+            # busy_timeout: seconds a writer waits for the lock
+            'timeout': 20,
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+    }
+}
+
+# Aliases in DATABASES holding read-only copies of 'default'; GET/HEAD
+# requests read from them (cms.routers). For example, a local SQLite copy
+# kept fresh with `manage.py sync_sqlite_replicas`:
+#   DATABASES['replica1'] = {
+#       'ENGINE': 'django.db.backends.sqlite3',
+#       'NAME': f"file:{BASE_DIR / 'db.replica1.sqlite3'}?mode=ro",
+#       'TEST': {'MIRROR': 'default'},
+#   }
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = ['cms.routers.ReplicaRouter']
+# Seconds an unreachable replica is left out
+REPLICA_RETRY_AFTER = 30
+
+# Queue short write transactions (cms.db.write_transaction) on a lock in
+# this process, so threads wait in Python rather than in SQLite's busy loop
+SQLITE_WRITE_QUEUE = False
+
+
+# Cache
+# Local memory is per process; point this at a shared backend (Redis,
+# Memcached) when running several workers so invalidation reaches all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'cms',
     }
 }
 
+# Anonymous post list/detail response cache (post.caching)
+POST_CACHE_TIMEOUT = 300
+POST_CACHE_LOCK_TIMEOUT = 5
+
+# Most posts one /api/posts/bulk/ call may change (post.bulk)
+POST_BULK_LIMIT = 5000
+
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user_management.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
-    )
+    ),
+    # Listings use keyset pagination (cms.pagination), set per viewset
+    'PAGE_SIZE': 20,
 }
 
+SILENCED_SYSTEM_CHECKS = [
+    'rest_framework.W001',  # PAGE_SIZE without a global DEFAULT_PAGINATION_CLASS is intended
+]
+
 
 # Simple JWT Configuration
 SIMPLE_JWT = {
@@ -167,6 +233,28 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# How cms.media.serve sends file bodies: None streams them from Django
+# (os.sendfile under gunicorn); 'x-sendfile' (Apache, lighttpd) or
+# 'x-accel-redirect' (nginx) hands the transfer to the front server. For
+# nginx, MEDIA_ACCEL_REDIRECT_PREFIX must be an `internal` location aliased
+# to MEDIA_ROOT.
+MEDIA_SENDFILE_BACKEND = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Threads rendering image derivatives after upload (cms.images); 0 renders
+# inline when the upload commits
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Resumable file gallery uploads (fileGallery.uploads)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+UPLOAD_MAX_SIZE = 5 * 1024 * 1024 * 1024
+
+# Hash multipart uploads as they stream in, for content-addressed storage
+FILE_UPLOAD_HANDLERS = [
+    'fileGallery.uploadhandlers.HashingMemoryFileUploadHandler',
+    'fileGallery.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
 
 # Mailtrap SMTP Configuration
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -177,6 +265,44 @@ EMAIL_PORT = '2525'
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = 'no-reply@cms.com'
 
+# Email outbox drained by `manage.py send_outbox` (user_management.outbox)
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_BACKOFF = 30  # seconds before the first retry, doubled each time
+EMAIL_OUTBOX_MAX_BACKOFF = 3600
+EMAIL_OUTBOX_LEASE = 300  # seconds a claimed batch stays reserved for its sender
+
+# One-time codes (user_management.otp); expired rows are removed by `manage.py purge_otps`
+OTP_STORE = 'user_management.otp.DatabaseOtpStore'
+OTP_TTL = 600  # seconds a code stays valid
+OTP_MAX_ATTEMPTS = 5  # wrong codes allowed per email and purpose before the live code is locked
+
+# User lookups cached by CachedJWTAuthentication (user_management.authentication)
+AUTH_USER_CACHE_TTL = 60  # seconds in the shared cache
+AUTH_USER_LOCAL_TTL = 5  # seconds in each process; bounds staleness across processes
+# Embed UserModel.CLAIM_FIELDS in tokens, so views using ClaimsJWTAuthentication
+# authorize safe requests from the token instead of the user row
+AUTH_TOKEN_CLAIMS = False
+
+# Password hashing pool used by the async auth views (cms.hashing)
+PASSWORD_HASH_WORKERS = min(4, os.cpu_count() or 1)
+PASSWORD_HASH_QUEUE = 64  # hashes allowed to wait for a worker before answering 503
+# Sliding-window limits on the auth endpoints (cms.ratelimit).
+# LocalStore counts per process; use CacheStore with a shared cache for several workers.
+RATELIMIT_ENABLED = True
+RATELIMIT_STORE = 'cms.ratelimit.LocalStore'
+RATELIMIT_RULES = {
+    # scope: [(key, limit, window in seconds), ...]; key is 'ip' or 'email'
+    'login': [('ip', 30, 60), ('email', 10, 300)],
+    'register': [('ip', 10, 3600)],
+    'otp': [('ip', 30, 60), ('email', 10, 600)],
+    'password-reset-request': [('ip', 10, 600), ('email', 3, 600)],
+    'password-reset': [('ip', 30, 60), ('email', 10, 600)],
+}
 
-MAINTAINANCE = False
-ALLOW_REGISTRATION = False
\ No newline at end of file
+# Defaults for the runtime flags (cms.flags); `manage.py set_flag` overrides them
+# for every worker through FLAGS_FILE, re-read at most every FLAGS_TTL seconds
+MAINTENANCE = False
+ALLOW_REGISTRATION = True
+FLAGS_FILE = BASE_DIR / 'runtime-flags.json'
+FLAGS_TTL = 2
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Shared test helpers.
+"""
+import tempfile
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+class TempMediaRootMixin:
+    """Point ``MEDIA_ROOT`` at a fresh temporary directory for each test."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class QueryBudgetMixin:
+    """
+    Assert that a list endpoint runs a fixed number of queries.
+
+    ``grow(n)`` must bring the endpoint up to ``n`` visible rows. The endpoint
+    is requested at each size in ``sizes``; the query count has to be the same
+    every time and stay within the viewset's ``query_budget``.
+    """
+
+    def assertQueryBudget(self, url, viewset, grow, sizes=(3, 12), params=None):
+        counts = []
+        for size in sizes:
+            grow(size)
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, params or {})
+            self.assertEqual(response.status_code, 200, response.content)
+            counts.append(len(ctx.captured_queries))
+
+        queries = "\n".join(q["sql"] for q in ctx.captured_queries)
+        self.assertEqual(
+            len(set(counts)), 1,
+            f"{url} query count grows with rows {dict(zip(sizes, counts))}:\n{queries}"
+        )
+        self.assertLessEqual(
+            counts[-1], viewset.query_budget,
+            f"{url} ran {counts[-1]} queries, budget is {viewset.query_budget}:\n{queries}"
+        )
+
+
+def explain_query_plan(queryset):
+    """Return the detail column of SQLite's ``EXPLAIN QUERY PLAN`` for ``queryset``."""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanAssertionsMixin:
+    """
+    Assert that a queryset is served from an index.
+
+    A plan fails if any step scans a table without an index or sorts the
+    result in a temporary B-tree instead of reading it in index order.
+    """
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = explain_query_plan(queryset)
+        detail = "\n".join(plan)
+
+        for step in plan:
+            if step.startswith("SCAN ") and " INDEX " not in step:
+                self.fail(f"Table scan in query plan:\n{detail}")
+            if "TEMP B-TREE" in step:
+                self.fail(f"Sort without index in query plan:\n{detail}")
+
+        if index_name is not None:
+            self.assertIn(index_name, detail, f"{index_name} not used:\n{detail}")
@@ -0,0 +1,333 @@
+import copy
+import os
+import re
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+
+from cms import db, flags, ratelimit, routers
+from cms.middleware import ReplicaRoutingMiddleware
+from cms.testing import TempMediaRootMixin
+from post.models import Category, Post
+from user_management import authentication
+from user_management.models import UserModel
+
+
+class MediaServeTests(TempMediaRootMixin, TestCase):
+    uuid_name = 'author/posts/3f2b8c1e-5d4a-4e6b-9c7d-1a2b3c4d5e6f.mp4'
+
+    def setUp(self):
+        super().setUp()
+        self.data = bytes(range(256)) * 4
+        for name in (self.uuid_name, 'file_gallery/report.pdf', '.upload-staging/secret.part'):
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(self.data)
+
+    def get(self, name, **headers):
+        return self.client.get(f'/media/{name}', **headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_full_file_and_cache_headers(self):
+        response = self.get(self.uuid_name)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        self.assertEqual(self.get('file_gallery/report.pdf')['Cache-Control'], 'no-cache')
+
+    def test_ranges(self):
+        response = self.get(self.uuid_name, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.body(response), self.data[10:20])
+
+        response = self.get(self.uuid_name, HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.body(response), self.data[-5:])
+        response = self.get(self.uuid_name, HTTP_RANGE='bytes=1000-')
+        self.assertEqual(self.body(response), self.data[1000:])
+
+        response = self.get(self.uuid_name, HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+
+        # Several ranges at once are answered with the whole file
+        self.assertEqual(self.get(self.uuid_name, HTTP_RANGE='bytes=0-1,5-6').status_code, 200)
+
+    def test_if_range_and_validators(self):
+        etag = self.get(self.uuid_name)['ETag']
+        response = self.get(self.uuid_name, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.get(self.uuid_name, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.get(self.uuid_name, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_hidden_and_outside_paths(self):
+        self.assertEqual(self.get('.upload-staging/secret.part').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get('file_gallery').status_code, 404)
+        self.assertEqual(self.client.post(f'/media/{self.uuid_name}').status_code, 405)
+
+    @override_settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect')
+    def test_accel_redirect(self):
+        response = self.get(self.uuid_name, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.uuid_name}')
+        self.assertEqual(response.content, b'')
+
+        default_storage.save('file_gallery/Q3 report #2 é.pdf', ContentFile(self.data))
+        response = self.get(quote('file_gallery/Q3 report #2 é.pdf'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/file_gallery/Q3%20report%20%232%20%C3%A9.pdf')
+
+
+@override_settings(RATELIMIT_RULES={'test': [('ip', 2, 60)]})
+class SlidingWindowTests(TestCase):
+    def setUp(self):
+        ratelimit.get_store().clear()
+        self.request = RequestFactory().post('/')
+
+    def check(self, at):
+        with mock.patch('cms.ratelimit.time.time', return_value=at):
+            return ratelimit.check('test', self.request, {})
+
+    def test_previous_window_decays(self):
+        self.assertIsNone(self.check(100))
+        self.assertIsNone(self.check(100))
+        self.assertEqual(self.check(100), 20, "full until the next window")
+
+        # 5s into the next window the previous one still weighs 2 * 55/60
+        self.assertIsNone(self.check(125))
+        self.assertEqual(self.check(125), 25)
+        self.assertIsNotNone(self.check(150))
+        self.assertIsNone(self.check(151))
+
+    def test_keys_are_separate(self):
+        other = RequestFactory().post('/', REMOTE_ADDR='10.0.0.2')
+        self.check(100)
+        self.check(100)
+        self.assertIsNotNone(self.check(100))
+        with mock.patch('cms.ratelimit.time.time', return_value=100):
+            self.assertIsNone(ratelimit.check('test', other, {}))
+            self.assertIsNone(ratelimit.check('unlimited', self.request, {}))
+
+    @override_settings(RATELIMIT_STORE='cms.ratelimit.CacheStore')
+    def test_cache_store(self):
+        cache.clear()
+        self.assertIsNone(self.check(100))
+        self.assertIsNone(self.check(100))
+        self.assertEqual(self.check(100), 20)
+
+
+class RuntimeFlagTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.flag_settings = override_settings(FLAGS_FILE=os.path.join(directory.name, 'flags.json'), FLAGS_TTL=0)
+        self.flag_settings.enable()
+        self.addCleanup(self.flag_settings.disable)
+
+    def test_maintenance_toggle(self):
+        self.assertEqual(self.client.get('/health-check/').status_code, 200)
+
+        call_command('set_flag', 'MAINTENANCE', 'on', stdout=StringIO())
+        self.assertEqual(self.client.get('/health-check/').status_code, 503)
+        self.assertEqual(self.client.get('/api/posts/').status_code, 503)
+
+        call_command('set_flag', 'MAINTENANCE', 'default', stdout=StringIO())
+        self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+    def test_reload_is_bounded_by_ttl(self):
+        with override_settings(FLAGS_TTL=60):
+            self.assertFalse(flags.get('MAINTENANCE'))
+            flags.get_store()._checked = 0  # as if checked long ago
+            with open(flags.get_store().path, 'w') as file:
+                file.write('{"MAINTENANCE": true}')
+            with mock.patch('cms.flags.time.monotonic', return_value=30):
+                self.assertFalse(flags.get('MAINTENANCE'), "cached until the TTL runs out")
+            with mock.patch('cms.flags.time.monotonic', return_value=61):
+                self.assertTrue(flags.get('MAINTENANCE'))
+
+    def test_registration_gate(self):
+        payload = {'email': 'new@example.com', 'password': 'x', 'confirm_password': 'x'}
+        # Open by default, as before the gate was installed
+        self.assertEqual(self.client.post('/api/users/register/', payload).status_code, 400)
+
+        flags.set('ALLOW_REGISTRATION', False)
+        response = self.client.post('/api/users/register/', payload)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json()['key'], 'REGISTRATION_DISABLED')
+
+    def test_flags_file_is_readable_by_other_users(self):
+        flags.set('MAINTENANCE', False)
+        self.assertEqual(os.stat(flags.get_store().path).st_mode & 0o777, 0o644)
+
+        os.chmod(flags.get_store().path, 0o640)
+        flags.set('MAINTENANCE', True)
+        self.assertEqual(os.stat(flags.get_store().path).st_mode & 0o777, 0o640, "keeps the existing mode")
+
+    async def test_async_stack(self):
+        flags.set('MAINTENANCE', True)
+        response = await self.async_client.get('/api/posts/')
+        self.assertEqual(response.status_code, 503)
+
+
+class SqliteProfileTests(TransactionTestCase):
+    def test_pragmas_on_new_connections(self):
+        with connection.cursor() as cursor:
+            values = {}
+            for pragma in ('synchronous', 'cache_size', 'temp_store'):
+                cursor.execute(f'PRAGMA {pragma}')
+                values[pragma] = cursor.fetchone()[0]
+        self.assertEqual(values, {'synchronous': 1, 'cache_size': -64 * 1024, 'temp_store': 2})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+    @override_settings(SQLITE_WRITE_QUEUE=True)
+    def test_write_queue_serializes_outermost_transactions(self):
+        queue = db.get_queue()
+        with db.write_transaction():
+            self.assertTrue(queue._lock.locked())
+            # Nested: already holds the write lock, must not queue again
+            with db.write_transaction():
+                pass
+            other = threading.Thread(target=lambda: self.assertFalse(queue._lock.acquire(timeout=0.05)))
+            other.start()
+            other.join()
+        self.assertFalse(queue._lock.locked())
+
+    def test_write_queue_is_optional(self):
+        with db.write_transaction():
+            self.assertFalse(db.get_queue()._lock.locked())
+
+    def test_stress_command_has_no_lock_errors_with_profile(self):
+        out = StringIO()
+        # The command connects to a scratch database of its own
+        with mock.patch.object(type(self), 'databases', self.databases | {'sqlite-stress'}):
+            call_command(
+                'stress_sqlite_writes', threads=4, transactions=25,
+                profile=['production', 'production+queue'], stdout=out,
+            )
+        results = dict(re.findall(r'^(\S+)\s+\d+ committed\s+(\d+) lock errors', out.getvalue(), re.M))
+        self.assertEqual(results, {'production': '0', 'production+queue': '0'})
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    replicas = ['replica1', 'replica2']
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        for alias in self.replicas:
+            config = copy.deepcopy(connections['default'].settings_dict)
+            config.update(NAME=f'file:{directory.name}/{alias}.sqlite3?mode=ro', OPTIONS={}, CONN_MAX_AGE=0)
+            connections.settings[alias] = config
+            self.addCleanup(connections.settings.pop, alias)
+            self.addCleanup(connections.__delitem__, alias)
+            self.addCleanup(lambda alias=alias: connections[alias].close())
+
+        settings_override = override_settings(DATABASE_REPLICAS=self.replicas)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Replica connections are allowed while the test runs, but not flushed after it
+        databases = mock.patch.object(type(self), 'databases', self.databases | set(self.replicas))
+        databases.start()
+        self.addCleanup(databases.stop)
+        routers.pool.reset()
+        self.addCleanup(routers.pool.reset)
+
+        Category.objects.create(name='Before')
+        self.factory = RequestFactory()
+
+    def sync_replicas(self, *aliases):
+        call_command('sync_sqlite_replicas', *aliases, stdout=StringIO())
+        Category.objects.create(name='After')
+
+    def request(self, view, method='get'):
+        return ReplicaRoutingMiddleware(view)(getattr(self.factory, method)('/api/categories/'))
+
+    def names(self, request=None):
+        return sorted(Category.objects.values_list('name', flat=True))
+
+    def test_safe_requests_read_from_a_replica(self):
+        self.sync_replicas()
+        self.assertEqual(self.request(self.names), ['Before'])
+        self.assertEqual(self.request(self.names, 'post'), ['After', 'Before'])
+        self.assertEqual(self.names(), ['After', 'Before'])
+
+    def test_write_pins_the_rest_of_the_request(self):
+        self.sync_replicas()
+
+        def view(request):
+            before = self.names()
+            Category.objects.create(name='During')
+            return before, self.names()
+
+        before, after = self.request(view)
+        self.assertEqual(before, ['Before'])
+        self.assertEqual(after, ['After', 'Before', 'During'])
+
+    def test_round_robin_and_sticky_within_a_request(self):
+        self.sync_replicas()
+
+        def view(request):
+            return Category.objects.all().db, Category.objects.all().db
+
+        first, second = self.request(view), self.request(view)
+        self.assertEqual(first[0], first[1])
+        self.assertEqual({first[0], second[0]}, set(self.replicas))
+
+    def test_unavailable_replica_is_skipped(self):
+        self.sync_replicas('replica1')
+
+        def view(request):
+            return Category.objects.all().db
+
+        with self.assertLogs('cms.routers', 'WARNING'):
+            aliases = {self.request(view) for _ in range(4)}
+        self.assertEqual(aliases, {'replica1'})
+        self.assertEqual(routers.stats(), {'replica1': 'up', 'replica2': 'down'})
+
+        routers.pool.mark_down('replica1')
+        self.assertEqual(self.request(view), 'default')
+
+    def test_cache_fills_read_from_the_primary(self):
+        cache.clear()
+        author = UserModel.objects.create_user(email='author@example.com')
+        post = Post.objects.create(author=author, title='Old', body='<p>x</p>', thumbnail='demo/thumb.jpg', is_published=True)
+        self.sync_replicas()
+        # The replicas now lag behind both changes
+        post.title = 'New'
+        post.save()
+        late = UserModel.objects.create_user(email='late@example.com')
+
+        for _ in range(2):
+            self.assertEqual(self.client.get(f'/api/posts/{post.slug}/').json()['title'], 'New')
+        self.assertIsNotNone(self.request(lambda request: authentication.load_values(late.pk)))
+
+    async def test_async_requests(self):
+        await sync_to_async(self.sync_replicas)()
+
+        async def view(request):
+            return await sync_to_async(self.names)()
+
+        self.assertEqual(await self.request(view), ['Before'])
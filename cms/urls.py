@@ -14,16 +14,18 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from django.http import JsonResponse
 
+from cms import db, flags, hashing, media, routers
+
 
 def health_check(request):
-    if getattr(settings, "MAINTENANCE", False):
+    if flags.get('MAINTENANCE'):
         return JsonResponse(
             {'detail': 'The site is under maintenance. Please try again later.', "key": "MAINTENANCE_MODE","CODE":"MAT503"},
             status=503
@@ -32,7 +34,10 @@ def health_check(request):
     return JsonResponse(
         {
             "status": "healthy",
-            "maintenance": False
+            "maintenance": False,
+            "password_hashing": hashing.stats(),
+            "database": db.stats(),
+            "replicas": routers.stats(),
         },
         status=200
     )
@@ -42,8 +47,6 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/',include('cms.apis')),
     path('health-check/', health_check),
+    re_path(rf'^{re.escape(settings.MEDIA_URL.lstrip("/"))}(?P<path>.*)$', media.serve),
 
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
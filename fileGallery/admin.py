@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import FileGallery
+from .models import Blob, FileGallery, UploadSession
 # Register your models here.
 
-admin.site.register(FileGallery)
\ No newline at end of file
+admin.site.register(FileGallery)
+admin.site.register(UploadSession)
+admin.site.register(Blob)
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete
 
 
 class FileGalleryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fileGallery'
+
+    def ready(self):
+        from .blobs import file_gallery_deleted
+        from .models import FileGallery
+        post_delete.connect(file_gallery_deleted, sender=FileGallery)
@@ -0,0 +1,132 @@
+"""
+Content-addressed, reference-counted storage for gallery files.
+
+Every distinct file content is stored once, as a ``Blob`` keyed by its
+SHA-256, under ``file_gallery/blobs/<aa>/<sha256><ext>``. ``FileGallery``
+rows point at a blob and share its file; uploading bytes that are already
+stored only adds a reference. A blob's row and file are removed when its
+last reference goes.
+
+Digests are computed while the upload streams (``uploadhandlers`` for
+multipart uploads, ``uploads`` for chunked sessions); files arriving any
+other way are hashed here.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from .models import Blob
+
+
+BLOB_DIR = 'file_gallery/blobs'
+READ_SIZE = 1024 * 1024
+
+
+def blob_name(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(BLOB_DIR, digest[:2], f'{digest}{extension}')
+
+
+def hash_file(file):
+    hasher = hashlib.sha256()
+    for chunk in file.chunks(READ_SIZE):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def hash_path(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while data := file.read(READ_SIZE):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _add_reference(digest, count=1):
+    """Reference an existing blob; None if there is none (or it was just freed)."""
+    blob = Blob.objects.filter(sha256=digest).first()
+    if blob is None:
+        return None
+    if not Blob.objects.filter(pk=blob.pk, ref_count__gt=0).update(ref_count=F('ref_count') + count):
+        return None
+    blob.ref_count += count
+    return blob
+
+
+def _acquire(digest, size, filename, write, count=1):
+    """
+    Return the blob for ``digest`` with ``count`` more references, calling
+    ``write(name)`` to store the bytes only if no blob holds them yet.
+    ``write`` returns the name the bytes were stored under.
+    """
+    while True:
+        with transaction.atomic():
+            blob = _add_reference(digest, count)
+            if blob is not None:
+                return blob, False
+
+            Blob.objects.filter(sha256=digest, ref_count=0).delete()
+            try:
+                with transaction.atomic():
+                    blob = Blob.objects.create(sha256=digest, size=size, ref_count=count)
+            except IntegrityError:
+                # Created concurrently: reference that one instead
+                continue
+            blob.file = write(blob_name(digest, filename))
+            blob.save(update_fields=['file'])
+            return blob, True
+
+
+def acquire_upload(file):
+    """Blob for an uploaded (not yet stored) file, writing it only if new."""
+    digest = getattr(file, 'sha256', None) or hash_file(file)
+    blob, _ = _acquire(digest, file.size, file.name, lambda name: default_storage.save(name, file))
+    return blob
+
+
+def acquire_path(path, filename, digest=None, size=None, count=1):
+    """
+    Blob for a file already on local disk (a finished upload session, or a
+    file being migrated). The file is moved into place if its content is
+    new, and removed otherwise; either happens only once the transaction
+    commits, so a rollback leaves it where it was.
+    """
+    digest = digest or hash_path(path)
+    size = size if size is not None else os.path.getsize(path)
+
+    def move(name):
+        name = default_storage.get_available_name(name)
+        transaction.on_commit(lambda: _move(path, default_storage.path(name)))
+        return name
+
+    blob, created = _acquire(digest, size, filename, move, count)
+    if not created:
+        transaction.on_commit(lambda: os.remove(path))
+    return blob
+
+
+def _move(path, target):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    os.replace(path, target)
+
+
+def release(blob_id, count=1):
+    """Drop ``count`` references; the last one deletes the row and, after commit, the file."""
+    if blob_id is None:
+        return
+    Blob.objects.filter(pk=blob_id).update(ref_count=Greatest(F('ref_count') - count, 0))
+    blob = Blob.objects.filter(pk=blob_id, ref_count=0).first()
+    if blob is None:
+        return
+    if Blob.objects.filter(pk=blob.pk, ref_count=0).delete()[0]:
+        name = blob.file.name
+        transaction.on_commit(lambda: default_storage.delete(name))
+
+
+def file_gallery_deleted(sender, instance, **kwargs):
+    """``post_delete`` receiver for ``FileGallery``, covering queryset deletes too."""
+    release(instance.blob_id)
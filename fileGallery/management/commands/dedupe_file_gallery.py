@@ -0,0 +1,72 @@
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from cms.db import write_transaction
+from fileGallery import blobs
+from fileGallery.models import Blob, FileGallery
+
+
+class Command(BaseCommand):
+    help = "Move gallery files without a blob into content-addressed storage, removing duplicate copies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Files hashed in parallel.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be reclaimed.")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        # Rows sharing a file path are migrated together
+        rows = defaultdict(list)
+        for pk, name in FileGallery.objects.filter(blob__isnull=True).exclude(file='').values_list('pk', 'file'):
+            rows[name].append(pk)
+        names = sorted(rows)
+
+        def digest(name):
+            path = default_storage.path(name)
+            try:
+                return name, blobs.hash_path(path), os.path.getsize(path)
+            except FileNotFoundError:
+                return name, None, None
+
+        # hashlib releases the GIL on large buffers, so threads hash in parallel
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as pool:
+            hashed = list(pool.map(digest, names))
+
+        missing = [name for name, sha256, _ in hashed if sha256 is None]
+        for name in missing:
+            self.stderr.write(f"Missing file, skipped: {name}")
+
+        seen, reclaimed = set(), 0
+        for name, sha256, size in hashed:
+            if sha256 is None:
+                continue
+            if sha256 in seen or Blob.objects.filter(sha256=sha256).exists():
+                reclaimed += size
+            seen.add(sha256)
+            if options['dry_run']:
+                continue
+
+            # Rows and file move together: the file is only moved or removed
+            # once the rows pointing at its blob are committed
+            with write_transaction():
+                pks = list(
+                    FileGallery.objects.filter(pk__in=rows[name], blob__isnull=True, file=name)
+                    .values_list('pk', flat=True)
+                )
+                if not pks:
+                    continue
+                blob = blobs.acquire_path(default_storage.path(name), name, digest=sha256, size=size, count=len(pks))
+                FileGallery.objects.filter(pk__in=pks).update(blob=blob, file=blob.file.name, size=blob.size)
+
+        elapsed = time.perf_counter() - started
+        verb = "Would reclaim" if options['dry_run'] else "Reclaimed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(names) - len(missing)} file(s), {len(seen)} distinct. "
+            f"{verb} {reclaimed} bytes in {elapsed:.1f}s."
+        ))
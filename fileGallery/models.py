@@ -1,25 +1,96 @@
+from django.conf import settings
 from django.db import models
 import os
+import uuid
+
+from cms.db import write_transaction
+
+
+class Blob(models.Model):
+    """One stored file content, shared by every gallery entry with the same bytes."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Number of FileGallery rows pointing here, maintained by fileGallery.blobs
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 
 class FileGallery(models.Model):
     title = models.CharField(max_length=255)
-    file = models.FileField(upload_to='file_gallery/')
-    size = models.PositiveIntegerField(null=True, blank=True)  # file size in bytes
+    file = models.FileField(upload_to='file_gallery/', max_length=255)
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='files')
+    size = models.PositiveBigIntegerField(null=True, blank=True)  # file size in bytes
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Moves when the file is replaced: the HTTP validators are built on it
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
+        from . import blobs
+
         # Auto title from filename
         if not self.title and self.file:
             self.title = os.path.basename(self.file.name)
 
-        # Store file size automatically
-        if self.file:
-            self.size = self.file.size
+        with write_transaction():
+            previous_blob_id = None
+            if self.file and not self.file._committed:
+                # New upload: store its content once, or reference the copy we have
+                if not self._state.adding:
+                    previous_blob_id = FileGallery.objects.filter(pk=self.pk).values_list('blob_id', flat=True).first()
+                self.blob = blobs.acquire_upload(self.file)
+                self.file = self.blob.file.name
+                self.size = self.blob.size
+
+            # Store file size automatically (finished upload sessions already know it)
+            if self.file and self.size is None:
+                self.size = self.file.size
 
-        super().save(*args, **kwargs)
+            super().save(*args, **kwargs)
+            blobs.release(previous_blob_id)
 
     def __str__(self):
         return self.title
 
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            models.Index(fields=['-uploaded_at', '-id'], name='filegallery_uploaded_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload, received in numbered chunks by ``fileGallery.uploads``.
+
+    Chunks are appended in order to a staging file; ``received_bytes`` is the
+    resume point. Completing the session turns the staging file into a blob
+    (see ``fileGallery.blobs``) and links the resulting ``FileGallery`` row.
+    """
+    ACTIVE = 'active'
+    COMPLETE = 'complete'
+    STATUS_CHOICES = [(ACTIVE, 'Active'), (COMPLETE, 'Complete')]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True)
+    total_size = models.PositiveBigIntegerField()
+    chunk_size = models.PositiveIntegerField()
+    received_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    sha256 = models.CharField(max_length=64, blank=True)
+    file = models.OneToOneField(FileGallery, null=True, blank=True, on_delete=models.SET_NULL, related_name='upload_session')
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def next_chunk(self):
+        return -(-self.received_bytes // self.chunk_size)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
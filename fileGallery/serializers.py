@@ -1,9 +1,11 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import FileGallery
+from .models import FileGallery, UploadSession
 
 class FileGallerySerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
     size_human = serializers.SerializerMethodField()
+    sha256 = serializers.ReadOnlyField(source='blob.sha256')
 
     class Meta:
         model = FileGallery
@@ -14,9 +16,11 @@ class FileGallerySerializer(serializers.ModelSerializer):
             'file_url',
             'size',
             'size_human',
+            'sha256',
             'uploaded_at',
+            'updated_at',
         ]
-        read_only_fields = ['uploaded_at', 'title', 'file_url', 'size_human']
+        read_only_fields = ['uploaded_at', 'updated_at', 'title', 'file_url', 'size_human']
 
     def get_file_url(self, obj):
         """Return fully-qualified URL."""
@@ -36,3 +40,36 @@ class FileGallerySerializer(serializers.ModelSerializer):
                 return f"{size:.1f} {unit}"
             size /= 1024
         return f"{size:.1f} PB"
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    next_chunk = serializers.ReadOnlyField()
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id',
+            'filename',
+            'title',
+            'total_size',
+            'chunk_size',
+            'received_bytes',
+            'next_chunk',
+            'status',
+            'sha256',
+            'file',
+            'created_at',
+        ]
+        read_only_fields = ['id', 'chunk_size', 'received_bytes', 'status', 'sha256', 'file', 'created_at']
+
+    def validate_total_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError("File must not be empty.")
+        if value > settings.UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f"Files are limited to {settings.UPLOAD_MAX_SIZE} bytes.")
+        return value
+
+    def create(self, validated_data):
+        validated_data['owner'] = self.context['request'].user
+        validated_data['chunk_size'] = settings.UPLOAD_CHUNK_SIZE
+        return super().create(validated_data)
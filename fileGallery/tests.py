@@ -1,3 +1,237 @@
-from django.test import TestCase
+import hashlib
+import os
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, IntegrityError
+from django.db.models import QuerySet
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from cms.pagination import FileGalleryCursorPagination
+from cms.testing import QueryPlanAssertionsMixin, TempMediaRootMixin
+from user_management.models import UserModel
+from . import uploads
+from .models import Blob, FileGallery, UploadSession
+
+
+class FileGalleryIndexTests(QueryPlanAssertionsMixin, TestCase):
+    def test_listing(self):
+        queryset = FileGallery.objects.order_by(*FileGalleryCursorPagination.ordering)
+        self.assertUsesIndex(queryset[:21], 'filegallery_uploaded_idx')
+
+
+class FileGalleryConditionalGetTests(TestCase):
+    def test_list_etag(self):
+        # bulk_create skips FileGallery.save, which stats the file on disk
+        FileGallery.objects.bulk_create([FileGallery(title='doc.pdf', file='file_gallery/doc.pdf', size=10)])
+        response = self.client.get('/api/files/file-gallery/')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/files/file-gallery/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(UPLOAD_CHUNK_SIZE=4)
+class UploadSessionTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = UserModel.objects.create_user(email='editor@example.com')
+        self.client.force_authenticate(self.user)
+        self.data = b'0123456789'
+
+        response = self.client.post('/api/files/uploads/', {'filename': 'report.pdf', 'total_size': len(self.data)})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.session = response.data
+        self.url = f"/api/files/uploads/{self.session['id']}/"
+
+    def put_chunk(self, index, data=None, **headers):
+        if data is None:
+            data = self.data[index * 4:(index + 1) * 4]
+        return self.client.put(
+            f'{self.url}chunks/{index}/', data, content_type='application/octet-stream', **headers
+        )
+
+    def test_chunks_then_complete(self):
+        for index in range(3):
+            response = self.put_chunk(index)
+            self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(response.data['received_bytes'], len(self.data))
+
+        digest = hashlib.sha256(self.data).hexdigest()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{self.url}complete/', {'sha256': digest}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        gallery = FileGallery.objects.get(pk=response.data['id'])
+        self.assertEqual((gallery.title, gallery.size), ('report.pdf', len(self.data)))
+        with gallery.file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertEqual(UploadSession.objects.get().sha256, digest)
+
+        # Completing again is answered with the same row
+        self.assertEqual(self.client.post(f'{self.url}complete/').data['id'], gallery.pk)
+
+    def test_complete_after_the_file_was_deleted(self):
+        for index in range(3):
+            self.put_chunk(index)
+        with self.captureOnCommitCallbacks(execute=True):
+            gallery_id = self.client.post(f'{self.url}complete/').data['id']
+            FileGallery.objects.filter(pk=gallery_id).delete()
+        self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 404)
+
+    def test_rolled_back_complete_keeps_the_staging_file(self):
+        for index in range(3):
+            self.put_chunk(index)
+        session = UploadSession.objects.get()
+        path = uploads.staging_path(session)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with mock.patch.object(FileGallery, 'save', side_effect=IntegrityError), self.assertRaises(IntegrityError):
+                uploads.complete(session)
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(UploadSession.objects.get().status, UploadSession.ACTIVE)
+
+        session.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            gallery = uploads.complete(session)
+        self.assertFalse(os.path.exists(path))
+        with gallery.file.open('rb') as file:
+            self.assertEqual(file.read(), self.data)
+
+    def test_out_of_order_and_incomplete(self):
+        self.assertEqual(self.put_chunk(1).status_code, 409)
+        self.put_chunk(0)
+        self.assertEqual(self.client.post(f'{self.url}complete/').status_code, 409)
+        self.assertEqual(self.client.get(self.url).data['next_chunk'], 1)
+        # A chunk re-sent after a lost response is acknowledged, not rewritten
+        self.assertEqual(self.put_chunk(0).status_code, 200)
+        self.assertEqual(self.put_chunk(3, b'x').status_code, 400)
+
+    def test_bad_chunks_are_dropped(self):
+        self.assertEqual(self.put_chunk(0, HTTP_X_CHUNK_SHA256='0' * 64).status_code, 400)
+        self.assertEqual(self.put_chunk(0, b'01').status_code, 400)
+        response = self.put_chunk(0, HTTP_X_CHUNK_SHA256=hashlib.sha256(b'0123').hexdigest())
+        self.assertEqual(response.data['received_bytes'], 4)
+
+    def test_resume_without_running_hash(self):
+        self.put_chunk(0)
+        uploads._hashers.clear()  # as after a restart
+        self.put_chunk(1)
+        self.put_chunk(2)
+        response = self.client.post(f'{self.url}complete/')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(UploadSession.objects.get().sha256, hashlib.sha256(self.data).hexdigest())
+
+    def test_sessions_are_private(self):
+        other = APIClient()
+        other.force_authenticate(UserModel.objects.create_user(email='other@example.com'))
+        self.assertEqual(other.get(self.url).status_code, 404)
+
+    def test_abandon(self):
+        self.put_chunk(0)
+        self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertFalse(os.path.exists(uploads.staging_path(UploadSession(pk=self.session['id']))))
+
+
+class BlobStorageTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_authenticate(UserModel.objects.create_user(email='editor@example.com'))
+
+    def upload(self, content, name='doc.pdf'):
+        response = self.client.post('/api/files/file-gallery/', {'file': SimpleUploadedFile(name, content)})
+        self.assertEqual(response.status_code, 201, response.data)
+        return FileGallery.objects.get(pk=response.data['id'])
+
+    def test_same_content_is_stored_once(self):
+        first = self.upload(b'same bytes', 'a.pdf')
+        second = self.upload(b'same bytes', 'copy.pdf')
+        other = self.upload(b'other bytes')
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual((first.title, second.title), ('a.pdf', 'copy.pdf'))
+        self.assertEqual(first.blob.sha256, hashlib.sha256(b'same bytes').hexdigest())
+        self.assertEqual(Blob.objects.get(pk=first.blob_id).ref_count, 2)
+        self.assertNotEqual(other.blob_id, first.blob_id)
+
+    def test_last_reference_frees_the_blob(self):
+        first = self.upload(b'same bytes')
+        second = self.upload(b'same bytes')
+        path = first.file.path
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertEqual(Blob.objects.get().ref_count, 1)
+        self.assertTrue(os.path.exists(path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FileGallery.objects.filter(pk=second.pk).delete()
+        self.assertFalse(Blob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_replacing_the_file_changes_the_etag(self):
+        entry = self.upload(b'first bytes')
+        url = f'/api/files/file-gallery/{entry.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.patch(url, {'file': SimpleUploadedFile('doc.pdf', b'second bytes')})
+        self.assertEqual(response.status_code, 200, response.data)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sha256'], hashlib.sha256(b'second bytes').hexdigest())
+
+    def test_upload_session_reuses_blob(self):
+        existing = self.upload(b'0123456789')
+        with override_settings(UPLOAD_CHUNK_SIZE=10):
+            session = self.client.post('/api/files/uploads/', {'filename': 'again.pdf', 'total_size': 10}).data
+        url = f"/api/files/uploads/{session['id']}/"
+        self.client.put(f'{url}chunks/0/', b'0123456789', content_type='application/octet-stream')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'{url}complete/')
+
+        self.assertEqual(response.data['sha256'], existing.blob.sha256)
+        self.assertEqual(Blob.objects.get().ref_count, 2)
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, uploads.STAGING_DIR)), [])
+
+    def test_dedupe_command(self):
+        for name in ('file_gallery/a.pdf', 'file_gallery/b.pdf'):
+            default_storage.save(name, ContentFile(b'legacy bytes'))
+        FileGallery.objects.bulk_create([
+            FileGallery(title='a', file='file_gallery/a.pdf', size=12),
+            FileGallery(title='b', file='file_gallery/b.pdf', size=12),
+            FileGallery(title='a again', file='file_gallery/a.pdf', size=12),
+        ])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_file_gallery', workers=2, stdout=StringIO())
+        blob = Blob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual(set(FileGallery.objects.values_list('file', flat=True)), {blob.file.name})
+        self.assertEqual(os.listdir(os.path.join(settings.MEDIA_ROOT, 'file_gallery')), ['blobs'])
+
+    def test_dedupe_command_keeps_files_of_rows_it_failed_to_update(self):
+        default_storage.save('file_gallery/a.pdf', ContentFile(b'legacy bytes'))
+        FileGallery.objects.bulk_create([FileGallery(title='a', file='file_gallery/a.pdf', size=12)])
+
+        update = QuerySet.update
+
+        def failing_update(queryset, **kwargs):
+            if queryset.model is FileGallery:
+                raise DatabaseError
+            return update(queryset, **kwargs)
+
+        with self.captureOnCommitCallbacks(execute=True), mock.patch.object(QuerySet, 'update', failing_update):
+            with self.assertRaises(DatabaseError):
+                call_command('dedupe_file_gallery', stdout=StringIO())
+        self.assertFalse(Blob.objects.exists())
+        self.assertTrue(default_storage.exists('file_gallery/a.pdf'))
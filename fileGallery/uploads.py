@@ -0,0 +1,175 @@
+"""
+Resumable chunked uploads.
+
+Chunk ``n`` of a session covers bytes ``[n * chunk_size, (n + 1) * chunk_size)``
+and is streamed from the request body straight into the session's staging
+file under ``MEDIA_ROOT``, hashing as it goes; nothing is buffered in memory
+or spooled by Django's upload handlers. Chunks are accepted in order only,
+which keeps the staging file contiguous and lets the SHA-256 of the whole
+file be carried forward chunk by chunk. On completion the staging file is
+renamed into blob storage (or dropped, if that content is already stored),
+so the bytes are never read again.
+
+The running whole-file hasher lives in process memory. If it is missing
+(restart, or chunks handled by another worker process) the staging file is
+hashed once at completion instead.
+"""
+import hashlib
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+
+from . import blobs
+from .models import FileGallery, UploadSession
+
+
+STAGING_DIR = '.upload-staging'
+READ_SIZE = 64 * 1024
+
+# session id -> (offset the hash covers, sha256 of bytes [0, offset))
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class ChunkConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Chunk does not follow the received data.'
+    default_code = 'chunk_conflict'
+
+
+def staging_path(session):
+    return os.path.join(settings.MEDIA_ROOT, STAGING_DIR, f'{session.pk}.part')
+
+
+def start(session):
+    """Create the empty staging file of a new session."""
+    path = staging_path(session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    with _hashers_lock:
+        _hashers[session.pk] = (0, hashlib.sha256())
+
+
+def discard(session):
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+    try:
+        os.remove(staging_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def _running_hasher(session, offset):
+    """Copy of the whole-file hasher at ``offset``, or None if it was lost."""
+    with _hashers_lock:
+        entry = _hashers.get(session.pk)
+    if entry is None or entry[0] != offset:
+        return None
+    return entry[1].copy()
+
+
+def write_chunk(session, index, stream, length, checksum=None):
+    """
+    Stream chunk ``index`` (``length`` bytes from ``stream``) into the staging
+    file and advance the session. ``checksum`` is the chunk's hex SHA-256.
+    """
+    if session.status != UploadSession.ACTIVE:
+        raise ChunkConflict('Upload is already complete.')
+
+    offset = index * session.chunk_size
+    expected_length = min(session.chunk_size, session.total_size - offset)
+    if offset >= session.total_size or expected_length <= 0:
+        raise ValidationError({'chunk': f'Upload has {session.next_chunk} chunk(s) at most.'})
+    if offset < session.received_bytes:
+        # Re-sent after a lost response; already stored
+        return session
+    if offset > session.received_bytes:
+        raise ChunkConflict(f'Expected chunk {session.next_chunk}.')
+    if length != expected_length:
+        raise ValidationError({'chunk': f'Chunk {index} must be {expected_length} bytes, got {length}.'})
+
+    chunk_hasher = hashlib.sha256()
+    file_hasher = _running_hasher(session, offset)
+    written = 0
+    with open(staging_path(session), 'r+b') as staging:
+        staging.seek(offset)
+        while written < length:
+            data = stream.read(min(READ_SIZE, length - written))
+            if not data:
+                break
+            staging.write(data)
+            chunk_hasher.update(data)
+            if file_hasher is not None:
+                file_hasher.update(data)
+            written += len(data)
+
+        if written != length or (checksum and checksum.lower() != chunk_hasher.hexdigest()):
+            # Drop the partial or corrupt chunk so the next attempt starts clean
+            staging.truncate(offset)
+            if written != length:
+                raise ValidationError({'chunk': 'Request body ended before the chunk was complete.'})
+            raise ValidationError({'chunk': 'Chunk checksum does not match.'})
+
+        staging.flush()
+        os.fsync(staging.fileno())
+
+    received = offset + length
+    advanced = UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.ACTIVE, received_bytes=offset,
+    ).update(received_bytes=received)
+    if not advanced:
+        raise ChunkConflict('Chunk was received concurrently.')
+
+    if file_hasher is not None:
+        with _hashers_lock:
+            _hashers[session.pk] = (received, file_hasher)
+    session.received_bytes = received
+    return session
+
+
+def complete(session, sha256=None):
+    """
+    Turn a fully received session into a ``FileGallery`` row. ``sha256`` is
+    the client's digest of the whole file, checked when given.
+    """
+    if session.status == UploadSession.COMPLETE:
+        if session.file is None:
+            raise NotFound('The uploaded file has since been deleted.')
+        return session.file
+    if session.received_bytes != session.total_size:
+        raise ChunkConflict(f'Upload is incomplete; expected chunk {session.next_chunk}.')
+
+    path = staging_path(session)
+    hasher = _running_hasher(session, session.total_size)
+    digest = hasher.hexdigest() if hasher is not None else blobs.hash_path(path)
+    if sha256 and sha256.lower() != digest:
+        raise ValidationError({'sha256': 'File checksum does not match the received data.'})
+
+    with transaction.atomic():
+        claimed = UploadSession.objects.filter(pk=session.pk, status=UploadSession.ACTIVE).update(
+            status=UploadSession.COMPLETE, sha256=digest,
+        )
+        if not claimed:
+            raise ChunkConflict('Upload was completed concurrently.')
+
+        # Known content only gains a reference; new content is renamed into
+        # place. Either way the staging file is only touched on commit.
+        blob = blobs.acquire_path(path, session.filename, digest=digest, size=session.total_size)
+        gallery = FileGallery(
+            title=session.title or session.filename,
+            file=blob.file.name,
+            blob=blob,
+            size=blob.size,
+        )
+        gallery.save()
+        UploadSession.objects.filter(pk=session.pk).update(file=gallery)
+
+    with _hashers_lock:
+        _hashers.pop(session.pk, None)
+
+    session.status, session.sha256, session.file = UploadSession.COMPLETE, digest, gallery
+    return gallery
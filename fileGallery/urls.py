@@ -1,9 +1,10 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import FileGalleryViewSet
+from .views import FileGalleryViewSet, UploadSessionViewSet
 
 router = DefaultRouter()
 router.register(r'file-gallery', FileGalleryViewSet, basename='filegallery')
+router.register(r'uploads', UploadSessionViewSet, basename='upload-session')
 
 urlpatterns = router.urls + [
     
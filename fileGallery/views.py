@@ -1,17 +1,25 @@
-from rest_framework.viewsets import ModelViewSet
+from rest_framework import mixins, status
+from rest_framework.decorators import action
+from rest_framework.viewsets import GenericViewSet, ModelViewSet
 from rest_framework.permissions import IsAuthenticatedOrReadOnly ,AllowAny , IsAuthenticated
 from rest_framework.views import APIView
-from .models import FileGallery
-from .serializers import FileGallerySerializer
-from rest_framework.parsers import MultiPartParser, FormParser
+from . import uploads
+from .models import FileGallery, UploadSession
+from .serializers import FileGallerySerializer, UploadSessionSerializer
+from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
+from cms.pagination import FileGalleryCursorPagination
+from cms.conditional import ConditionalGetMixin
+from user_management.authentication import ClaimsJWTAuthentication
 
 
-class FileGalleryViewSet(ModelViewSet):
-    queryset = FileGallery.objects.all().order_by('-uploaded_at')
+class FileGalleryViewSet(ConditionalGetMixin, ModelViewSet):
+    queryset = FileGallery.objects.select_related('blob').order_by('-uploaded_at')
     serializer_class = FileGallerySerializer
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly]
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = FileGalleryCursorPagination
 
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -19,4 +27,49 @@ class FileGalleryViewSet(ModelViewSet):
         return context
 
 
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin, GenericViewSet):
+    """
+    Resumable uploads into the file gallery.
 
+    POST   /uploads/                      {filename, total_size, title?}
+    PUT    /uploads/<id>/chunks/<n>/      raw chunk bytes, optional X-Chunk-SHA256
+    GET    /uploads/<id>/                 resume point (next_chunk)
+    POST   /uploads/<id>/complete/        {sha256?} -> FileGallery row
+    DELETE /uploads/<id>/                 abandon
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(owner=self.request.user)
+
+    def perform_create(self, serializer):
+        uploads.start(serializer.save())
+
+    def perform_destroy(self, instance):
+        if instance.status == UploadSession.ACTIVE:
+            uploads.discard(instance)
+        instance.delete()
+
+    @action(detail=True, methods=['put'], url_path=r'chunks/(?P<index>\d+)')
+    def chunk(self, request, pk=None, index=None):
+        session = self.get_object()
+        # Read the raw body: request.data would make DRF parse and buffer it
+        try:
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        uploads.write_chunk(
+            session, int(index), request.stream, length,
+            checksum=request.headers.get('X-Chunk-SHA256'),
+        )
+        return Response(self.get_serializer(session).data)
+
+    @action(detail=True, methods=['post'], parser_classes=[JSONParser, FormParser])
+    def complete(self, request, pk=None):
+        session = self.get_object()
+        gallery = uploads.complete(session, sha256=request.data.get('sha256'))
+        return Response(
+            FileGallerySerializer(gallery, context=self.get_serializer_context()).data,
+            status=status.HTTP_201_CREATED
+        )
@@ -1,7 +1,8 @@
 from django.contrib import admin
-from .models import Post , Category
+from .models import Post , Category , Tag
 # Register your models here.
 
 
 admin.site.register(Post)
-admin.site.register(Category)
\ No newline at end of file
+admin.site.register(Category)
+admin.site.register(Tag)
\ No newline at end of file
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+
+
+def create_search_table(using, **kwargs):
+    from django.db import connections
+    from .search import create_search_table
+    create_search_table(connections[using])
 
 
 class PostConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'post'
+
+    def ready(self):
+        # FTS5 virtual table is not a model, so migrate can't create it
+        post_migrate.connect(create_search_table, sender=self)
+
+        from cms.images import derivatives_ready
+        from user_management.models import UserModel
+        from .caching import author_changed, post_categories_changed, post_derivatives_ready
+        from .models import Post, post_deleted
+        post_delete.connect(post_deleted, sender=Post)
+        m2m_changed.connect(post_categories_changed, sender=Post.categories.through)
+        derivatives_ready.connect(post_derivatives_ready, sender=Post)
+        post_save.connect(author_changed, sender=UserModel)
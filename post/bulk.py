@@ -0,0 +1,109 @@
+"""
+State changes for many posts at once (``POST /api/posts/bulk/``).
+
+An operation sets the flags the single-post actions set through
+``Post.save``. It is applied to the whole set with a fixed number of queries,
+whatever its size:
+
+* one SELECT loads the targeted rows. It goes through the caller's queryset,
+  so it also checks ownership;
+* one conditional UPDATE writes the rows not already in the target state;
+* one UPDATE each moves the authors' post counters and the tag counts, with
+  ``CASE`` expressions holding the per-row deltas;
+* one SELECT finds the category slugs for cache invalidation.
+
+The body is not touched, so excerpts and the search index stay as they are.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from cms.db import write_transaction
+from user_management.models import UserModel
+from . import caching, tagging
+from .models import Post
+
+
+OPERATIONS = {
+    'publish': {'is_published': True},
+    'draft': {'is_published': False},
+    'delete': {'is_published': False, 'is_deleted': True},
+    'restore': {'is_deleted': False},
+}
+
+UPDATED, UNCHANGED, NOT_FOUND = 'updated', 'unchanged', 'not_found'
+STATE_FIELDS = ('pk', 'slug', 'author_id', 'is_published', 'is_deleted', 'tags')
+
+
+class TooManyPosts(Exception):
+    pass
+
+
+def apply(queryset, operation, limit):
+    """
+    Apply ``operation`` to the posts in ``queryset``.
+
+    Returns ``{slug: UPDATED | UNCHANGED}`` for every post found. Raises
+    ``TooManyPosts`` when more than ``limit`` posts match; nothing is written.
+    """
+    values = OPERATIONS[operation]
+    with write_transaction():
+        rows = list(queryset.order_by('pk').select_for_update().values(*STATE_FIELDS)[:limit + 1])
+        if len(rows) > limit:
+            raise TooManyPosts(f"More than {limit} posts match")
+
+        changed = [row for row in rows if any(row[name] != value for name, value in values.items())]
+        if changed:
+            # Conditional as well: rows already in the target state are not rewritten
+            Post.all_objects.filter(~Q(**values), pk__in=[row['pk'] for row in changed]).update(
+                updated_at=timezone.now(), **values
+            )
+            update_author_counters(changed, values)
+            update_tag_counts(changed, values)
+            invalidate(changed)
+
+    changed_slugs = {row['slug'] for row in changed}
+    return {row['slug']: UPDATED if row['slug'] in changed_slugs else UNCHANGED for row in rows}
+
+
+def update_author_counters(rows, values):
+    deltas = defaultdict(Counter)
+    for row in rows:
+        after = {**row, **values}
+        deltas[Post.counter_field_for(row['is_published'], row['is_deleted'])][row['author_id']] -= 1
+        deltas[Post.counter_field_for(after['is_published'], after['is_deleted'])][row['author_id']] += 1
+
+    changes = {}
+    for field, by_author in deltas.items():
+        whens = [When(pk=author_id, then=Value(delta)) for author_id, delta in by_author.items() if delta]
+        if whens:
+            changes[field] = Greatest(F(field) + Case(*whens, default=Value(0)), 0)
+    if changes:
+        UserModel.objects.filter(pk__in={row['author_id'] for row in rows}).update(**changes)
+
+
+def update_tag_counts(rows, values):
+    deltas = Counter()
+    for row in rows:
+        after = {**row, **values}
+        was_public = row['is_published'] and not row['is_deleted']
+        is_public = after['is_published'] and not after['is_deleted']
+        if was_public != is_public:
+            for slug in tagging.normalize_tags(row['tags']):
+                deltas[slug] += 1 if is_public else -1
+    tagging.adjust_counts_by(deltas)
+
+
+def invalidate(rows):
+    """Like ``caching.on_save``: now, and again after commit."""
+    Link = Post.categories.through
+    slugs = [row['slug'] for row in rows]
+    category_slugs = list(
+        Link.objects.filter(post_id__in=[row['pk'] for row in rows])
+        .values_list('category__slug', flat=True).distinct()
+    )
+    caching.invalidate_posts(slugs, category_slugs)
+    transaction.on_commit(lambda: caching.invalidate_posts(slugs, category_slugs))
@@ -0,0 +1,323 @@
+"""
+Response cache for the anonymous post list and detail.
+
+Keys carry version stamps instead of being deleted on change: every cached
+entry embeds the versions of the scopes it depends on, and a write bumps
+those versions so old entries are simply never read again.
+
+Scopes:
+    ``categories``         category epoch, part of every key (names and
+                           slugs are embedded in every post payload)
+    ``list``               unfiltered-by-category post listings
+    ``category:<slug>``    listings filtered with ``?category=<slug>``
+    ``post:<slug>``        one post's detail
+
+The ``a``-prefixed helpers serve the async read views in ``post.views``.
+"""
+import asyncio
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.utils.text import slugify
+from rest_framework.response import Response
+
+from cms import routers
+from cms.asyncapi import cache_call
+
+
+KEY_PREFIX = 'post-cache'
+
+
+def _version_key(scope):
+    return f'{KEY_PREFIX}:version:{scope}'
+
+
+def get_versions(*scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # A fresh, never-used version: an evicted stamp must not make
+            # entries written under an older stamp readable again.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+async def aget_versions(*scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = await cache_call('get_many', keys)
+    for key in keys:
+        if key not in found:
+            await cache_call('add', key, time.time_ns(), None)
+            found[key] = await cache_call('get', key)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def _count(name):
+    key = f'{KEY_PREFIX}:stats:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+async def _acount(name):
+    key = f'{KEY_PREFIX}:stats:{name}'
+    try:
+        await cache_call('incr', key)
+    except ValueError:
+        if not await cache_call('add', key, 1, None):
+            await cache_call('incr', key)
+
+
+def cache_stats():
+    names = ('hits', 'misses', 'waits')
+    values = cache.get_many([f'{KEY_PREFIX}:stats:{name}' for name in names])
+    return {name: values.get(f'{KEY_PREFIX}:stats:{name}', 0) for name in names}
+
+
+# -------------------------------
+# Invalidation
+# -------------------------------
+def invalidate_post(post, category_slugs=None):
+    """A post changed: its detail, the listings and its categories' listings."""
+    if category_slugs is None:
+        category_slugs = post.categories.values_list('slug', flat=True)
+    invalidate_posts([post.slug], category_slugs)
+
+
+def invalidate_posts(slugs, category_slugs):
+    bump('list', *(f'post:{slug}' for slug in slugs), *(f'category:{slug}' for slug in category_slugs))
+
+
+def invalidate_categories():
+    """A category changed: every entry embeds category data, so bump the epoch."""
+    bump('categories')
+
+
+def on_save(post=None):
+    """
+    Invalidate for a write in progress: once now, and once more after commit
+    so a response cached from the pre-commit row in between is dropped too.
+    """
+    if post is None:
+        invalidate, args = invalidate_categories, ()
+    else:
+        invalidate, args = invalidate_post, (post, list(post.categories.values_list('slug', flat=True)))
+    invalidate(*args)
+    transaction.on_commit(lambda: invalidate(*args))
+
+
+def post_categories_changed(sender, instance, action, pk_set, reverse, **kwargs):
+    """``m2m_changed`` receiver for ``Post.categories``."""
+    from .models import Category, Post
+
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        # category.post_set.add(...): instance is the category
+        posts = Post.all_objects.filter(pk__in=pk_set) if pk_set else instance.post_set.all()
+        for slug in posts.values_list('slug', flat=True):
+            bump(f'post:{slug}')
+        bump('list', f'category:{instance.slug}')
+        return
+
+    if pk_set:
+        slugs = Category.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+    else:
+        slugs = instance.categories.values_list('slug', flat=True)
+    invalidate_post(instance, slugs)
+
+
+def author_changed(sender, instance, created, **kwargs):
+    """``post_save`` receiver for ``UserModel``: post payloads embed the author's username."""
+    from .models import Category, Post
+
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or 'username' not in loaded or loaded['username'] == instance.username:
+        return
+    slugs = list(Post.all_objects.filter(author_id=instance.pk).values_list('slug', flat=True))
+    if not slugs:
+        return
+    category_slugs = list(
+        Category.objects.filter(post__author_id=instance.pk).values_list('slug', flat=True).distinct()
+    )
+    invalidate_posts(slugs, category_slugs)
+    transaction.on_commit(lambda: invalidate_posts(slugs, category_slugs))
+
+
+def post_derivatives_ready(sender, pk, **kwargs):
+    """``cms.images.derivatives_ready`` receiver: the payload gained a srcset."""
+    from .models import Post
+
+    post = Post.all_objects.filter(pk=pk).only('slug').first()
+    if post is not None:
+        invalidate_post(post)
+
+
+# -------------------------------
+# Lookup with single-flight
+# -------------------------------
+def _scopes(request, action, slug=None):
+    scopes = ['categories']
+    if action == 'retrieve':
+        scopes.append(f'post:{slug}')
+    elif request.query_params.get('category'):
+        scopes.append(f"category:{slugify(request.query_params['category'])}")
+    else:
+        scopes.append('list')
+    return scopes
+
+
+def _key(request, action, versions):
+    versions = ':'.join(str(version) for version in versions)
+    digest = hashlib.sha1(request.build_absolute_uri().encode()).hexdigest()
+    return f'{KEY_PREFIX}:{action}:{versions}:{digest}'
+
+
+def scope_versions(request, action, slug=None):
+    """Versions of every scope a list/retrieve response depends on."""
+    return get_versions(*_scopes(request, action, slug))
+
+
+async def ascope_versions(request, action, slug=None):
+    return await aget_versions(*_scopes(request, action, slug))
+
+
+def response_key(request, action, slug=None):
+    return _key(request, action, scope_versions(request, action, slug))
+
+
+async def aresponse_key(request, action, slug=None):
+    return _key(request, action, await ascope_versions(request, action, slug))
+
+
+# Conditional GET validators are cached with the body, so a hit can still
+# answer If-None-Match / If-Modified-Since without touching the database.
+CACHED_HEADERS = ('ETag', 'Last-Modified', 'Vary')
+
+
+def _entry(response):
+    return {
+        'data': response.data,
+        'headers': {name: response[name] for name in CACHED_HEADERS if response.has_header(name)},
+    }
+
+
+def _from_entry(entry, request=None):
+    headers = {**entry['headers'], 'X-Cache': 'HIT'}
+    if request is not None and 'ETag' in headers:
+        last_modified = parse_http_date_safe(headers.get('Last-Modified', ''))
+        not_modified = get_conditional_response(request._request, etag=headers['ETag'], last_modified=last_modified)
+        if not_modified is not None:
+            for name, value in headers.items():
+                not_modified[name] = value
+            return not_modified
+    return Response(entry['data'], headers=headers)
+
+
+def cached_response(key, compute, request=None):
+    """
+    Return the cached response for ``key`` or build it with ``compute()``.
+
+    Only one caller per key computes on a miss; the others poll the cache
+    for a short while before giving up and computing themselves.
+    """
+    entry = cache.get(key)
+    if entry is not None:
+        _count('hits')
+        return _from_entry(entry, request)
+
+    _count('misses')
+    lock = f'{key}:lock'
+    lock_timeout = getattr(settings, 'POST_CACHE_LOCK_TIMEOUT', 5)
+
+    if not cache.add(lock, 1, lock_timeout):
+        _count('waits')
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return _from_entry(entry, request)
+            if cache.get(lock) is None:
+                # The filler finished without caching (e.g. a 404)
+                break
+
+    try:
+        # Cached for everyone: never fill it from a lagging replica
+        with routers.primary():
+            response = compute()
+        if response.status_code == 200:
+            cache.set(key, _entry(response), getattr(settings, 'POST_CACHE_TIMEOUT', 300))
+        response['X-Cache'] = 'MISS'
+        return response
+    finally:
+        cache.delete(lock)
+
+
+async def acached_response(key, compute, request=None):
+    """``cached_response`` for a coroutine function ``compute``."""
+    entry = await cache_call('get', key)
+    if entry is not None:
+        await _acount('hits')
+        return _from_entry(entry, request)
+
+    await _acount('misses')
+    lock = f'{key}:lock'
+    lock_timeout = getattr(settings, 'POST_CACHE_LOCK_TIMEOUT', 5)
+
+    if not await cache_call('add', lock, 1, lock_timeout):
+        await _acount('waits')
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            entry = await cache_call('get', key)
+            if entry is not None:
+                return _from_entry(entry, request)
+            if await cache_call('get', lock) is None:
+                break
+
+    try:
+        # Cached for everyone: never fill it from a lagging replica
+        with routers.primary():
+            response = await compute()
+        if response.status_code == 200:
+            await cache_call('set', key, _entry(response), getattr(settings, 'POST_CACHE_TIMEOUT', 300))
+        response['X-Cache'] = 'MISS'
+        return response
+    finally:
+        await cache_call('delete', lock)
+
+
+class PublicResponseCacheMixin:
+    """Serve anonymous ``list``/``retrieve`` from the versioned cache."""
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        key = response_key(request, 'list')
+        return cached_response(key, lambda: super(PublicResponseCacheMixin, self).list(request, *args, **kwargs), request)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        key = response_key(request, 'retrieve', slug=kwargs.get(self.lookup_url_kwarg or self.lookup_field))
+        return cached_response(key, lambda: super(PublicResponseCacheMixin, self).retrieve(request, *args, **kwargs), request)
@@ -0,0 +1,73 @@
+"""
+HTML body -> plain text, excerpt, word count and reading time.
+
+All four come from one text extraction: comments and non-content elements
+(``<script>``, ``<style>``...) are dropped, block elements become line
+breaks, other tags are removed so a word split by inline markup
+(``Hel<b>lo</b>``) stays one word, and entities are decoded last so
+escaped markup (``&lt;p&gt;``) survives as text. Each step is a linear
+regex scan done in C; a per-token Python tokenizer measured 2-3x slower on
+1 MB bodies (see ``manage.py bench_content_pipeline``).
+"""
+import html
+import math
+import re
+from dataclasses import dataclass
+
+
+EXCERPT_WORDS = 40
+WORDS_PER_MINUTE = 200
+
+SKIPPED_TAGS = ('script', 'style', 'template', 'noscript')
+BLOCK_TAGS = (
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+    'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table',
+    'td', 'th', 'tr', 'ul',
+)
+
+# Attribute text, allowing '>' inside quoted values. Nothing crosses a '<':
+# an unclosed quote must not let every later tag scan to the end of the body
+_ATTRS = r"""(?:"[^"<]*"|'[^'<]*'|[^'"<>])*"""
+
+_DROPPED = re.compile(
+    r"<!--.*?(?:-->|$)"                                            # comment
+    rf"|<({'|'.join(SKIPPED_TAGS)})\b{_ATTRS}>.*?(?:</\1\s*>|$)"   # skipped element
+    r"|<[!?][^>]*>",                                               # doctype, CDATA, PI
+    re.DOTALL | re.IGNORECASE,
+)
+_BLOCK_TAG = re.compile(rf"</?(?:{'|'.join(BLOCK_TAGS)})\b{_ATTRS}>", re.IGNORECASE)
+_TAG = re.compile(rf"</?[a-zA-Z][\w:-]*{_ATTRS}>")
+_LINE_BREAKS = re.compile(r"\s*\n\s*")
+
+
+@dataclass
+class PostContent:
+    plain_text: str
+    excerpt: str
+    word_count: int
+    reading_time: int  # minutes
+
+
+def extract_text(body):
+    text = _DROPPED.sub('', body or '')
+    text = _TAG.sub('', _BLOCK_TAG.sub('\n', text))
+    if '&' in text:
+        text = html.unescape(text)
+    return _LINE_BREAKS.sub('\n', text).strip()
+
+
+def extract_content(body):
+    plain_text = extract_text(body)
+    words = plain_text.split()
+    word_count = len(words)
+
+    excerpt = " ".join(words[:EXCERPT_WORDS]) + ("..." if word_count > EXCERPT_WORDS else "")
+    reading_time = math.ceil(word_count / WORDS_PER_MINUTE) if word_count else 0
+
+    return PostContent(
+        plain_text=plain_text,
+        excerpt=excerpt,
+        word_count=word_count,
+        reading_time=reading_time,
+    )
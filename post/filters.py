@@ -0,0 +1,45 @@
+from django.db.models import Count
+from django.utils.text import slugify
+from rest_framework.filters import BaseFilterBackend
+
+from .models import PostTag
+
+
+class TagFilterBackend(BaseFilterBackend):
+    """
+    ?tag=a,b     posts carrying any of the tags
+    ?tags_all=a,b posts carrying every one of the tags
+    """
+
+    def get_slugs(self, request, param):
+        value = request.query_params.get(param, '')
+        return {slugify(tag) for tag in value.split(',') if slugify(tag)}
+
+    def filter_queryset(self, request, queryset, view):
+        any_of = self.get_slugs(request, 'tag')
+        if any_of:
+            tagged = PostTag.objects.filter(tag__slug__in=any_of).values('post')
+            queryset = queryset.filter(pk__in=tagged)
+
+        all_of = self.get_slugs(request, 'tags_all')
+        if all_of:
+            tagged = (
+                PostTag.objects.filter(tag__slug__in=all_of)
+                .values('post')
+                .annotate(matched=Count('tag'))
+                .filter(matched=len(all_of))
+                .values('post')
+            )
+            queryset = queryset.filter(pk__in=tagged)
+
+        return queryset
+
+
+class CategoryFilterBackend(BaseFilterBackend):
+    """?category=<slug> posts in the category"""
+
+    def filter_queryset(self, request, queryset, view):
+        category = slugify(request.query_params.get('category', ''))
+        if category:
+            queryset = queryset.filter(categories__slug=category)
+        return queryset
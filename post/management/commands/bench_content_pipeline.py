@@ -0,0 +1,59 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from post.content import extract_content
+
+
+PARAGRAPH = (
+    "<p>Django <b>REST</b> framework makes it easy to build <a href='/api/'>web APIs</a> "
+    "&amp; keeps serializers close to the models.<!-- editor note --></p>"
+    "<script>window.analytics = {track: function () {}};</script>\n"
+)
+# Unclosed quotes: must stay linear, not rescan the body from every '<'
+PATHOLOGICAL = "<a title='"
+
+
+def legacy_pipeline(body):
+    """What Post.save used to do on every save."""
+    clean_text = re.sub('<[^<]+?>', '', body)
+    words = clean_text.split()
+    return " ".join(words[:40]) + ("..." if len(words) > 40 else "")
+
+
+class Command(BaseCommand):
+    help = "Benchmark the HTML content pipeline against the old regex excerpt on large bodies."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-kb', type=int, default=1024)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        size = options['size_kb'] * 1024
+        body = PARAGRAPH * (size // len(PARAGRAPH) + 1)
+        repeat = options['repeat']
+
+        for name, pipeline in (('regex excerpt (old)', legacy_pipeline), ('content pipeline', extract_content)):
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                pipeline(body)
+                timings.append(time.perf_counter() - started)
+            best = min(timings)
+            self.stdout.write(
+                f"{name:<22} best {best * 1000:8.1f} ms  "
+                f"{len(body) / best / 1024 / 1024:6.1f} MB/s  over {repeat} run(s)"
+            )
+
+        hostile = PATHOLOGICAL * (size // len(PATHOLOGICAL) + 1)
+        started = time.perf_counter()
+        extract_content(hostile)
+        self.stdout.write(f"{'unclosed attributes':<22} once {(time.perf_counter() - started) * 1000:8.1f} ms")
+
+        content = extract_content(body)
+        self.stdout.write(
+            f"{len(body) / 1024:.0f} KB body -> {content.word_count} words, "
+            f"{content.reading_time} min read, {len(content.plain_text) / 1024:.0f} KB plain text"
+        )
+        self.stdout.write("Saves that do not change the body (publish, draft, delete, restore) skip the pipeline entirely.")
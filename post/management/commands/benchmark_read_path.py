@@ -0,0 +1,84 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import AsyncRequestFactory
+
+from post.views import PostListView, PostViewset
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the public post list with many concurrent clients: the sync viewset in WSGI "
+        "worker threads and under ASGI, against the async view."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=32,
+                            help="WSGI worker threads.")
+        parser.add_argument('--cached', action='store_true',
+                            help="Repeat one URL so the response cache answers; by default every request misses.")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.factory = AsyncRequestFactory()
+        sync_view = PostViewset.as_view({'get': 'list'})
+        async_view = PostListView.as_view()
+
+        def sync_call(request):
+            response = sync_view(request)
+            response.render()
+            # What request_finished does at the end of every request
+            close_old_connections()
+            return response
+
+        async def sync_wsgi(request, pool):
+            # Only `threads` requests run at once; the rest queue for a worker
+            return await asyncio.get_running_loop().run_in_executor(pool, sync_call, request)
+
+        async def sync_asgi(request, pool):
+            # How django.core.handlers.asgi runs a sync view
+            async with ThreadSensitiveContext():
+                return await sync_to_async(sync_call)(request)
+
+        async def async_(request, pool):
+            async with ThreadSensitiveContext():
+                response = await async_view(request)
+                await sync_to_async(close_old_connections)()
+                return response
+
+        for name, handler in (('sync-wsgi', sync_wsgi), ('sync-asgi', sync_asgi), ('async', async_)):
+            started = time.perf_counter()
+            latencies = sorted(asyncio.run(self.run_clients(handler)))
+            elapsed = time.perf_counter() - started
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            self.stdout.write(
+                f"{name:<10} {len(latencies) / elapsed:8.0f} req/s  "
+                f"p50 {statistics.median(latencies) * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{options['requests']} requests per mode from {options['concurrency']} concurrent clients, "
+            f"{options['threads']} threads, {'cached' if options['cached'] else 'uncached'} responses"
+        ))
+
+    async def run_clients(self, handler):
+        clients = asyncio.Semaphore(self.options['concurrency'])
+
+        async def request(index):
+            path = '/api/posts/' if self.options['cached'] else f'/api/posts/?bench={index}'
+            async with clients:
+                started = time.perf_counter()
+                response = await handler(self.factory.get(path), pool)
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {path} returned {response.status_code}: {response.content[:200]!r}")
+                return time.perf_counter() - started
+
+        with ThreadPoolExecutor(self.options['threads']) as pool:
+            return await asyncio.gather(*(request(index) for index in range(self.options['requests'])))
@@ -0,0 +1,57 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from cms import images
+from post.models import Post
+from user_management.models import UserModel
+
+
+IMAGE_FIELDS = (
+    (Post, 'thumbnail'),
+    (UserModel, 'profile_pic'),
+)
+
+
+class Command(BaseCommand):
+    help = "Render responsive derivatives for existing post thumbnails and profile pictures."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Images rendered in parallel; 0 renders them one by one in this thread."
+        )
+        parser.add_argument('--all', action='store_true', help="Re-render images that already have derivatives.")
+
+    def handle(self, *args, **options):
+        jobs = []
+        for model, field_name in IMAGE_FIELDS:
+            rows = (
+                model._base_manager
+                .exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .values_list('pk', field_name, images.derivatives_field(field_name))
+                .order_by('pk')
+            )
+            jobs.extend(
+                (model, pk, field_name, name)
+                for pk, name, derivatives in rows.iterator()
+                if options['all'] or not derivatives
+            )
+
+        started = time.perf_counter()
+        if options['workers'] > 0:
+            # Pillow releases the GIL while decoding, resizing and encoding
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                results = list(pool.map(lambda job: images.run_in_worker(*job), jobs))
+        else:
+            results = [images.generate(*job) for job in jobs]
+        elapsed = time.perf_counter() - started
+
+        failed = results.count(None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered derivatives for {len(jobs) - failed} image(s) in {elapsed:.1f}s "
+            f"({len(jobs) / elapsed if elapsed else 0:.1f} images/s)."
+        ))
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{failed} image(s) could not be read; see the log."))
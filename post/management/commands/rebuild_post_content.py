@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from post.models import Post
+
+
+CONTENT_FIELDS = ['excerpt', 'plain_text', 'word_count', 'reading_time']
+
+
+class Command(BaseCommand):
+    help = "Recompute excerpt, plain text, word count and reading time from each post body."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.all_objects.only('id', 'body', *CONTENT_FIELDS).order_by('pk')
+
+        batch, updated = [], 0
+        for post in posts.iterator(chunk_size=batch_size):
+            post.update_content()
+            batch.append(post)
+            if len(batch) >= batch_size:
+                updated += self.flush(batch)
+        updated += self.flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated content of {updated} post(s)."))
+        self.stdout.write("Run rebuild_search_index to refresh the search rows.")
+
+    def flush(self, batch):
+        count = len(batch)
+        if batch:
+            with transaction.atomic():
+                Post.all_objects.bulk_update(batch, CONTENT_FIELDS)
+            batch.clear()
+        return count
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from post import search
+from post.models import Post
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search index from the posts table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        connection = search._connection()
+        if not search.search_enabled(connection):
+            raise CommandError("Full-text search needs the SQLite backend.")
+
+        batch_size = options['batch_size']
+        search.create_search_table(connection)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.SEARCH_TABLE}")
+
+        posts = Post.all_objects.only('id', *search.SOURCE_FIELDS).order_by('pk')
+        batch, indexed = [], 0
+        for post in posts.iterator(chunk_size=batch_size):
+            batch.append(post)
+            if len(batch) >= batch_size:
+                indexed += self.flush(batch)
+        indexed += self.flush(batch)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.SEARCH_TABLE} ({search.SEARCH_TABLE}) VALUES ('optimize')")
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} post(s)."))
+
+    def flush(self, batch):
+        count = len(batch)
+        if batch:
+            with transaction.atomic():
+                search.index_posts(batch)
+            batch.clear()
+        return count
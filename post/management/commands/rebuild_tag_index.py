@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+
+from post.models import Post, PostTag, Tag
+from post.tagging import get_or_create_tags, normalize_tags
+
+
+class Command(BaseCommand):
+    help = "Rebuild the normalized tag tables and counts from Post.tags."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        posts = Post.all_objects.only('id', 'tags').order_by('pk')
+
+        with transaction.atomic():
+            PostTag.objects.all().delete()
+
+            links = []
+            for post in posts.iterator(chunk_size=batch_size):
+                names = normalize_tags(post.tags)
+                if not names:
+                    continue
+                tags = get_or_create_tags(names)
+                links.extend(PostTag(post_id=post.pk, tag=tags[slug]) for slug in names)
+                if len(links) >= batch_size:
+                    PostTag.objects.bulk_create(links, batch_size=batch_size)
+                    links.clear()
+            PostTag.objects.bulk_create(links, batch_size=batch_size)
+
+            public = Q(post_links__post__is_published=True, post_links__post__is_deleted=False)
+            tags = list(Tag.objects.annotate(public_posts=Count('post_links', filter=public)))
+            for tag in tags:
+                tag.post_count = tag.public_posts
+            Tag.objects.bulk_update(tags, ['post_count'], batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed tags for {PostTag.objects.count()} post-tag link(s)."))
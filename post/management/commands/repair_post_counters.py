@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from post.models import Post
+from user_management.models import UserModel
+
+
+COUNTERS = {
+    'published_post_count': Q(is_deleted=False, is_published=True),
+    'draft_post_count': Q(is_deleted=False, is_published=False),
+    'deleted_post_count': Q(is_deleted=True),
+}
+
+
+def expected_counts():
+    """Correlated ``(SELECT COUNT(*) ...)`` per counter, for an UPDATE of the users table."""
+    return {
+        field: Coalesce(Subquery(
+            Post.all_objects.filter(condition, author=OuterRef('pk'))
+            .order_by().values('author').annotate(count=Count('pk')).values('count')
+        ), 0)
+        for field, condition in COUNTERS.items()
+    }
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user post counters from the posts table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        expected = expected_counts()
+        # Only users whose counters are off are rewritten
+        wrong = Q()
+        for field, count in expected.items():
+            wrong |= ~Q(**{field: count})
+
+        # Counts are taken by the UPDATE itself, so posts saved meanwhile are
+        # never overwritten by an older count
+        repaired, last = 0, None
+        while True:
+            users = UserModel.objects.filter(pk__gt=last) if last is not None else UserModel.objects.all()
+            bound = users.order_by('pk').values_list('pk', flat=True)[batch_size - 1:batch_size].first()
+            if bound is not None:
+                users = users.filter(pk__lte=bound)
+            repaired += users.filter(wrong).update(**expected)
+            if bound is None:
+                break
+            last = bound
+
+        self.stdout.write(self.style.SUCCESS(f"Repaired post counters for {repaired} user(s)."))
@@ -1,11 +1,17 @@
 # post/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils.text import slugify
 from django.utils import timezone
+from cms import images
+from cms.db import write_transaction
 from user_management.models import UserModel
 import uuid
 import os
-import re
+
+from . import caching, search, tagging
+from .content import extract_content
 
 def post_upload_path(instance, filename):
     """
@@ -30,11 +36,18 @@ class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     slug = models.SlugField(unique=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
         super().save(*args, **kwargs)
+        caching.on_save()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        caching.on_save()
+        return result
 
     def __str__(self):
         return self.name
@@ -45,11 +58,16 @@ class Post(models.Model):
     title = models.CharField(max_length=250)
     body = models.TextField()  # raw HTML
     excerpt = models.TextField(blank=True)  # text-only summary
+    plain_text = models.TextField(blank=True, editable=False)  # body without markup, for search
+    word_count = models.PositiveIntegerField(default=0)
+    reading_time = models.PositiveSmallIntegerField(default=0)  # minutes
     tags = models.JSONField(default=list, blank=True)
 
     categories = models.ManyToManyField(Category, blank=True)
 
     thumbnail = models.ImageField(upload_to=post_upload_path)
+    # Resized copies of the thumbnail, written by cms.images
+    thumbnail_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(unique=True, blank=True)
 
     is_published = models.BooleanField(default=False)
@@ -61,11 +79,103 @@ class Post(models.Model):
     objects = PostManager()
     all_objects = models.Manager()
 
+    class Meta:
+        indexes = [
+            # Admin listing: every post, newest first
+            models.Index(fields=['-created_at', '-id'], name='post_created_idx'),
+            # Author listing: Post.all_objects.filter(author=user)
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_idx'),
+            # Public listing: only the live rows are indexed
+            models.Index(
+                fields=['-created_at', '-id'],
+                condition=models.Q(is_published=True, is_deleted=False),
+                name='post_public_created_idx',
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Values as loaded, to tell what a later save() actually changes
+        instance._loaded_values = {
+            # Copy lists (tags) so in-place edits still show up as changes
+            name: list(value) if isinstance(value, list) else value
+            for name, value in zip(field_names, values)
+        }
+        return instance
+
+    @staticmethod
+    def counter_field_for(is_published, is_deleted):
+        """UserModel counter a post in this state is counted in."""
+        if is_deleted:
+            return 'deleted_post_count'
+        return 'published_post_count' if is_published else 'draft_post_count'
+
+    def counter_field(self):
+        return self.counter_field_for(self.is_published, self.is_deleted)
+
+    @property
+    def is_public(self):
+        return self.is_published and not self.is_deleted
+
+    def _previous_state(self):
+        """
+        Stored author, visibility and tags of this post, or None if it is new.
+
+        Read from the row inside the write transaction, never from the values
+        loaded with the instance: two stale copies saved in turn (a double
+        clicked publish) must not both move the counters.
+        """
+        if self._state.adding:
+            return None
+        fields = ('author_id', 'is_published', 'is_deleted', 'tags')
+        return Post.all_objects.select_for_update().filter(pk=self.pk).values(*fields).first()
+
+    def update_author_counters(self, previous):
+        """Move this post between the author's counters with F-expressions."""
+        current = (self.author_id, self.counter_field())
+        if previous == current:
+            return
+
+        changes = {}
+        if previous is not None:
+            author_id, field = previous
+            changes.setdefault(author_id, {})[field] = Greatest(F(field) - 1, 0)
+        author_id, field = current
+        changes.setdefault(author_id, {})[field] = F(field) + 1
+
+        for author_id, fields in changes.items():
+            UserModel.objects.filter(pk=author_id).update(**fields)
+
+    def content_changed(self):
+        """Whether any full-text indexed field differs from the loaded row."""
+        loaded = getattr(self, '_loaded_values', {})
+        deferred = self.get_deferred_fields()
+        return any(
+            name not in loaded or loaded[name] != getattr(self, name)
+            for name in search.SEARCH_COLUMNS if name not in deferred
+        )
+
+    def body_changed(self):
+        if self._state.adding:
+            return True
+        if 'body' in self.get_deferred_fields():
+            # Not loaded, so not part of this save either
+            return False
+        loaded = getattr(self, '_loaded_values', {})
+        return 'body' not in loaded or loaded['body'] != self.body
+
+    def update_content(self):
+        """Derive excerpt, plain text, word count and reading time from the body."""
+        content = extract_content(self.body)
+        self.excerpt = content.excerpt
+        self.plain_text = content.plain_text
+        self.word_count = content.word_count
+        self.reading_time = content.reading_time
+
     def generate_excerpt(self):
         """Strip HTML tags & take first 40 words."""
-        clean_text = re.sub('<[^<]+?>', '', self.body)
-        words = clean_text.split()
-        return " ".join(words[:40]) + ("..." if len(words) > 40 else "")
+        return extract_content(self.body).excerpt
 
     def save(self, *args, **kwargs):
         # Slug
@@ -74,10 +184,50 @@ class Post(models.Model):
             unique_suffix = uuid.uuid4().hex[:6]
             self.slug = f"{base_slug}-{unique_suffix}"
 
-        # Auto excerpt
-        self.excerpt = self.generate_excerpt()
+        # Auto excerpt, only when the body was edited
+        if self.body_changed():
+            self.update_content()
 
-        super().save(*args, **kwargs)
+        thumbnail_changed = images.image_changed(self, 'thumbnail')
+        if thumbnail_changed:
+            self.thumbnail_derivatives = {}
+
+        reindex = self._state.adding or self.content_changed()
+        with write_transaction():
+            previous = self._previous_state()
+            super().save(*args, **kwargs)
+
+            counter_key = None
+            if previous is not None:
+                counter_key = previous['author_id'], self.counter_field_for(previous['is_published'], previous['is_deleted'])
+            self.update_author_counters(counter_key)
+
+            if previous is None:
+                tagging.sync_post_tags(self, [], was_public=False)
+            else:
+                was_public = previous['is_published'] and not previous['is_deleted']
+                tagging.sync_post_tags(self, previous['tags'], was_public)
+
+            if reindex:
+                search.index_post(self)
+
+            caching.on_save(self)
+
+            if thumbnail_changed:
+                images.schedule(self, 'thumbnail')
+
+        self._loaded_values = {
+            **getattr(self, '_loaded_values', {}),
+            'author_id': self.author_id,
+            'is_published': self.is_published,
+            'is_deleted': self.is_deleted,
+            'thumbnail': self.thumbnail.name,
+            **{
+                name: list(value) if isinstance(value, list) else value
+                for name, value in self.__dict__.items()
+                if name in search.SEARCH_COLUMNS
+            },
+        }
 
     def delete(self):
         """Soft delete."""
@@ -91,3 +241,48 @@ class Post(models.Model):
 
     def __str__(self):
         return f"{self.title} ({'Deleted' if self.is_deleted else 'Active'})"
+
+
+def post_deleted(sender, instance, **kwargs):
+    """
+    ``post_delete`` receiver for ``Post``: a hard delete (queryset delete,
+    admin, cascade from the author) bypasses ``Post.delete``, so release the
+    counters it was counted in. ``PostTag`` rows go with it by cascade.
+    """
+    UserModel.objects.filter(pk=instance.author_id).update(
+        **{instance.counter_field(): Greatest(F(instance.counter_field()) - 1, 0)}
+    )
+    if instance.is_public:
+        tagging.adjust_counts(list(tagging.normalize_tags(instance.tags)), -1)
+    search.unindex_post(instance.pk)
+    # Its category links are already gone: bump every entry rather than guess
+    caching.invalidate_categories()
+    transaction.on_commit(caching.invalidate_categories)
+
+
+class Tag(models.Model):
+    """Normalized tag, kept in sync with ``Post.tags`` by ``post.tagging``."""
+    name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+    # Number of published, non-deleted posts carrying the tag
+    post_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-post_count', 'name']
+        indexes = [
+            models.Index(fields=['-post_count', 'name'], name='tag_popularity_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+
+class PostTag(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='tag_links')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='post_links')
+
+    class Meta:
+        constraints = [
+            # Leads with tag, so it also serves "posts tagged X"
+            models.UniqueConstraint(fields=['tag', 'post'], name='posttag_unique'),
+        ]
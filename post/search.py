@@ -0,0 +1,133 @@
+"""
+Full-text search over posts, backed by an SQLite FTS5 table.
+
+``post_search`` holds one row per post (rowid = post id) with the title,
+tag-stripped body (``Post.plain_text``), excerpt and tags. Visibility is not stored in the index:
+searches are restricted to the ids of the queryset the caller is allowed to
+see, so the rules stay in ``PostViewset.get_queryset``.
+"""
+import html
+
+from django.apps import apps
+from django.db import connections, router
+
+
+SEARCH_TABLE = 'post_search'
+SEARCH_COLUMNS = ('title', 'body', 'excerpt', 'tags')
+
+# bm25() column weights, in SEARCH_COLUMNS order
+SEARCH_WEIGHTS = (10.0, 1.0, 3.0, 5.0)
+
+# Control characters mark the matches so the snippet can be escaped first
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+
+def _connection():
+    return connections[router.db_for_write(apps.get_model('post', 'Post'))]
+
+
+def search_enabled(connection=None):
+    return (connection or _connection()).vendor == 'sqlite'
+
+
+def create_search_table(connection=None):
+    connection = connection or _connection()
+    if not search_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+            f"USING fts5({', '.join(SEARCH_COLUMNS)}, tokenize = 'porter unicode61')"
+        )
+
+
+# Post fields a search row is built from
+SOURCE_FIELDS = ('title', 'plain_text', 'excerpt', 'tags')
+
+
+def search_document(post):
+    """Row values for ``post``, in SEARCH_COLUMNS order."""
+    return (
+        post.title,
+        post.plain_text,
+        post.excerpt,
+        " ".join(str(tag) for tag in post.tags or []),
+    )
+
+
+def index_post(post):
+    """Insert or refresh the search row of a saved post."""
+    connection = _connection()
+    if not search_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [post.pk])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)",
+            [post.pk, *search_document(post)]
+        )
+
+
+def unindex_post(pk):
+    connection = _connection()
+    if not search_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [pk])
+
+
+def index_posts(posts):
+    """Bulk variant of ``index_post`` for many saved posts."""
+    connection = _connection()
+    if not search_enabled(connection):
+        return
+    rows = [(post.pk, *search_document(post)) for post in posts]
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, {', '.join(SEARCH_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)",
+            rows
+        )
+
+
+def build_match_query(text):
+    """
+    Turn user input into an FTS5 query: every word must match, the last one
+    as a prefix. Words are quoted so FTS5 operators in the input are inert.
+    """
+    words = [word.replace('"', '""') for word in text.split()]
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return " ".join(terms)
+
+
+def highlight(snippet):
+    escaped = html.escape(snippet)
+    return escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+
+
+def search_posts(queryset, text, limit=20):
+    """
+    BM25-ranked matches for ``text`` among the posts of ``queryset``.
+
+    Returns ``[(post_id, rank, snippet_html), ...]``, best match first.
+    """
+    match = build_match_query(text)
+    connection = _connection()
+    if match is None or not search_enabled(connection):
+        return []
+
+    visible_sql, visible_params = queryset.order_by().values('pk').query.sql_with_params()
+    weights = ", ".join(str(weight) for weight in SEARCH_WEIGHTS)
+    sql = (
+        f"SELECT rowid, bm25({SEARCH_TABLE}, {weights}) AS rank, "
+        f"snippet({SEARCH_TABLE}, -1, %s, %s, '…', 16) "
+        f"FROM {SEARCH_TABLE} "
+        f"WHERE {SEARCH_TABLE} MATCH %s AND rowid IN ({visible_sql}) "
+        f"ORDER BY rank LIMIT %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [_MARK_START, _MARK_END, match, *visible_params, limit])
+        return [(pk, rank, highlight(snippet)) for pk, rank, snippet in cursor.fetchall()]
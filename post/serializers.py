@@ -1,6 +1,9 @@
 # post/serializers.py
+from django.conf import settings
 from rest_framework import serializers
-from .models import Post, Category
+from cms.images import SrcsetField
+from .bulk import OPERATIONS
+from .models import Post, Category, Tag
 import json
 
 
@@ -10,9 +13,16 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ["id", "name", "slug"]
 
 
+class TagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ["name", "slug", "post_count"]
+
+
 class PostSerializer(serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
     thumbnail_url = serializers.SerializerMethodField()
+    thumbnail_srcset = SrcsetField(source='thumbnail_derivatives')
 
     categories = CategorySerializer(many=True, read_only=True)
     category_ids = serializers.ListField(
@@ -28,11 +38,14 @@ class PostSerializer(serializers.ModelSerializer):
             'title',
             'body',
             'excerpt',
+            'word_count',
+            'reading_time',
             'tags',
             'categories',
             'category_ids',
             'thumbnail',
             'thumbnail_url',
+            'thumbnail_srcset',
             'slug',
             'is_published',
             'is_deleted',
@@ -45,6 +58,8 @@ class PostSerializer(serializers.ModelSerializer):
             'updated_at',
             'is_deleted',
             'excerpt',
+            'word_count',
+            'reading_time',
         ]
 
     def get_thumbnail_url(self, obj):
@@ -89,3 +104,14 @@ class PostSerializer(serializers.ModelSerializer):
                 )
 
         return data
+
+
+class PostBulkSerializer(serializers.Serializer):
+    """Input of /api/posts/bulk/; without slugs, the ?category= / ?tag= filters select the posts."""
+    operation = serializers.ChoiceField(choices=list(OPERATIONS))
+    slugs = serializers.ListField(
+        child=serializers.SlugField(),
+        required=False,
+        allow_empty=False,
+        max_length=settings.POST_BULK_LIMIT
+    )
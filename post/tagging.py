@@ -0,0 +1,87 @@
+"""
+Keeps the normalized ``Tag`` / ``PostTag`` tables in sync with ``Post.tags``.
+
+``Post.tags`` stays the source of truth exposed by the API; the tables only
+exist so tag filters and the tag cloud are index lookups instead of JSON
+scans. ``Tag.post_count`` counts published, non-deleted posts.
+"""
+from collections import defaultdict
+
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils.text import slugify
+
+
+def normalize_tags(tags):
+    """Map slug -> display name for a ``Post.tags`` list, first spelling wins."""
+    normalized = {}
+    for tag in tags or []:
+        name = str(tag).strip()[:100]
+        slug = slugify(name)[:100]
+        if slug and slug not in normalized:
+            normalized[slug] = name
+    return normalized
+
+
+def get_or_create_tags(names):
+    """``{slug: Tag}`` for ``{slug: name}``, creating the missing rows in bulk."""
+    from .models import Tag
+
+    tags = {tag.slug: tag for tag in Tag.objects.filter(slug__in=names)}
+    missing = [Tag(slug=slug, name=name) for slug, name in names.items() if slug not in tags]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        tags.update((tag.slug, tag) for tag in Tag.objects.filter(slug__in=[t.slug for t in missing]))
+    return tags
+
+
+def adjust_counts(slugs, delta):
+    from .models import Tag
+
+    if slugs and delta:
+        Tag.objects.filter(slug__in=slugs).update(post_count=Greatest(F('post_count') + delta, 0))
+
+
+def adjust_counts_by(deltas):
+    """Apply ``{slug: delta}`` to the tag counts in one UPDATE."""
+    from .models import Tag
+
+    by_delta = defaultdict(list)
+    for slug, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(slug)
+    if not by_delta:
+        return
+    change = Case(*(When(slug__in=slugs, then=Value(delta)) for delta, slugs in by_delta.items()), default=Value(0))
+    Tag.objects.filter(slug__in=[slug for slugs in by_delta.values() for slug in slugs]).update(
+        post_count=Greatest(F('post_count') + change, 0)
+    )
+
+
+def sync_post_tags(post, previous_tags, was_public):
+    """Apply the difference between the stored and current tags of ``post``."""
+    from .models import PostTag
+
+    old, new = normalize_tags(previous_tags), normalize_tags(post.tags)
+    is_public = post.is_public
+    if old.keys() == new.keys() and was_public == is_public:
+        return
+
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    kept = old.keys() & new.keys()
+
+    if added:
+        tags = get_or_create_tags({slug: new[slug] for slug in added})
+        PostTag.objects.bulk_create(
+            [PostTag(post=post, tag=tags[slug]) for slug in added],
+            ignore_conflicts=True
+        )
+    if removed:
+        PostTag.objects.filter(post=post, tag__slug__in=removed).delete()
+
+    # Counts only move for tags entering or leaving the public set
+    leaving = (removed | (kept if not is_public else set())) if was_public else set()
+    entering = (added | (kept if not was_public else set())) if is_public else set()
+    adjust_counts(leaving, -1)
+    adjust_counts(entering, 1)
@@ -1,3 +1,883 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from cms.pagination import PostCursorPagination
+from cms.queryplan import plan_queryset
+from cms.testing import QueryBudgetMixin, QueryPlanAssertionsMixin, TempMediaRootMixin
+from user_management.models import UserModel
+from user_management.serializers import UserSerializer
+from . import caching, transfer
+from .content import extract_content
+from .models import Post, Category, PostTag, Tag
+from .serializers import PostSerializer
+from .views import PostViewset, PostListView, PostDetailView, CategoryListView
+
+
+def make_post(author, categories=(), **fields):
+    fields.setdefault('title', 'A post')
+    fields.setdefault('body', '<p>Hello <b>world</b></p>')
+    fields.setdefault('thumbnail', 'demo/thumb.jpg')
+    post = Post.objects.create(author=author, **fields)
+    if categories:
+        post.categories.set(categories)
+    return post
+
+
+class PostQueryPlanTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.categories = [
+            Category.objects.create(name='Technology'),
+            Category.objects.create(name='Programming'),
+        ]
+
+    def grow(self, count):
+        """One author per post so author lookups can't hide behind a cache."""
+        for index in range(Post.objects.count(), count):
+            author = UserModel.objects.create_user(email=f'author{index}@example.com')
+            make_post(author, self.categories, title=f'Post {index}', is_published=True)
+
+    def test_plan_follows_serializer_fields(self):
+        queryset = plan_queryset(Post.objects.all(), PostSerializer)
+        self.assertEqual(queryset.query.select_related, {'author': {}})
+        self.assertEqual([p.prefetch_to for p in queryset._prefetch_related_lookups], ['categories'])
+
+        only, defer = queryset.query.deferred_loading
+        self.assertFalse(defer)
+        self.assertIn('author__username', only)
+        self.assertIn('thumbnail', only)
+        self.assertNotIn('category_ids', only)
+
+    def test_public_list_query_budget(self):
+        self.assertQueryBudget('/api/posts/', PostViewset, self.grow)
+
+
+class PostPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com')
+        created = timezone.now()
+        # Shared timestamps force the id tie-breaker to keep pages stable.
+        self.posts = [
+            make_post(self.author, title=f'Post {i}', is_published=True, created_at=created)
+            for i in range(7)
+        ]
+
+    def walk(self, url):
+        slugs = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            slugs.extend(post['slug'] for post in response.data['results'])
+            url = response.data['next']
+        return slugs, response.data['previous']
+
+    def test_pages_cover_every_row_once(self):
+        slugs, previous = self.walk('/api/posts/?page_size=3')
+        expected = [post.slug for post in sorted(self.posts, key=lambda p: p.id, reverse=True)]
+        self.assertEqual(slugs, expected)
+        self.assertIsNotNone(previous)
+
+    def test_previous_link_returns_prior_page(self):
+        first = self.client.get('/api/posts/?page_size=3').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(back['results'], first['results'])
+        self.assertIsNone(first['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+        # Well-formed cursors whose values do not fit the ordering fields
+        pagination = PostCursorPagination()
+        for position in (['garbage', 5], [{}, 5], ['2020-01-01T00:00:00', 'x'], [None, 5], [1]):
+            cursor = pagination.encode_cursor(position, reverse=False)
+            response = self.client.get('/api/posts/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+
+class PostIndexTests(QueryPlanAssertionsMixin, TestCase):
+    """The PostViewset.get_queryset branches, as paginated, must hit an index."""
+
+    def setUp(self):
+        self.author = UserModel.objects.create_user(email='author@example.com')
+        self.pagination = PostCursorPagination()
+        self.ordering = self.pagination.ordering
+
+    def page(self, queryset, after=False):
+        queryset = plan_queryset(queryset, PostSerializer).order_by(*self.ordering)
+        if after:
+            position = [timezone.now().isoformat(), 10]
+            queryset = queryset.filter(self.pagination.keyset_filter(self.ordering, position))
+        return queryset[:21]
+
+    def test_public_listing(self):
+        queryset = Post.objects.filter(is_published=True)
+        self.assertUsesIndex(self.page(queryset), 'post_public_created_idx')
+        self.assertUsesIndex(self.page(queryset, after=True), 'post_public_created_idx')
+
+    def test_author_listing(self):
+        queryset = Post.all_objects.filter(author=self.author)
+        self.assertUsesIndex(self.page(queryset), 'post_author_created_idx')
+        self.assertUsesIndex(self.page(queryset, after=True), 'post_author_created_idx')
+
+    def test_admin_listing(self):
+        queryset = Post.all_objects.all()
+        self.assertUsesIndex(self.page(queryset), 'post_created_idx')
+        self.assertUsesIndex(self.page(queryset, after=True), 'post_created_idx')
+
+
+class PostCounterTests(TestCase):
+    def setUp(self):
+        self.author = UserModel.objects.create_user(email='author@example.com')
+
+    def counters(self):
+        self.author.refresh_from_db()
+        return (
+            self.author.published_post_count,
+            self.author.draft_post_count,
+            self.author.deleted_post_count,
+        )
+
+    def test_counters_follow_post_state(self):
+        post = make_post(self.author)
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+        post = Post.objects.get(pk=post.pk)
+        post.is_published = True
+        post.save()
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+        post.delete()
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+        post.restore()
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+        post.title = 'Renamed'
+        post.save()
+        self.assertEqual(self.counters(), (0, 1, 0))
+
+    def test_stale_copies_move_counters_once(self):
+        post = make_post(self.author)
+        # A double-clicked publish: both requests loaded the draft
+        first, second = Post.objects.get(pk=post.pk), Post.objects.get(pk=post.pk)
+        for copy in (first, second):
+            copy.is_published = True
+            copy.save()
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+        first.delete()
+        second.delete()
+        self.assertEqual(self.counters(), (0, 0, 1))
+
+    def test_stale_user_saves_keep_counters(self):
+        stale = UserModel.objects.get(pk=self.author.pk)
+        make_post(self.author, is_published=True)
+        stale.bio = 'Edited'
+        stale.save()
+        self.assertEqual(self.counters(), (1, 0, 0))
+        self.assertEqual(self.author.bio, 'Edited')
+
+        request = RequestFactory().get('/')
+        request.user = UserModel.objects.create_superuser(email='admin@example.com')
+        form = admin.site._registry[UserModel].get_form(request)
+        self.assertFalse({'published_post_count', 'draft_post_count', 'deleted_post_count'} & set(form.base_fields))
+
+    def test_hard_deletes_release_counters(self):
+        post = make_post(self.author, tags=['django'], is_published=True)
+        make_post(self.author, tags=['django'])
+        Post.all_objects.filter(pk=post.pk).delete()
+        self.assertEqual(self.counters(), (0, 1, 0))
+        self.assertEqual(Tag.objects.get(slug='django').post_count, 0)
+
+        other = UserModel.objects.create_user(email='other@example.com')
+        make_post(other, tags=['django'], is_published=True)
+        self.assertEqual(Tag.objects.get(slug='django').post_count, 1)
+        # Cascade from a hard-deleted author (UserModel.delete itself is soft)
+        UserModel.objects.filter(pk=other.pk).delete()
+        self.assertEqual(Tag.objects.get(slug='django').post_count, 0)
+
+    def test_serializer_reads_counters_without_queries(self):
+        make_post(self.author, is_published=True)
+        make_post(self.author)
+        self.author.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            data = UserSerializer(self.author).data
+        self.assertEqual(data['post_count'], 2)
+        self.assertEqual(data['published_post_count'], 1)
+
+    def test_repair_command(self):
+        make_post(self.author, is_published=True)
+        make_post(self.author, is_deleted=True)
+        UserModel.objects.filter(pk=self.author.pk).update(published_post_count=7, draft_post_count=3)
+
+        UserModel.objects.create_user(email='other@example.com')
+
+        out = StringIO()
+        with self.assertNumQueries(6):  # per batch of one: find its bound, then one UPDATE
+            call_command('repair_post_counters', batch_size=1, stdout=out)
+        self.assertEqual(self.counters(), (1, 0, 1))
+        self.assertIn("for 1 user(s)", out.getvalue())
+
+
+class PostSearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com')
+        self.other = UserModel.objects.create_user(email='other@example.com')
+        self.django = make_post(
+            self.author, title='Django tips', body='<p>Use <b>select_related</b> wisely</p>',
+            tags=['orm'], is_published=True,
+        )
+        self.draft = make_post(self.other, title='Django drafts', body='<p>Unfinished</p>')
+        self.script = make_post(
+            self.author, title='Escaping', body='<p>&lt;script&gt;alert(1)&lt;/script&gt; django</p>',
+            is_published=True,
+        )
+
+    def search(self, q, user=None):
+        if user:
+            self.client.force_authenticate(user)
+        return self.client.get('/api/posts/search/', {'q': q})
+
+    def slugs(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [post['slug'] for post in response.data['results']]
+
+    def test_public_search_hides_drafts(self):
+        slugs = self.slugs(self.search('django'))
+        self.assertEqual(set(slugs), {self.django.slug, self.script.slug})
+        self.assertEqual(slugs[0], self.django.slug, "title matches rank first")
+
+    def test_author_sees_own_drafts(self):
+        self.assertEqual(self.slugs(self.search('unfinish', user=self.other)), [self.draft.slug])
+
+    def test_index_follows_edits(self):
+        self.django.title = 'Flask tips'
+        self.django.save()
+        self.assertEqual(self.slugs(self.search('flask')), [self.django.slug])
+
+    def test_filters_narrow_the_search(self):
+        news = Category.objects.create(name='News')
+        self.script.categories.add(news)
+        response = self.client.get('/api/posts/search/', {'q': 'django', 'category': 'news'})
+        self.assertEqual(self.slugs(response), [self.script.slug])
+        response = self.client.get('/api/posts/search/', {'q': 'django', 'tag': 'orm'})
+        self.assertEqual(self.slugs(response), [self.django.slug])
+        response = self.client.get('/api/posts/search/', {'q': 'django', 'tag': 'zzz'})
+        self.assertEqual(self.slugs(response), [])
+
+    def test_snippets_are_escaped(self):
+        response = self.search('alert')
+        snippet = response.data['results'][0]['snippet']
+        self.assertIn('<mark>alert</mark>', snippet)
+        self.assertNotIn('<script>', snippet)
+
+    def test_query_syntax_is_inert(self):
+        self.assertEqual(self.slugs(self.search('django OR "NEAR(')), [])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM post_search")
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.slugs(self.search('wisely')), [self.django.slug])
+
+
+class PostTagTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com')
+        self.a = make_post(self.author, tags=['Django', 'ORM'], is_published=True)
+        self.b = make_post(self.author, tags=['django', 'REST'], is_published=True)
+        self.draft = make_post(self.author, tags=['django'])
+
+    def counts(self):
+        return dict(Tag.objects.values_list('slug', 'post_count'))
+
+    def slugs(self, params):
+        response = self.client.get('/api/posts/', params)
+        self.assertEqual(response.status_code, 200)
+        return {post['slug'] for post in response.data['results']}
+
+    def test_counts_follow_tags_and_visibility(self):
+        self.assertEqual(self.counts(), {'django': 2, 'orm': 1, 'rest': 1})
+
+        self.b.tags = ['rest', 'api']
+        self.b.save()
+        self.assertEqual(self.counts(), {'django': 1, 'orm': 1, 'rest': 1, 'api': 1})
+
+        self.draft.is_published = True
+        self.draft.save()
+        self.assertEqual(self.counts()['django'], 2)
+
+        self.a.delete()
+        self.assertEqual(self.counts(), {'django': 1, 'orm': 0, 'rest': 1, 'api': 1})
+
+        self.a.restore()
+        self.assertEqual(self.counts()['orm'], 0, "restored posts come back as drafts")
+
+    def test_stale_copies_count_tags_once(self):
+        first, second = Post.objects.get(pk=self.draft.pk), Post.objects.get(pk=self.draft.pk)
+        first.is_published = True
+        first.tags = ['django', 'Python']
+        first.save()
+        # The second copy still holds the unpublished draft and its old tags
+        second.is_published = True
+        second.save()
+        self.assertEqual(self.counts(), {'django': 3, 'orm': 1, 'rest': 1, 'python': 0})
+        self.assertFalse(PostTag.objects.filter(post=self.draft, tag__slug='python').exists())
+
+    def test_in_place_edit_is_detected(self):
+        post = Post.objects.get(pk=self.a.pk)
+        post.tags.append('Python')
+        post.save()
+        self.assertEqual(self.counts()['python'], 1)
+
+    def test_tag_filters(self):
+        self.assertEqual(self.slugs({'tag': 'django'}), {self.a.slug, self.b.slug})
+        self.assertEqual(self.slugs({'tag': 'orm,rest'}), {self.a.slug, self.b.slug})
+        self.assertEqual(self.slugs({'tags_all': 'django,orm'}), {self.a.slug})
+
+    def test_tag_cloud(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(tag['slug'], tag['post_count']) for tag in response.data],
+            [('django', 2), ('orm', 1), ('rest', 1)]
+        )
+
+    def test_rebuild_command(self):
+        PostTag.objects.all().delete()
+        Tag.objects.update(post_count=0)
+        call_command('rebuild_tag_index', stdout=StringIO())
+        self.assertEqual(self.counts(), {'django': 2, 'orm': 1, 'rest': 1})
+        self.assertEqual(PostTag.objects.count(), 5)
+
+
+class PostResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com')
+        self.category = Category.objects.create(name='Technology')
+        self.post = make_post(self.author, [self.category], title='Cached', is_published=True)
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_list_is_served_from_cache(self):
+        self.assertEqual(self.get('/api/posts/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get('/api/posts/')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(caching.cache_stats()['hits'], 1)
+
+    def test_save_invalidates_list_detail_and_category(self):
+        urls = ['/api/posts/', f'/api/posts/{self.post.slug}/']
+        for url in urls:
+            self.get(url)
+        self.get('/api/posts/', {'category': 'technology'})
+
+        self.post.title = 'Renamed'
+        self.post.save()
+
+        self.assertEqual(self.get(urls[1]).data['title'], 'Renamed')
+        self.assertEqual(self.get(urls[0]).data['results'][0]['title'], 'Renamed')
+        response = self.get('/api/posts/', {'category': 'technology'})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+    def test_draft_drops_post_from_cached_list(self):
+        self.get('/api/posts/')
+        self.post.is_published = False
+        self.post.save()
+        self.assertEqual(self.get('/api/posts/').data['results'], [])
+
+    def test_category_change_invalidates_detail(self):
+        url = f'/api/posts/{self.post.slug}/'
+        self.get(url)
+        self.category.name = 'Tech'
+        self.category.save()
+        self.assertEqual(self.get(url).data['categories'][0]['name'], 'Tech')
+
+    def test_author_rename_invalidates_posts(self):
+        urls = ['/api/posts/', f'/api/posts/{self.post.slug}/']
+        for url in urls:
+            self.get(url)
+        author = UserModel.objects.get(pk=self.author.pk)
+        author.username = 'renamed'
+        author.save()
+        self.assertEqual(self.get(urls[1]).data['author'], 'renamed')
+        self.assertEqual(self.get(urls[0]).data['results'][0]['author'], 'renamed')
+
+    def test_category_membership_invalidates_category_list(self):
+        other = Category.objects.create(name='Other')
+        self.assertEqual(self.get('/api/posts/', {'category': 'other'}).data['results'], [])
+        self.post.categories.add(other)
+        self.assertEqual(len(self.get('/api/posts/', {'category': 'other'}).data['results']), 1)
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(self.author)
+        self.assertNotIn('X-Cache', self.get('/api/posts/'))
+
+    def test_miss_waits_for_the_caller_filling_the_entry(self):
+        cache.add('hot-key:lock', 1, 5)
+        threading.Timer(0.1, lambda: cache.set('hot-key', {'data': {'title': 'filled'}, 'headers': {}})).start()
+
+        response = caching.cached_response('hot-key', compute=self.fail)
+        self.assertEqual(response.data, {'title': 'filled'})
+        self.assertEqual(caching.cache_stats()['waits'], 1)
+
+
+class PostConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com')
+        self.category = Category.objects.create(name='Technology')
+        self.post = make_post(self.author, [self.category], is_published=True)
+        self.detail = f'/api/posts/{self.post.slug}/'
+
+    def test_list_etag_short_circuits(self):
+        etag = self.client.get('/api/posts/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_authenticated_304_skips_serialization(self):
+        self.client.force_authenticate(self.author)
+        etag = self.client.get('/api/posts/')['ETag']
+        # The validators come from the cache version stamps: no aggregate over
+        # the visible rows, no page query, no prefetch
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_last_modified(self):
+        response = self.client.get(self.detail)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.detail, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_changes_produce_new_validators(self):
+        etag = self.client.get(self.detail)['ETag']
+        self.category.name = 'Tech'
+        self.category.save()
+        response = self.client.get(self.detail, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        list_etag = self.client.get('/api/posts/')['ETag']
+        make_post(self.author, is_published=True)
+        response = self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_deleted_category_and_renamed_author_change_validators(self):
+        self.client.force_authenticate(self.author)
+        urls = ['/api/posts/', self.detail]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        self.category.delete()
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200, url)
+
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        author = UserModel.objects.get(pk=self.author.pk)
+        author.username = 'renamed'
+        author.save()
+        for url, etag in zip(urls, etags):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, url)
+
+    def test_missing_post_is_404(self):
+        self.assertEqual(self.client.get('/api/posts/missing/').status_code, 404)
+
+    def test_categories(self):
+        response = self.client.get('/api/categories/')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/categories/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class PostAsyncReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com', is_verified=True)
+        self.category = Category.objects.create(name='Technology')
+        self.post = make_post(self.author, [self.category], title='Published', is_published=True)
+        self.draft = make_post(self.author, title='Draft')
+
+    def test_reads_route_to_async_views(self):
+        for url, view in [
+            ('/api/posts/', PostListView),
+            (f'/api/posts/{self.post.slug}/', PostDetailView),
+            ('/api/categories/', CategoryListView),
+        ]:
+            self.assertIs(resolve(url).func.view_class, view)
+        self.assertIs(resolve('/api/posts/search/').func.cls, PostViewset)
+
+    async def test_async_client_reads(self):
+        client = AsyncClient()
+        response = await client.get('/api/posts/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([post['slug'] for post in response.json()['results']], [self.post.slug])
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual((await client.get('/api/posts/'))['X-Cache'], 'HIT')
+
+        response = await client.get(f'/api/posts/{self.post.slug}/')
+        self.assertEqual(response.json()['categories'][0]['name'], 'Technology')
+        response = await client.get(f'/api/posts/{self.post.slug}/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        response = await client.get(f'/api/posts/{self.draft.slug}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'No Post matches the given query.'})
+
+    def test_visibility_matches_viewset(self):
+        self.client.force_authenticate(self.author)
+        slugs = {post['slug'] for post in self.client.get('/api/posts/').data['results']}
+        self.assertEqual(slugs, {self.post.slug, self.draft.slug})
+        self.assertEqual(self.client.get(f'/api/posts/{self.draft.slug}/').status_code, 200)
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get('/api/posts/', HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('WWW-Authenticate', response)
+
+    def test_writes_fall_back_to_viewset(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.patch(f'/api/posts/{self.post.slug}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.data['title'], 'Renamed')
+
+        response = self.client.post('/api/categories/', {'name': 'Science'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self.client.post('/api/posts/', {}, format='json').status_code, 400)
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.delete(f'/api/posts/{self.post.slug}/').status_code, 401)
+
+
+class PostReadBenchmarkTests(TransactionTestCase):
+    # The benchmark's worker threads open their own connections: rows must be committed
+
+    def test_benchmark_command(self):
+        author = UserModel.objects.create_user(email='author@example.com')
+        make_post(author, title='Benchmarked', is_published=True)
+        out = StringIO()
+        call_command('benchmark_read_path', requests=8, concurrency=4, threads=2, stdout=out)
+        for mode in ('sync-wsgi', 'sync-asgi', 'async'):
+            self.assertIn(mode, out.getvalue())
+
+
+class PostBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.author = UserModel.objects.create_user(email='author@example.com', is_verified=True)
+        self.other = UserModel.objects.create_user(email='other@example.com', is_verified=True)
+        self.category = Category.objects.create(name='News')
+        self.client.force_authenticate(self.author)
+
+    def bulk(self, data, params=''):
+        return self.client.post(f'/api/posts/bulk/{params}', data, format='json')
+
+    def counters(self, user):
+        user.refresh_from_db()
+        return user.published_post_count, user.draft_post_count, user.deleted_post_count
+
+    def make_posts(self, count, **fields):
+        return [make_post(self.author, tags=['django', f'tag-{i % 3}'], **fields) for i in range(count)]
+
+    def test_publish_reports_each_slug(self):
+        draft, published = make_post(self.author, tags=['django']), make_post(self.author, is_published=True)
+        foreign = make_post(self.other)
+
+        response = self.bulk({'operation': 'publish', 'slugs': [draft.slug, published.slug, foreign.slug, 'missing']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(
+            [row['status'] for row in response.data['results']],
+            ['updated', 'unchanged', 'not_found', 'not_found']
+        )
+        self.assertTrue(Post.objects.get(pk=draft.pk).is_published)
+        self.assertFalse(Post.objects.get(pk=foreign.pk).is_published)
+        self.assertEqual(self.counters(self.author), (2, 0, 0))
+        self.assertEqual(dict(Tag.objects.values_list('slug', 'post_count')), {'django': 1})
+
+    def test_derived_data_matches_single_saves(self):
+        posts = self.make_posts(6, is_published=True)
+        self.bulk({'operation': 'delete', 'slugs': [post.slug for post in posts[:4]]})
+        self.bulk({'operation': 'draft', 'slugs': [post.slug for post in posts]})
+
+        counters = self.counters(self.author)
+        tag_counts = dict(Tag.objects.values_list('slug', 'post_count'))
+        self.assertEqual(counters, (0, 2, 4))
+        call_command('repair_post_counters', stdout=StringIO())
+        call_command('rebuild_tag_index', stdout=StringIO())
+        self.assertEqual(self.counters(self.author), counters)
+        self.assertEqual(dict(Tag.objects.values_list('slug', 'post_count')), tag_counts)
+
+    def test_filter_selects_posts(self):
+        news = self.make_posts(2, categories=[self.category])
+        self.make_posts(2)
+
+        response = self.bulk({'operation': 'publish'}, '?category=news')
+        self.assertEqual({row['slug'] for row in response.data['results']}, {post.slug for post in news})
+        self.assertEqual(Post.objects.filter(is_published=True).count(), 2)
+
+        self.assertEqual(self.bulk({'operation': 'publish'}).status_code, 400)
+
+    def test_invalidates_cached_listings(self):
+        post = make_post(self.author, [self.category], is_published=True)
+        anonymous = APIClient()
+        self.assertEqual(len(anonymous.get('/api/posts/', {'category': 'news'}).data['results']), 1)
+
+        self.bulk({'operation': 'draft', 'slugs': [post.slug]})
+        self.assertEqual(anonymous.get('/api/posts/', {'category': 'news'}).data['results'], [])
+        self.assertEqual(anonymous.get(f'/api/posts/{post.slug}/').status_code, 404)
+
+    def test_restore_is_admin_only(self):
+        post = make_post(self.author, is_deleted=True)
+        self.assertEqual(self.bulk({'operation': 'restore', 'slugs': [post.slug]}).status_code, 403)
+
+        admin = UserModel.objects.create_superuser(email='admin@example.com', password='pass')
+        self.client.force_authenticate(admin)
+        response = self.bulk({'operation': 'restore', 'slugs': [post.slug]})
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(self.counters(self.author), (0, 1, 0))
+
+    @override_settings(POST_BULK_LIMIT=3)
+    def test_limit(self):
+        self.make_posts(4, categories=[self.category])
+        self.assertEqual(self.bulk({'operation': 'publish'}, '?category=news').status_code, 400)
+        self.assertFalse(Post.objects.filter(is_published=True).exists())
+
+    def test_queries_do_not_grow_with_posts(self):
+        def run(count):
+            posts = self.make_posts(count, categories=[self.category])
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.bulk({'operation': 'publish', 'slugs': [post.slug for post in posts]})
+            self.assertEqual(response.data['updated'], count)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(3), run(30))
+
+
+class PostTransferTests(TestCase):
+    fixtures_dir = 'fixtures'
+
+    def import_fixtures(self, **options):
+        out = StringIO()
+        call_command(
+            'import_content', *(f'{self.fixtures_dir}/{name}.json' for name in ('users', 'categories', 'posts')),
+            stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_stream_reader(self):
+        records = [{'n': i, 'text': 'x' * i} for i in range(50)]
+        array = json.dumps(records, indent=2)
+        ndjson = "\n".join(json.dumps(record) for record in records) + "\n"
+        for text in (array, ndjson, '[]', ''):
+            expected = records if len(text) > 2 else []
+            self.assertEqual(list(transfer.read_records(StringIO(text), read_size=7)), expected)
+        with self.assertRaises(ValueError):
+            list(transfer.read_records(StringIO('[{"n": 1}, {"n": '), read_size=7))
+
+    def test_import_fixtures_with_derived_data(self):
+        self.assertIn("Imported 5 users, 10 categories, 10 posts", self.import_fixtures(batch_size=3))
+
+        post = Post.all_objects.get(slug='drf-guide-abc123')
+        self.assertEqual(post.author.email, 'aarav@example.com')
+        self.assertEqual(sorted(post.categories.values_list('pk', flat=True)), [1, 2])
+        self.assertEqual(post.excerpt, extract_content(post.body).excerpt)
+        self.assertTrue(post.plain_text)
+
+        counters = {user.pk: (user.published_post_count, user.draft_post_count) for user in UserModel.objects.all()}
+        call_command('repair_post_counters', stdout=StringIO())
+        self.assertEqual(
+            counters,
+            {user.pk: (user.published_post_count, user.draft_post_count) for user in UserModel.objects.all()}
+        )
+
+        tag_counts = dict(Tag.objects.values_list('slug', 'post_count'))
+        links = PostTag.objects.count()
+        call_command('rebuild_tag_index', stdout=StringIO())
+        self.assertEqual(dict(Tag.objects.values_list('slug', 'post_count')), tag_counts)
+        self.assertEqual(PostTag.objects.count(), links)
+
+        response = APIClient().get('/api/posts/search/', {'q': 'decorators'})
+        self.assertEqual([row['slug'] for row in response.data['results']], ['python-decorators-def456'])
+
+    def test_queries_do_not_grow_with_rows(self):
+        author = UserModel.objects.create_user(email='author@example.com')
+
+        def run(count):
+            importer = transfer.Importer(batch_size=1000)
+            for i in range(count):
+                importer.add({'fields': {
+                    'author': author.pk, 'title': f'Bulk {count} {i}', 'body': '<p>Hi</p>',
+                    'tags': ['bulk', f'tag-{count}'], 'is_published': True, 'thumbnail': 'demo/thumb.jpg',
+                }}, default_label='posts')
+            with CaptureQueriesContext(connection) as ctx:
+                importer.finish()
+            return len(ctx.captured_queries)
+
+        self.assertEqual(run(5), run(50))
+        author.refresh_from_db()
+        self.assertEqual(author.published_post_count, 55)
+
+    def test_conflicting_chunk_stops_the_import(self):
+        self.import_fixtures()
+        with self.assertRaisesMessage(CommandError, "Import stopped after 0 row(s)"):
+            call_command('import_content', f'{self.fixtures_dir}/categories.json', stdout=StringIO())
+
+    def test_export_round_trip(self):
+        self.import_fixtures()
+        out = StringIO()
+        call_command('export_content', 'posts', 'users', chunk_size=2, stdout=out, stderr=StringIO())
+        records = list(transfer.read_records(StringIO(out.getvalue())))
+        self.assertEqual(len(records), 15)
+
+        posts = {record['pk']: record['fields'] for record in records if record['model'] == transfer.POSTS}
+        self.assertEqual(posts[1]['categories'], [1, 2])
+        self.assertEqual(posts[1]['author'], 10)
+        self.assertNotIn('plain_text', posts[1])
+        users = [record['fields'] for record in records if record['model'] == transfer.USERS]
+        self.assertNotIn('published_post_count', users[0])
+        self.assertIsNone(users[0]['profile_pic'])
+
+        array = StringIO()
+        call_command('export_content', 'categories', format='json', stdout=array, stderr=StringIO())
+        self.assertEqual(len(json.loads(array.getvalue())), 10)
+
+
+class PostContentTests(TestCase):
+    def setUp(self):
+        self.author = UserModel.objects.create_user(email='author@example.com')
+
+    def test_extraction(self):
+        content = extract_content(
+            "<h1>Title</h1><p>Hel<b>lo</b> &amp; w&eacute;lcome</p>"
+            "<!-- note --><script>var x = '<p>';</script><p>&lt;p&gt; stays text</p>"
+        )
+        self.assertEqual(content.plain_text, "Title\nHello & wélcome\n<p> stays text")
+        self.assertEqual(content.word_count, 7)
+        self.assertEqual(content.reading_time, 1)
+
+    def test_excerpt_and_reading_time(self):
+        content = extract_content("<p>" + "word " * 401 + "</p>")
+        self.assertEqual(content.excerpt, " ".join(["word"] * 40) + "...")
+        self.assertEqual(content.reading_time, 3)
+        self.assertEqual(extract_content("").reading_time, 0)
+
+    def test_unclosed_tags_stay_linear(self):
+        # Unclosed quotes used to make every later '<' rescan the rest of the body
+        for unit in ("<a '", '<p title="x', "<script '"):
+            body = unit * (1024 * 1024 // len(unit))
+            started = time.perf_counter()
+            extract_content(body)
+            self.assertLess(time.perf_counter() - started, 2, unit)
+        self.assertEqual(extract_content("<p title='a>b'>Hi</p>").plain_text, "Hi")
+
+    def test_save_derives_content_from_body(self):
+        post = make_post(self.author, body="<p>One <i>two</i></p><p>three</p>")
+        self.assertEqual((post.excerpt, post.plain_text, post.word_count), ("One two three", "One two\nthree", 3))
+
+    def test_saves_without_body_changes_skip_pipeline(self):
+        post = make_post(self.author)
+        with mock.patch('post.models.extract_content', wraps=extract_content) as pipeline:
+            post.is_published = True
+            post.save()
+            post.delete()
+            post.restore()
+            self.assertEqual(pipeline.call_count, 0)
+            post.body = "<p>Edited</p>"
+            post.save()
+            self.assertEqual(pipeline.call_count, 1)
+        self.assertEqual(Post.objects.get(pk=post.pk).excerpt, "Edited")
+
+
+@override_settings(IMAGE_DERIVATIVE_WORKERS=0)
+class PostImageDerivativeTests(TempMediaRootMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = UserModel.objects.create_user(email='author@example.com')
+
+    def upload(self, size, name='upload.jpg', mode='RGB'):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, 'PNG' if mode == 'RGBA' else 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_presets_rendered_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = make_post(self.author, thumbnail=self.upload((2000, 1000)))
+        post.refresh_from_db()
+
+        derivatives = post.thumbnail_derivatives
+        self.assertEqual([entry['width'] for entry in derivatives.values()], [320, 640, 1280])
+        with default_storage.open(derivatives['sm']['webp']) as file, Image.open(file) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (320, 160)))
+
+        srcset = PostSerializer(post).data['thumbnail_srcset']
+        self.assertEqual(set(srcset), {'webp', 'jpeg'})
+        self.assertTrue(srcset['jpeg'].endswith('-lg.jpg 1280w'))
+
+    def test_small_and_transparent_images_are_not_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = make_post(self.author, thumbnail=self.upload((200, 100), 'logo.png', mode='RGBA'))
+        post.refresh_from_db()
+        self.assertEqual([entry['width'] for entry in post.thumbnail_derivatives.values()], [200])
+
+    def test_replacing_the_image_clears_stale_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = make_post(self.author, thumbnail=self.upload((800, 600)))
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_derivatives)
+
+        post.thumbnail = 'missing/other.jpg'
+        with self.assertLogs('cms.images', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail_derivatives, {})
+        self.assertIsNone(PostSerializer(post).data['thumbnail_srcset'])
+
+        with mock.patch('cms.images.schedule') as schedule:
+            post.is_published = True
+            post.save()
+        schedule.assert_not_called()
+
+    def test_backfill_command(self):
+        post = make_post(self.author, thumbnail=self.upload((800, 600)))
+        self.author.profile_pic = self.upload((400, 400))
+        self.author.save()
+        Post.all_objects.update(thumbnail_derivatives={})
+        UserModel.objects.update(profile_pic_derivatives={})
+
+        call_command('build_image_derivatives', workers=0, stdout=StringIO())
+        post.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(len(post.thumbnail_derivatives), 3)
+        self.assertEqual([entry['width'] for entry in self.author.profile_pic_derivatives.values()], [320, 400])
@@ -0,0 +1,301 @@
+"""
+Bulk import and export of users, categories and posts.
+
+Records use the fixture layout, ``{"model": ..., "pk": ..., "fields": {...}}``,
+so the files in ``fixtures/`` load as they are. Input is a JSON array or
+NDJSON (one record per line). Both are parsed as a stream: memory holds one
+read buffer and one chunk of rows, whatever the size of the file.
+
+Rows are inserted with ``bulk_create``, one transaction per chunk. The data
+``Post.save`` maintains row by row is built for the whole chunk instead:
+
+* slugs, and excerpt / plain text / word count / reading time, optionally
+  in worker processes;
+* category links, as through-rows in one insert;
+* ``Tag`` / ``PostTag`` rows and tag counts (``post.tagging``);
+* the authors' post counters;
+* full-text search rows (``post.search``).
+
+The response cache is invalidated once, at the end.
+
+Rows must be new: a chunk that conflicts with existing rows is rolled back,
+and the import stops. Thumbnail derivatives are not rendered; run
+``build_image_derivatives`` afterwards.
+"""
+import json
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, FileField, Prefetch
+from django.utils.text import slugify
+
+from cms.db import write_transaction
+from user_management.models import UserModel
+from . import caching, search, tagging
+from .content import extract_content
+from .models import Category, Post, PostTag
+
+
+USERS, CATEGORIES, POSTS = 'user_management.usermodel', 'post.category', 'post.post'
+# Dependencies first
+LABELS = (USERS, CATEGORIES, POSTS)
+ALIASES = {'users': USERS, 'categories': CATEGORIES, 'posts': POSTS}
+
+# Derived on import, so never exported or read back
+COUNTER_FIELDS = ('published_post_count', 'draft_post_count', 'deleted_post_count')
+CONTENT_FIELDS = ('excerpt', 'plain_text', 'word_count', 'reading_time')
+DERIVED_FIELDS = {USERS: COUNTER_FIELDS, CATEGORIES: (), POSTS: CONTENT_FIELDS}
+
+
+class TransferError(Exception):
+    pass
+
+
+def model_for(label):
+    return {USERS: UserModel, CATEGORIES: Category, POSTS: Post}[label]
+
+
+# -------------------------------
+# Streaming JSON
+# -------------------------------
+_SEPARATORS = ' \t\r\n,'
+# A record still incomplete past this many characters is treated as malformed
+MAX_RECORD_CHARS = 64 * 1024 * 1024
+
+
+def read_records(stream, read_size=1 << 16):
+    """Yield the values of a JSON array, or of NDJSON lines, read from a text stream."""
+    decoder = json.JSONDecoder()
+    buffer, position, eof, started = '', 0, False, False
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = stream.read(read_size), 0
+            eof = not buffer
+            continue
+
+        if buffer[position] == '[' and not started:
+            position += 1
+        elif buffer[position] == ']':
+            position += 1
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Most likely a record cut by the end of the buffer
+                more = '' if eof else stream.read(read_size)
+                if not more or len(buffer) - position > MAX_RECORD_CHARS:
+                    raise
+                buffer, position = buffer[position:] + more, 0
+                continue
+            position = end
+            yield value
+        started = True
+
+
+def write_records(records, stream, as_array=False):
+    """Write records as NDJSON, or as a JSON array; returns how many."""
+    count = 0
+    if as_array:
+        stream.write('[')
+    for record in records:
+        if as_array:
+            stream.write(',\n' if count else '\n')
+        stream.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+        if not as_array:
+            stream.write('\n')
+        count += 1
+    if as_array:
+        stream.write('\n]\n')
+    return count
+
+
+# -------------------------------
+# Import
+# -------------------------------
+def build(model, record, derived=()):
+    """An unsaved instance from a fixture record, and its many-to-many values."""
+    instance, many = model(), {}
+    if record.get('pk') is not None:
+        instance.pk = record['pk']
+    for name, value in (record.get('fields') or {}).items():
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise TransferError(f"{model._meta.label_lower} has no field {name!r}")
+        if field.many_to_many:
+            many[name] = value or []
+        elif name in derived:
+            continue
+        elif field.is_relation:
+            setattr(instance, field.attname, value)
+        else:
+            setattr(instance, field.attname, field.to_python(value))
+    return instance, many
+
+
+class Importer:
+    """
+    ``add()`` records in any order of models; each model is buffered and
+    written ``batch_size`` rows at a time, its dependencies first.
+    """
+
+    def __init__(self, batch_size=1000, workers=0, progress=None):
+        self.batch_size = batch_size
+        self.pending = {label: [] for label in LABELS}
+        self.counts = Counter()
+        self.progress = progress
+        self.pool = ProcessPoolExecutor(workers) if workers > 1 else None
+
+    def add(self, record, default_label=None):
+        if not isinstance(record, dict):
+            raise TransferError(f"Expected an object, got {type(record).__name__}")
+        label = str(record.get('model') or default_label or '').lower()
+        label = ALIASES.get(label, label)
+        if label not in self.pending:
+            raise TransferError(f"Unknown model {label!r}; expected one of {', '.join(LABELS)}")
+        self.pending[label].append(record)
+        if len(self.pending[label]) >= self.batch_size:
+            self.flush(label)
+
+    def flush(self, label):
+        # Posts point at users and categories: write those first
+        for dependency in LABELS[:LABELS.index(label)]:
+            if self.pending[dependency]:
+                self.flush(dependency)
+
+        records, self.pending[label] = self.pending[label], []
+        if not records:
+            return
+        with write_transaction():
+            getattr(self, f'import_{model_for(label)._meta.model_name}')(records)
+        self.counts[label] += len(records)
+        if self.progress:
+            self.progress(label, len(records), self.counts[label])
+
+    def finish(self):
+        for label in LABELS:
+            self.flush(label)
+        if self.counts:
+            # Every cached entry is keyed on the category epoch
+            caching.invalidate_categories()
+        return self.counts
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+
+    def import_usermodel(self, records):
+        users = []
+        for record in records:
+            user, _ = build(UserModel, record, DERIVED_FIELDS[USERS])
+            user.email = UserModel.objects.normalize_email(user.email)
+            if not user.username:
+                user.username = user.email.split('@')[0]
+            if not user.slug:
+                user.slug = f"{slugify(user.username)}-{uuid.uuid4().hex[:8]}"
+            if not user.password:
+                user.set_unusable_password()
+            users.append(user)
+        UserModel.objects.bulk_create(users)
+
+    def import_category(self, records):
+        categories = []
+        for record in records:
+            category, _ = build(Category, record)
+            if not category.slug:
+                category.slug = slugify(category.name)
+            categories.append(category)
+        Category.objects.bulk_create(categories)
+
+    def import_post(self, records):
+        posts, categories = [], []
+        for record in records:
+            post, many = build(Post, record, DERIVED_FIELDS[POSTS])
+            if not post.slug:
+                post.slug = f"{slugify(post.title)}-{uuid.uuid4().hex[:6]}"
+            posts.append(post)
+            categories.append(many.get('categories', []))
+
+        bodies = [post.body for post in posts]
+        contents = self.pool.map(extract_content, bodies, chunksize=64) if self.pool else map(extract_content, bodies)
+        for post, content in zip(posts, contents):
+            post.excerpt = content.excerpt
+            post.plain_text = content.plain_text
+            post.word_count = content.word_count
+            post.reading_time = content.reading_time
+
+        Post.all_objects.bulk_create(posts)
+
+        Link = Post.categories.through
+        Link.objects.bulk_create([
+            Link(post_id=post.pk, category_id=category_id)
+            for post, category_ids in zip(posts, categories) for category_id in category_ids
+        ])
+
+        self.index_tags(posts)
+        self.count_posts(posts)
+        search.index_posts(posts)
+
+    def index_tags(self, posts):
+        post_tags = [(post, tagging.normalize_tags(post.tags)) for post in posts]
+        names = {}
+        for _, normalized in post_tags:
+            for slug, name in normalized.items():
+                names.setdefault(slug, name)
+        if not names:
+            return
+
+        tags = tagging.get_or_create_tags(names)
+        PostTag.objects.bulk_create([
+            PostTag(post_id=post.pk, tag=tags[slug]) for post, normalized in post_tags for slug in normalized
+        ])
+
+        tagging.adjust_counts_by(
+            Counter(slug for post, normalized in post_tags if post.is_public for slug in normalized)
+        )
+
+    def count_posts(self, posts):
+        counts = defaultdict(Counter)
+        for post in posts:
+            counts[post.author_id][post.counter_field()] += 1
+        for author_id, fields in counts.items():
+            UserModel.objects.filter(pk=author_id).update(
+                **{field: F(field) + count for field, count in fields.items()}
+            )
+
+
+# -------------------------------
+# Export
+# -------------------------------
+def export_queryset(label):
+    if label == POSTS:
+        return Post.all_objects.prefetch_related(Prefetch('categories', queryset=Category.objects.only('pk')))
+    return model_for(label)._default_manager.all()
+
+
+def export_records(label, chunk_size=2000):
+    """Fixture records for every row of ``label``, read ``chunk_size`` rows at a time."""
+    model = model_for(label)
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in DERIVED_FIELDS[label]
+    ]
+    many = [field for field in model._meta.many_to_many if label == POSTS]
+
+    for instance in export_queryset(label).order_by('pk').iterator(chunk_size=chunk_size):
+        values = {}
+        for field in fields:
+            value = field.value_from_object(instance)
+            if isinstance(field, FileField):
+                value = value.name if value else (None if field.null else '')
+            values[field.name] = value
+        for field in many:
+            values[field.name] = [related.pk for related in getattr(instance, field.name).all()]
+        yield {'model': label, 'pk': instance.pk, 'fields': values}
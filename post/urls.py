@@ -1,12 +1,18 @@
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework import routers
-from .views import PostViewset , CategoryViewset
+from .views import PostViewset , CategoryViewset , TagViewset
+from .views import PostListView, PostDetailView, CategoryListView
 
 router = routers.DefaultRouter()
 router.register(r'posts', PostViewset, basename='post')
 router.register(r'categories', CategoryViewset, basename='category')
+router.register(r'tags', TagViewset, basename='tag')
 
 
 urlpatterns = [
+    # Async reads; the router keeps the viewset actions, formats and the API root
+    path('posts/', PostListView.as_view(), name='post-list'),
+    re_path(r'^posts/(?!(?:search|bulk)/$)(?P<slug>[^/.]+)/$', PostDetailView.as_view(), name='post-detail'),
+    path('categories/', CategoryListView.as_view(), name='category-list'),
     path('', include(router.urls)),
 ]
@@ -1,16 +1,32 @@
-from rest_framework import viewsets, status
+from rest_framework import exceptions, viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated, IsAdminUser , IsAuthenticatedOrReadOnly
+from django.conf import settings
 from django.db import models
 
-from .models import Post, Category
-from .serializers import PostSerializer, CategorySerializer
+from .models import Post, Category, Tag
+from .serializers import PostSerializer, PostBulkSerializer, CategorySerializer, TagSerializer
+from .filters import TagFilterBackend, CategoryFilterBackend
+from . import bulk, caching
+from .caching import PublicResponseCacheMixin
 from rest_framework.decorators import action
+from user_management.authentication import ClaimsJWTAuthentication
 from user_management.permissions import IsUserActive,IsVerifiedUser
+from cms.queryplan import QueryPlanMixin
+from cms.pagination import PostCursorPagination
+from cms.conditional import ConditionalGetMixin
+from cms.asyncapi import AsyncReadView
+from .search import search_posts
 
-class PostViewset(viewsets.ModelViewSet):
+class PostViewset(PublicResponseCacheMixin, ConditionalGetMixin, QueryPlanMixin, viewsets.ModelViewSet):
     serializer_class = PostSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
     lookup_field = 'slug'
+    pagination_class = PostCursorPagination
+    filter_backends = [CategoryFilterBackend, TagFilterBackend]
+    planned_actions = ('list', 'retrieve', 'search')
+    # page + categories prefetch (the list validators run no query)
+    query_budget = 2
 
     def get_queryset(self):
         user = self.request.user
@@ -19,18 +35,18 @@ class PostViewset(viewsets.ModelViewSet):
         if user.is_authenticated and user.is_superuser:
             return Post.all_objects.all()
 
-        # Logged-in user → only their posts
+        # Logged-in user → only their posts (by id: user may be a ClaimsUser)
         if user.is_authenticated:
-            return Post.all_objects.filter(author=user)
+            return Post.all_objects.filter(author_id=user.pk)
 
         # Public → only published posts
         return Post.objects.filter(is_published=True)
 
     def get_permissions(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'search']:
             permission_classes = [AllowAny]
 
-        elif self.action in ['create', 'update', 'partial_update', 'destroy', 'draft', 'publish']:
+        elif self.action in ['create', 'update', 'partial_update', 'destroy', 'draft', 'publish', 'bulk']:
             permission_classes = [IsAuthenticated, IsUserActive, IsVerifiedUser]
 
         else:
@@ -38,6 +54,77 @@ class PostViewset(viewsets.ModelViewSet):
 
         return [perm() for perm in permission_classes]
 
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        """Full-text search: ?q=<words>, BM25-ranked with highlighted snippets."""
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response(
+                {"message": "Provide a search query with ?q="},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        limit = self.paginator.get_page_size(request)
+        # ?category= / ?tag= narrow the search itself, not just the rows loaded for it
+        queryset = self.filter_queryset(self.get_queryset())
+        matches = search_posts(queryset, text, limit=limit)
+
+        posts = {post.pk: post for post in queryset.filter(pk__in=[pk for pk, _, _ in matches])}
+
+        results = []
+        for pk, rank, snippet in matches:
+            if pk not in posts:
+                # Changed between the two queries
+                continue
+            data = self.get_serializer(posts[pk]).data
+            data['rank'] = rank
+            data['snippet'] = snippet
+            results.append(data)
+
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    def get_related_last_modified(self):
+        # Category names are embedded in every post
+        return Category.objects.aggregate(last_modified=models.Max('updated_at'))['last_modified']
+
+    async def aget_related_last_modified(self):
+        return (await Category.objects.aaggregate(last_modified=models.Max('updated_at')))['last_modified']
+
+    # Validators. The post.caching version stamps move on every change a
+    # payload can show (post saves, category edits and deletes, author
+    # renames), so they make the ETag: lists need no aggregate over the
+    # visible rows, and a detail only its own row.
+    def visibility(self):
+        user = self.request.user
+        return user.is_authenticated and user.is_superuser
+
+    def list_validators(self):
+        versions = caching.scope_versions(self.request, 'list')
+        return self.make_validators(None, self.visibility(), *versions)
+
+    async def alist_validators(self):
+        versions = await caching.ascope_versions(self.request, 'list')
+        return self.make_validators(None, self.visibility(), *versions)
+
+    def retrieve_validator_queryset(self):
+        return super().retrieve_validator_queryset().values_list('pk', 'updated_at', 'author__updated_at')
+
+    def retrieve_validators(self):
+        row = self.retrieve_validator_queryset().first()
+        if row is None:
+            return None, None
+        versions = caching.scope_versions(self.request, 'retrieve', self.kwargs['slug'])
+        return self.make_validators(max(row[1], row[2]), row[0], *versions, related=self.get_related_last_modified())
+
+    async def aretrieve_validators(self):
+        row = await self.retrieve_validator_queryset().afirst()
+        if row is None:
+            return None, None
+        versions = await caching.ascope_versions(self.request, 'retrieve', self.kwargs['slug'])
+        return self.make_validators(
+            max(row[1], row[2]), row[0], *versions, related=await self.aget_related_last_modified()
+        )
+
     def perform_update(self, serializer):
         serializer.save()
 
@@ -113,20 +200,157 @@ class PostViewset(viewsets.ModelViewSet):
         )
 
 
-class CategoryViewset(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Publish, draft, delete or restore many posts:
+        {"operation": ..., "slugs": [...]}, or no slugs and ?category= / ?tag= filters.
+        """
+        serializer = PostBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operation = serializer.validated_data['operation']
+        slugs = list(dict.fromkeys(serializer.validated_data.get('slugs', [])))
+
+        # Restoring is admin-only, as for a single post
+        if operation == 'restore' and not IsAdminUser().has_permission(request, self):
+            self.permission_denied(request, message="Only admins can restore posts")
+
+        # Only the user's own posts (every post for admins): ownership is part of the query
+        if slugs:
+            queryset = self.get_queryset().filter(slug__in=slugs)
+        elif any(request.query_params.get(param) for param in ('category', 'tag', 'tags_all')):
+            queryset = self.filter_queryset(self.get_queryset())
+        else:
+            return Response(
+                {"message": "Provide slugs, or select posts with ?category= or ?tag="},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            found = bulk.apply(queryset, operation, limit=settings.POST_BULK_LIMIT)
+        except bulk.TooManyPosts as exc:
+            return Response({"message": f"{exc}; narrow the filter"}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = [{"slug": slug, "status": found.get(slug, bulk.NOT_FOUND)} for slug in slugs or found]
+        return Response({
+            "operation": operation,
+            "updated": list(found.values()).count(bulk.UPDATED),
+            "results": results,
+        }, status=status.HTTP_200_OK)
+
+
+class CategoryViewset(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     Get categories list + detail by slug.
     """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
+    authentication_classes = [ClaimsJWTAuthentication]
     lookup_field = 'slug'
 
     def get_permissions(self):
         if self.action in ['list', 'retrieve']:
             permission_classes = [IsAuthenticatedOrReadOnly]
-        if self.action in ['create', 'update', 'partial_update', 'destroy']:
+        elif self.action in ['create', 'update', 'partial_update', 'destroy']:
             permission_classes = [IsAuthenticated,IsVerifiedUser, IsUserActive]
         else:
             permission_classes = [IsAdminUser]
         return [perm() for perm in permission_classes]
     
+
+
+
+class TagViewset(viewsets.ReadOnlyModelViewSet):
+    """
+    Tag cloud: tags with their published post counts, most used first.
+    """
+    queryset = Tag.objects.filter(post_count__gt=0)
+    serializer_class = TagSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    lookup_field = 'slug'
+    permission_classes = [AllowAny]
+
+
+# -------------------------------
+# Async read path
+# -------------------------------
+class ViewsetReadView(AsyncReadView):
+    """
+    GET/HEAD of a viewset URL on the event loop, other methods through the
+    viewset itself.
+
+    The handlers drive a viewset instance for ``action``, so querysets,
+    visibility, filters, the query plan, pagination and validators are the
+    viewset's own; only the queries run on the async ORM. With the plan's
+    ``select_related``/``prefetch_related`` loaded up front, serializing the
+    rows needs no further queries and runs on the loop as well.
+    """
+    viewset_class = None
+    action = None
+
+    def get_viewset(self, request, kwargs):
+        viewset = self.viewset_class(request=request, args=(), kwargs=kwargs, action=self.action, format_kwarg=None)
+        viewset.check_permissions(request)
+        return viewset
+
+
+class PostListView(ViewsetReadView):
+    viewset_class = PostViewset
+    authentication_classes = PostViewset.authentication_classes
+    action = 'list'
+    fallback = staticmethod(PostViewset.as_view({'post': 'create'}))
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request, kwargs)
+        if request.user.is_authenticated:
+            return await self.list(viewset, request)
+        key = await caching.aresponse_key(request, 'list')
+        return await caching.acached_response(key, lambda: self.list(viewset, request), request)
+
+    async def list(self, viewset, request):
+        return await viewset.aconditional_response(await viewset.alist_validators(), self.render, request, viewset)
+
+    async def render(self, request, viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        page = await viewset.paginator.apaginate_queryset(queryset, request, view=viewset)
+        return viewset.get_paginated_response(viewset.get_serializer(page, many=True).data)
+
+
+class PostDetailView(ViewsetReadView):
+    viewset_class = PostViewset
+    authentication_classes = PostViewset.authentication_classes
+    action = 'retrieve'
+    fallback = staticmethod(PostViewset.as_view({'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}))
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request, kwargs)
+        if request.user.is_authenticated:
+            return await self.retrieve(viewset, request)
+        key = await caching.aresponse_key(request, 'retrieve', slug=kwargs['slug'])
+        return await caching.acached_response(key, lambda: self.retrieve(viewset, request), request)
+
+    async def retrieve(self, viewset, request):
+        return await viewset.aconditional_response(await viewset.aretrieve_validators(), self.render, request, viewset)
+
+    async def render(self, request, viewset):
+        queryset = viewset.filter_queryset(viewset.get_queryset())
+        try:
+            post = await queryset.aget(slug=viewset.kwargs['slug'])
+        except Post.DoesNotExist:
+            raise exceptions.NotFound("No Post matches the given query.")
+        return Response(viewset.get_serializer(post).data)
+
+
+class CategoryListView(ViewsetReadView):
+    viewset_class = CategoryViewset
+    authentication_classes = CategoryViewset.authentication_classes
+    action = 'list'
+    fallback = staticmethod(CategoryViewset.as_view({'post': 'create'}))
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request, kwargs)
+        return await viewset.aconditional_response(await viewset.alist_validators(), self.render, request, viewset)
+
+    async def render(self, request, viewset):
+        categories = [category async for category in viewset.filter_queryset(viewset.get_queryset())]
+        return Response(viewset.get_serializer(categories, many=True).data)
@@ -1,6 +1,13 @@
 from django.contrib import admin
-from .models import UserModel,EmailOtp
+from .models import UserModel,EmailOtp,EmailOutbox
 # Register your models here.
 
 admin.site.register(EmailOtp)
-admin.site.register(UserModel)
\ No newline at end of file
+admin.site.register(UserModel)
+
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(admin.ModelAdmin):
+    list_display = ('to', 'subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('to', 'subject')
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
 
 
 class UserManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user_management'
+
+    def ready(self):
+        from .authentication import user_changed
+        from .models import UserModel
+        post_save.connect(user_changed, sender=UserModel)
+        post_delete.connect(user_changed, sender=UserModel)
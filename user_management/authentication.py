@@ -0,0 +1,169 @@
+"""
+JWT authentication with a cached user lookup.
+
+simplejwt's ``JWTAuthentication`` loads the whole ``UserModel`` row on every
+request, only for the permission classes to read a few flags off it.
+``CachedJWTAuthentication`` loads ``AUTH_USER_FIELDS`` instead and keeps
+them in two layers:
+
+* a per-process dict, for ``AUTH_USER_LOCAL_TTL`` seconds;
+* the shared Django cache, for ``AUTH_USER_CACHE_TTL`` seconds.
+
+The user is rebuilt with ``UserModel.from_db``, so it is a normal model
+instance whose other fields are deferred (loaded on first access).
+
+``ClaimsJWTAuthentication`` goes one step further for safe methods: when
+``AUTH_TOKEN_CLAIMS`` put ``UserModel.CLAIM_FIELDS`` in the token, the user
+is a ``ClaimsUser`` built from those signed claims, and the only check is
+that the token's ``claims_version`` still matches the user's (read from the
+same two cache layers). Any change to a claim field bumps the version, so
+stale claims fall back to the cached row.
+``user_changed`` drops both layers whenever a user is saved or deleted, which
+covers ``lock``/``unlock`` and soft delete in ``UserViewSet``. Other
+processes may keep serving their local copy for up to
+``AUTH_USER_LOCAL_TTL`` seconds, so that TTL is kept short.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from cms import routers
+
+from .models import UserModel
+
+
+# What the permission classes, post and file views read from request.user
+AUTH_USER_FIELDS = (
+    'id', 'email', 'username', 'slug',
+    'is_active', 'is_verified', 'is_staff', 'is_superuser', 'is_deleted', 'claims_version',
+)
+# from_db() takes a field subset in model field order
+_LOADED_FIELDS = tuple(
+    field.attname for field in UserModel._meta.concrete_fields if field.attname in AUTH_USER_FIELDS
+)
+
+# Bound on the per-process layer; expired entries are dropped when it fills up
+LOCAL_MAX_ENTRIES = 10000
+
+_local = {}
+_local_lock = threading.Lock()
+
+
+def cache_key(user_id):
+    return f'authuser:{user_id}'
+
+
+def load_values(user_id):
+    """The ``AUTH_USER_FIELDS`` values of a user, or ``None`` if there is no such user."""
+    # Token claims carry the id as a string; key every layer by the string form
+    user_id = str(user_id)
+    now = time.monotonic()
+    with _local_lock:
+        entry = _local.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+
+    values = cache.get(cache_key(user_id))
+    if values is None:
+        # Cached for AUTH_USER_CACHE_TTL: a replica could still see a locked user as active
+        with routers.primary():
+            values = UserModel.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).values_list(
+                *_LOADED_FIELDS
+            ).first()
+        if values is None:
+            return None
+        values = tuple(values)
+        cache.set(cache_key(user_id), values, settings.AUTH_USER_CACHE_TTL)
+
+    with _local_lock:
+        if len(_local) >= LOCAL_MAX_ENTRIES:
+            for key in [key for key, (expires, _values) in _local.items() if expires <= now]:
+                del _local[key]
+            if len(_local) >= LOCAL_MAX_ENTRIES:
+                _local.clear()
+        _local[user_id] = (now + settings.AUTH_USER_LOCAL_TTL, values)
+    return values
+
+
+def invalidate(user_id):
+    user_id = str(user_id)
+    with _local_lock:
+        _local.pop(user_id, None)
+    cache.delete(cache_key(user_id))
+
+
+def user_changed(sender, instance, **kwargs):
+    """``post_save``/``post_delete`` receiver for ``UserModel``."""
+    user_id = getattr(instance, api_settings.USER_ID_FIELD)
+    invalidate(user_id)
+    # A request between now and commit may cache the old row again
+    transaction.on_commit(lambda: invalidate(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if api_settings.CHECK_REVOKE_TOKEN:
+            # Needs the password hash, which is deliberately not cached
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        values = load_values(user_id)
+        if values is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        user = UserModel.from_db(UserModel.objects.db, _LOADED_FIELDS, values)
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class ClaimsUser(TokenUser):
+    """``request.user`` built from token claims; other claims read as attributes (``user.slug``)."""
+
+    @cached_property
+    def id(self):
+        return UserModel._meta.pk.to_python(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def pk(self):
+        return self.id
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', False)
+
+    @cached_property
+    def is_verified(self):
+        return self.token.get('is_verified', False)
+
+
+class ClaimsJWTAuthentication(CachedJWTAuthentication):
+    """Opt-in per view: claims for safe methods, the cached row for writes."""
+
+    def authenticate(self, request):
+        self.use_claims = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        if self.use_claims and 'claims_version' in validated_token:
+            user = ClaimsUser(validated_token)
+            values = load_values(user.id)
+            if values is not None and values[_LOADED_FIELDS.index('claims_version')] == validated_token['claims_version']:
+                if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+                    raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+                return user
+        return super().get_user(validated_token)
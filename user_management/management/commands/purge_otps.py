@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user_management import otp
+
+
+class Command(BaseCommand):
+    help = "Delete expired and used one-time codes in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = otp.get_store().purge(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {deleted} one-time codes in {time.perf_counter() - started:.2f}s."
+        ))
@@ -0,0 +1,53 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from user_management import outbox
+
+
+class Command(BaseCommand):
+    help = "Send queued emails from the outbox, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=settings.EMAIL_OUTBOX_MAX_ATTEMPTS)
+        parser.add_argument('--lease', type=int, default=settings.EMAIL_OUTBOX_LEASE)
+        parser.add_argument('--once', action='store_true', help="Drain what is due now, then exit.")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Seconds between polls when idle.")
+
+    def handle(self, *args, **options):
+        self.report_stats()
+        try:
+            while True:
+                started = time.perf_counter()
+                sent, retried, dead = outbox.drain(
+                    batch_size=options['batch_size'],
+                    max_attempts=options['max_attempts'],
+                    lease=options['lease'],
+                    report=self.report_batch,
+                )
+                elapsed = time.perf_counter() - started
+                if sent or retried or dead:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"Sent {sent}, retrying {retried}, dead {dead} in {elapsed:.2f}s "
+                        f"({sent / elapsed if elapsed else 0:.1f} emails/s)."
+                    ))
+                    self.report_stats()
+                if options['once']:
+                    break
+
+                close_old_connections()
+                time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+
+    def report_batch(self, sent, retried, dead, seconds):
+        self.stdout.write(f"  batch: {sent} sent, {retried} to retry, {dead} dead in {seconds:.2f}s")
+
+    def report_stats(self):
+        stats = outbox.stats()
+        self.stdout.write(
+            f"Outbox: {stats['pending']} pending, {stats['dead']} dead, lag {stats['lag']:.1f}s"
+        )
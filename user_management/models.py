@@ -5,6 +5,8 @@ from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.utils.text import slugify
 from django.utils import timezone
 
+from cms import images
+
 
 # -------------------------------
 # Custom User Manager
@@ -12,14 +14,20 @@ from django.utils import timezone
 class CustomUserManager(BaseUserManager):
     use_in_migrations = True
 
-    def create_user(self, email, password=None, **extra_fields):
-        """Create and save a regular user with email and password"""
+    def create_user(self, email, password=None, password_hash=None, **extra_fields):
+        """
+        Create and save a regular user with email and password. Callers that
+        hashed the password already (off the request thread) pass ``password_hash``.
+        """
         if not email:
             raise ValueError("The Email field must be set")
         email = self.normalize_email(email)
         extra_fields.setdefault('username', email.split('@')[0])
         user = self.model(email=email, **extra_fields)
-        user.set_password(password)
+        if password_hash is not None:
+            user.password = password_hash
+        else:
+            user.set_password(password)
         if not user.slug:
             user.slug = slugify(user.username) + "-" + str(uuid.uuid4())[:8]
         user.save(using=self._db)
@@ -60,10 +68,19 @@ class UserModel(AbstractUser):
     address = models.TextField(blank=True, null=True)
     slug = models.SlugField(unique=True, blank=True)
     profile_pic = models.ImageField(upload_to=user_profile_pic_path, blank=True, null=True)
+    # Resized copies of the profile picture, written by cms.images
+    profile_pic_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     # Custom fields
     is_verified = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
+    # Bumped when a field in CLAIM_FIELDS changes; older token claims stop being trusted
+    claims_version = models.PositiveIntegerField(default=0, editable=False)
+
+    # Post counters, maintained with F() updates by Post.save (see post.models.Post.counter_field)
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
+    draft_post_count = models.PositiveIntegerField(default=0, editable=False)
+    deleted_post_count = models.PositiveIntegerField(default=0, editable=False)
 
     date_joined = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
@@ -73,9 +90,28 @@ class UserModel(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []  # username is optional since Django auto-creates one
 
+    # Copied into access tokens when AUTH_TOKEN_CLAIMS is on (see views.get_tokens_for_user)
+    CLAIM_FIELDS = ('slug', 'is_active', 'is_verified', 'is_staff', 'is_superuser')
+    # Never written by save() on an existing row: a loaded copy may be stale
+    COUNTER_FIELDS = ('published_post_count', 'draft_post_count', 'deleted_post_count')
+    # Stored by from_db, so save() (and post_save receivers) can tell what changed;
+    # post payloads embed the username
+    TRACKED_FIELDS = ('profile_pic', 'username', *CLAIM_FIELDS)
+
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "Users"
+        indexes = [
+            models.Index(fields=['-date_joined', '-id'], name='user_joined_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: values[field_names.index(name)] for name in cls.TRACKED_FIELDS if name in field_names
+        }
+        return instance
 
     def __str__(self):
         return self.email
@@ -91,18 +127,52 @@ class UserModel(AbstractUser):
         if not self.slug:
             base_slug = slugify(self.username or self.email.split('@')[0])
             self.slug = f"{base_slug}-{uuid.uuid4().hex[:8]}"
+
+        picture_changed = images.image_changed(self, 'profile_pic')
+        if picture_changed:
+            self.profile_pic_derivatives = {}
+
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.attname not in deferred and field.name not in self.COUNTER_FIELDS
+            ]
+
+        loaded = getattr(self, '_loaded_values', {})
+        if any(name in loaded and getattr(self, name) != loaded[name] for name in self.CLAIM_FIELDS):
+            self.claims_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'claims_version'}
         super().save(*args, **kwargs)
 
+        deferred = self.get_deferred_fields()
+        self._loaded_values = {
+            name: getattr(self, name) for name in ('username', *self.CLAIM_FIELDS) if name not in deferred
+        }
+        if 'profile_pic' not in deferred:
+            self._loaded_values['profile_pic'] = self.profile_pic.name
+        if picture_changed:
+            images.schedule(self, 'profile_pic')
+
 
 # -------------------------------
 # OTP Model for Email Verification
 # -------------------------------
 class EmailOtp(models.Model):
+    """One-time code, issued and consumed through ``user_management.otp``."""
+    VERIFY = 'verify'
+    RESET = 'reset'
+    PURPOSE_CHOICES = [(VERIFY, 'Email verification'), (RESET, 'Password reset')]
+
     user = models.ForeignKey(UserModel, on_delete=models.CASCADE, related_name="otp_codes")
     email = models.EmailField()
     otp = models.CharField(max_length=6)
+    purpose = models.CharField(max_length=10, choices=PURPOSE_CHOICES, default=VERIFY)
     created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
+    failed_attempts = models.PositiveSmallIntegerField(default=0)
 
     def __str__(self):
         return f"OTP for {self.email} - {self.otp}"
@@ -111,3 +181,61 @@ class EmailOtp(models.Model):
         verbose_name = "Email OTP"
         verbose_name_plural = "Email OTPs"
         get_latest_by = 'created_at'
+        indexes = [
+            # filter(email=..., otp=..., is_used=False).latest()
+            models.Index(
+                fields=['email', 'otp', '-created_at'],
+                condition=models.Q(is_used=False),
+                name='emailotp_unused_lookup_idx',
+            ),
+            # purge_otps: expired rows, oldest first
+            models.Index(fields=['expires_at'], name='emailotp_expiry_idx'),
+        ]
+
+
+# -------------------------------
+# Outgoing Email Queue
+# -------------------------------
+class EmailOutbox(models.Model):
+    """
+    An email waiting to be sent by ``manage.py send_outbox``.
+
+    Rows are written in the request's transaction, so an email exists if and
+    only if the change that triggered it was committed.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (DEAD, 'Dead')]
+
+    to = models.EmailField()
+    from_email = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255)
+    text_body = models.TextField()
+    html_body = models.TextField(blank=True)
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Earliest time the sender may (re)try; also the lease of a claimed row
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.UUIDField(null=True, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to} ({self.status})"
+
+    class Meta:
+        verbose_name = "Outgoing email"
+        verbose_name_plural = "Outgoing emails"
+        indexes = [
+            # The sender's claim: due pending rows, oldest first
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(status='pending'),
+                name='emailoutbox_due_idx',
+            ),
+            models.Index(fields=['claim_token'], name='emailoutbox_claim_idx'),
+        ]
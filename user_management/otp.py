@@ -0,0 +1,165 @@
+"""
+One-time code stores.
+
+``get_store()`` returns the store named by ``settings.OTP_STORE``:
+
+``DatabaseOtpStore``
+    ``EmailOtp`` rows. Lookups go through the partial index on unused codes
+    and are bounded by ``expires_at`` in SQL; a code is consumed by one
+    conditional UPDATE, so two requests can never both use it.
+    ``purge_otps`` deletes expired and used rows in batches.
+
+``CacheOtpStore``
+    One cache entry per email and purpose, expiring with the code. Consuming
+    relies on ``cache.delete()`` reporting whether it removed the key, so
+    only one request wins; attempts are counted with ``cache.incr``.
+
+Both allow ``OTP_MAX_ATTEMPTS`` wrong codes per email and purpose before the
+live code stops working, and issuing a code replaces any earlier one.
+"""
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from cms.db import write_transaction
+
+from .models import EmailOtp
+
+
+class OtpError(Exception):
+    """A code could not be consumed; ``str(error)`` is safe to show the user."""
+
+
+class InvalidOtp(OtpError):
+    def __init__(self, message="Invalid or expired OTP."):
+        super().__init__(message)
+
+
+class TooManyAttempts(OtpError):
+    def __init__(self, message="Too many incorrect attempts. Please request a new OTP."):
+        super().__init__(message)
+
+
+def generate_code():
+    return f"{secrets.randbelow(10 ** 6):06d}"
+
+
+class BaseOtpStore:
+    @property
+    def ttl(self):
+        return timedelta(seconds=settings.OTP_TTL)
+
+    @property
+    def max_attempts(self):
+        return settings.OTP_MAX_ATTEMPTS
+
+    def issue(self, user, email, purpose):
+        """Create a code for ``email``, invalidating earlier ones; returns it."""
+        raise NotImplementedError
+
+    def consume(self, email, purpose, code):
+        """Use ``code`` once; returns the user id or raises ``OtpError``."""
+        raise NotImplementedError
+
+    def purge(self, batch_size=1000):
+        """Delete expired and used codes; returns how many were removed."""
+        return 0
+
+
+class DatabaseOtpStore(BaseOtpStore):
+    def live(self, email, purpose):
+        return EmailOtp.objects.filter(
+            email=email, purpose=purpose, is_used=False, expires_at__gt=timezone.now(),
+        )
+
+    def issue(self, user, email, purpose):
+        code = generate_code()
+        with write_transaction():
+            self.live(email, purpose).update(is_used=True)
+            EmailOtp.objects.create(
+                user=user, email=email, otp=code, purpose=purpose,
+                expires_at=timezone.now() + self.ttl,
+            )
+        return code
+
+    def consume(self, email, purpose, code):
+        live = self.live(email, purpose)
+        match = live.filter(otp=code).order_by('-created_at').values_list('pk', 'user_id', 'failed_attempts').first()
+
+        if match is None:
+            live.filter(failed_attempts__lt=self.max_attempts).update(failed_attempts=F('failed_attempts') + 1)
+            if live.filter(failed_attempts__gte=self.max_attempts).exists():
+                raise TooManyAttempts()
+            raise InvalidOtp()
+
+        pk, user_id, failed_attempts = match
+        if failed_attempts >= self.max_attempts:
+            raise TooManyAttempts()
+
+        # The conditions are re-checked by the UPDATE itself: only one caller wins
+        used = EmailOtp.objects.filter(
+            pk=pk, is_used=False, expires_at__gt=timezone.now(), failed_attempts__lt=self.max_attempts,
+        ).update(is_used=True)
+        if not used:
+            raise InvalidOtp()
+        return user_id
+
+    def purge(self, batch_size=1000):
+        stale = EmailOtp.objects.filter(Q(expires_at__lte=timezone.now()) | Q(is_used=True))
+        deleted = 0
+        while True:
+            # Short transactions: each batch holds the write lock only briefly
+            ids = list(stale.order_by('expires_at').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            deleted += EmailOtp.objects.filter(pk__in=ids).delete()[0]
+
+
+class CacheOtpStore(BaseOtpStore):
+    key_prefix = 'otp'
+
+    def key(self, email, purpose):
+        return f'{self.key_prefix}:{purpose}:{email.lower()}'
+
+    def attempts_key(self, email, purpose):
+        return f'{self.key(email, purpose)}:attempts'
+
+    def issue(self, user, email, purpose):
+        code = generate_code()
+        timeout = int(self.ttl.total_seconds())
+        cache.set_many({
+            self.key(email, purpose): {'code': code, 'user_id': user.pk},
+            self.attempts_key(email, purpose): 0,
+        }, timeout)
+        return code
+
+    def consume(self, email, purpose, code):
+        key, attempts_key = self.key(email, purpose), self.attempts_key(email, purpose)
+        entry = cache.get(key)
+        if entry is None:
+            raise InvalidOtp()
+
+        if not secrets.compare_digest(entry['code'], str(code)):
+            try:
+                attempts = cache.incr(attempts_key)
+            except ValueError:
+                attempts = self.max_attempts
+            if attempts >= self.max_attempts:
+                cache.delete(key)
+                raise TooManyAttempts()
+            raise InvalidOtp()
+
+        # delete() reports whether this call removed the key: only one caller wins
+        if not cache.delete(key):
+            raise InvalidOtp()
+        cache.delete(attempts_key)
+        return entry['user_id']
+
+
+def get_store():
+    return import_string(settings.OTP_STORE)()
@@ -0,0 +1,155 @@
+"""
+Transactional email outbox.
+
+``enqueue`` only inserts an ``EmailOutbox`` row, inside whatever transaction
+the caller is in; nothing talks to SMTP on the request path. The
+``send_outbox`` command drains the table:
+
+* a batch of due rows is claimed with a single UPDATE that stamps a claim
+  token and pushes ``next_attempt_at`` out by a lease, so concurrent senders
+  never pick the same rows and rows of a crashed sender become due again;
+* the batch goes out over one SMTP connection, opened once and reused;
+* a failed row is retried with exponential backoff and dead-lettered
+  (``status='dead'``) after ``EMAIL_OUTBOX_MAX_ATTEMPTS``.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import EmailOutbox
+
+
+def enqueue(to, subject, text_body, html_body='', from_email=None):
+    return EmailOutbox.objects.create(
+        to=to,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        subject=subject,
+        text_body=text_body,
+        html_body=html_body,
+    )
+
+
+def backoff(attempts):
+    """Delay before retry number ``attempts`` (1-based): base, 2x base, 4x base..."""
+    delay = settings.EMAIL_OUTBOX_BACKOFF * 2 ** (attempts - 1)
+    return timedelta(seconds=min(delay, settings.EMAIL_OUTBOX_MAX_BACKOFF))
+
+
+def claim_batch(batch_size, lease=None):
+    """Claim up to ``batch_size`` due rows for this sender and return them."""
+    now = timezone.now()
+    lease = lease if lease is not None else settings.EMAIL_OUTBOX_LEASE
+    token = uuid.uuid4()
+
+    due = EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+    ids = due.order_by('next_attempt_at', 'id').values('id')[:batch_size]
+    # Re-checking the due condition makes the claim safe against a concurrent sender
+    claimed = due.filter(id__in=ids).update(
+        claim_token=token,
+        next_attempt_at=now + timedelta(seconds=lease),
+    )
+    if not claimed:
+        return []
+    return list(EmailOutbox.objects.filter(claim_token=token).order_by('id'))
+
+
+def build_message(row, connection):
+    message = EmailMultiAlternatives(
+        row.subject, row.text_body, row.from_email, [row.to], connection=connection,
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, 'text/html')
+    return message
+
+
+def deliver(rows, connection, max_attempts=None):
+    """
+    Send claimed ``rows`` over ``connection`` (opened by the caller) and record
+    the outcome. Returns ``(sent, retried, dead)`` counts.
+    """
+    max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    sent_ids, retried, dead = [], 0, 0
+
+    for row in rows:
+        try:
+            if connection.send_messages([build_message(row, connection)]) != 1:
+                raise RuntimeError("Backend accepted no message.")
+        except Exception as exc:
+            attempts = row.attempts + 1
+            failed = {
+                'attempts': attempts,
+                'last_error': f"{type(exc).__name__}: {exc}",
+                'claim_token': None,
+            }
+            if attempts >= max_attempts:
+                failed['status'] = EmailOutbox.DEAD
+                dead += 1
+            else:
+                failed['next_attempt_at'] = timezone.now() + backoff(attempts)
+                retried += 1
+            EmailOutbox.objects.filter(pk=row.pk).update(**failed)
+
+            # The connection may be unusable now; start the next row on a fresh one
+            connection.close()
+            try:
+                connection.open()
+            except Exception:
+                pass
+            continue
+        sent_ids.append(row.pk)
+
+    if sent_ids:
+        EmailOutbox.objects.filter(pk__in=sent_ids).update(
+            status=EmailOutbox.SENT, sent_at=timezone.now(), claim_token=None,
+        )
+    return len(sent_ids), retried, dead
+
+
+def drain(batch_size=None, max_attempts=None, lease=None, report=None):
+    """
+    Send every currently due email, batch by batch, over one connection.
+    ``report(sent, retried, dead, seconds)`` is called after each batch.
+    Returns the totals.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    totals = [0, 0, 0]
+    connection = None
+    try:
+        while True:
+            rows = claim_batch(batch_size, lease)
+            if not rows:
+                break
+            if connection is None:
+                connection = get_connection(fail_silently=False)
+                try:
+                    connection.open()
+                except Exception:
+                    # Each send retries the connection and records its own failure
+                    pass
+
+            started = timezone.now()
+            counts = deliver(rows, connection, max_attempts)
+            for index, count in enumerate(counts):
+                totals[index] += count
+            if report is not None:
+                report(*counts, (timezone.now() - started).total_seconds())
+    finally:
+        if connection is not None:
+            connection.close()
+    return tuple(totals)
+
+
+def stats():
+    """Queue depth, dead letters and lag (age in seconds of the oldest due email)."""
+    now = timezone.now()
+    pending = EmailOutbox.objects.filter(status=EmailOutbox.PENDING)
+    oldest = pending.filter(next_attempt_at__lte=now).aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'dead': EmailOutbox.objects.filter(status=EmailOutbox.DEAD).count(),
+        'lag': (now - oldest).total_seconds() if oldest else 0.0,
+    }
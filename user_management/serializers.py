@@ -1,14 +1,13 @@
 from rest_framework import serializers
-from django.contrib.auth import authenticate
 from django.utils.text import slugify
 from django.contrib.auth.password_validation import validate_password
 from .models import UserModel, EmailOtp
-import random
+from cms.images import SrcsetField
 import uuid
 from .utils import send_otp_email as send_verification_email
-from django.utils import timezone
-from datetime import timedelta
+from . import otp as otp_store
 from django.contrib.auth import get_user_model
+from cms.db import write_transaction
 
 
 User = get_user_model()
@@ -19,6 +18,7 @@ User = get_user_model()
 # -------------------------------
 class UserSerializer(serializers.ModelSerializer):
     profile_pic = serializers.ImageField(required=False, allow_null=True)
+    profile_pic_srcset = SrcsetField(source='profile_pic_derivatives')
     post_count = serializers.SerializerMethodField()
     """Serializer for reading and updating user info"""
     class Meta:
@@ -33,14 +33,21 @@ class UserSerializer(serializers.ModelSerializer):
             'address',
             'slug',
             'profile_pic',
+            'profile_pic_srcset',
             'is_verified',
             'is_active',
             'date_joined',
             'updated_at',
             'is_superuser',
             'post_count',
+            'published_post_count',
+            'draft_post_count',
+            'deleted_post_count',
+        ]
+        read_only_fields = [
+            'id', 'slug', 'is_verified', 'date_joined', 'updated_at', 'is_superuser', 'post_count',
+            'published_post_count', 'draft_post_count', 'deleted_post_count',
         ]
-        read_only_fields = ['id', 'slug', 'is_verified', 'date_joined', 'updated_at','is_superuser','post_count']
     
     def get_profile_pic(self, obj):
         request = self.context.get("request")
@@ -58,7 +65,7 @@ class UserSerializer(serializers.ModelSerializer):
         return f"{settings.MEDIA_URL}{url}".replace('//', '/')
     
     def get_post_count(self, obj):
-        return obj.posts.count()
+        return obj.published_post_count + obj.draft_post_count + obj.deleted_post_count
 
 
 # -------------------------------
@@ -84,8 +91,7 @@ class RegisterSerializer(serializers.ModelSerializer):
         user = UserModel.objects.create_user(**validated_data, password=password)
 
         # Create OTP for email verification
-        otp_code = str(random.randint(100000, 999999))
-        EmailOtp.objects.create(user=user, email=user.email, otp=otp_code)
+        otp_code = otp_store.get_store().issue(user, user.email, EmailOtp.VERIFY)
 
         # ✅ Send email
         #send_verification_email(user.email, otp_code, user.username or user.first_name)
@@ -105,20 +111,15 @@ class LoginSerializer(serializers.Serializer):
     password = serializers.CharField(write_only=True)
     token = serializers.CharField(read_only=True)
 
-    def validate(self, attrs):
-        email = attrs.get('email')
-        password = attrs.get('password')
-
-        user = authenticate(email=email, password=password)
+    def check_user(self, user):
+        """Reject a failed ``authenticate`` result or a user who may not log in."""
         if not user:
             raise serializers.ValidationError("Invalid email or password.")
         if not user.is_active:
             raise serializers.ValidationError("This account is inactive or deleted.")
         if not user.is_verified:
             raise serializers.ValidationError("Email not verified. Please verify your account.")
-
-        attrs['user'] = user
-        return attrs
+        return user
 
 
 # -------------------------------
@@ -134,22 +135,14 @@ class EmailOtpSerializer(serializers.Serializer):
         otp = attrs.get('otp')
 
         try:
-            otp_obj = EmailOtp.objects.filter(email=email, otp=otp, is_used=False).latest('created_at')
-        except EmailOtp.DoesNotExist:
-            raise serializers.ValidationError("Invalid or expired OTP.")
-        
-
-        expiry_time = otp_obj.created_at + timedelta(minutes=10)
-        if timezone.now() > expiry_time:
-            raise serializers.ValidationError("OTP has expired. Please request a new one.")
+            user_id = otp_store.get_store().consume(email, EmailOtp.VERIFY, otp)
+        except otp_store.OtpError as exc:
+            raise serializers.ValidationError(str(exc))
 
-        user = otp_obj.user
+        user = UserModel.objects.get(pk=user_id)
         user.is_verified = True
         user.save()
 
-        otp_obj.is_used = True
-        otp_obj.save()
-
         attrs['user'] = user
         return attrs
 
@@ -168,11 +161,11 @@ class ForgotPasswordRequestSerializer(serializers.Serializer):
     def create(self, validated_data):
         email = validated_data['email']
         user = User.objects.get(email=email)
-        otp = str(random.randint(000000,999999))
-
-        EmailOtp.objects.create(user=user,email=email,otp=otp)
 
-        send_verification_email(email,otp,user.first_name or user.username,purpose="password_forget")
+        # OTP and its email commit together; the outbox sender delivers it
+        with write_transaction():
+            otp = otp_store.get_store().issue(user, email, EmailOtp.RESET)
+            send_verification_email(email,otp,user.first_name or user.username,purpose="password_forget")
 
         return user
 
@@ -188,34 +181,41 @@ class ResetPasswordSerializer(serializers.Serializer):
         otp = attrs.get('otp')
         new_password = attrs.get('new_password')
 
-        try:
-            otp_obj = EmailOtp.objects.filter(email=email,otp=otp,is_used=False).latest()
-        except EmailOtp.DoesNotExist:
-            raise serializers.ValidationError({
-                "otp":"invalid otp or expired otp"
-            })
-        
-        expiry_time = otp_obj.created_at +timedelta(minutes=10)
-        if timezone.now() > expiry_time:
-            raise serializers.ValidationError({"otp":"the otp is expired please request the new one"})
-        
-        user = otp_obj.user
+        user = User.objects.filter(email=email).first()
+        if user is None:
+            raise serializers.ValidationError({"otp":"invalid otp or expired otp"})
+        # The code is only consumed in save(), so a rejected password does not burn it
         validate_password(new_password,user=user)
 
         attrs['user'] = user
-        attrs['otp_obj'] = otp_obj
         attrs['new_password'] = new_password
         return attrs
     
-    def save(self, **kwargs):
+    def save(self, password_hash=None, **kwargs):
         user = self.validated_data['user']
-        otp_obj = self.validated_data['otp_obj']
         new_password = self.validated_data['new_password']
 
-        user.set_password(new_password)
-        user.save()
-
-        otp_obj.is_used=True
-        otp_obj.save(update_fields=['is_used'])
+        # Consumed after hashing (a busy hashing pool answers 503: the retry must
+        # still find the code), in the same transaction as the new password
+        with write_transaction():
+            try:
+                user_id = otp_store.get_store().consume(self.validated_data['email'], EmailOtp.RESET, self.validated_data['otp'])
+            except otp_store.OtpError as exc:
+                # Leave the block normally, so the failed attempt stays counted
+                error = exc
+            else:
+                error = None if user_id == user.pk else otp_store.InvalidOtp()
+
+            if error is None:
+                if password_hash is not None:
+                    user.password = password_hash
+                else:
+                    user.set_password(new_password)
+                user.save()
+
+        if isinstance(error, otp_store.InvalidOtp):
+            raise serializers.ValidationError({"otp":"invalid otp or expired otp"})
+        if error is not None:
+            raise serializers.ValidationError({"otp":str(error)})
 
         return {"message":"the users password is reset successfully"}
\ No newline at end of file
@@ -1,3 +1,428 @@
-from django.test import TestCase
+import asyncio
+import smtplib
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from cms import hashing, ratelimit
+from cms.pagination import UserCursorPagination
+from cms.testing import QueryBudgetMixin, QueryPlanAssertionsMixin
+from . import otp, outbox
+from .authentication import CachedJWTAuthentication, ClaimsJWTAuthentication, ClaimsUser
+from .models import UserModel, EmailOtp, EmailOutbox
+from .views import UserViewSet, get_tokens_for_user
+
+
+class UserQueryPlanTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = UserModel.objects.create_superuser()
+        self.client.force_authenticate(self.admin)
+
+    def grow(self, count):
+        for index in range(UserModel.objects.count(), count):
+            UserModel.objects.create_user(email=f'user{index}@example.com')
+
+    def test_list_query_budget(self):
+        self.assertQueryBudget('/api/users/', UserViewSet, self.grow)
+
+
+class UserIndexTests(QueryPlanAssertionsMixin, TestCase):
+    def test_otp_lookup(self):
+        queryset = EmailOtp.objects.filter(email='a@example.com', otp='123456', is_used=False)
+        self.assertUsesIndex(queryset.order_by('-created_at')[:1], 'emailotp_unused_lookup_idx')
+
+    def test_otp_expiry_purge(self):
+        queryset = EmailOtp.objects.filter(expires_at__lte=timezone.now()).order_by('expires_at')
+        self.assertUsesIndex(queryset.values('pk')[:1000], 'emailotp_expiry_idx')
+
+    def test_user_listing(self):
+        queryset = UserModel.objects.filter(is_deleted=False).order_by(*UserCursorPagination.ordering)
+        self.assertUsesIndex(queryset[:21], 'user_joined_idx')
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """locmem backend that refuses some recipients and counts connections."""
+    opened = 0
+
+    def open(self):
+        FlakyEmailBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        if any(address.startswith('bounce') for message in messages for address in message.to):
+            raise smtplib.SMTPRecipientsRefused({})
+        return super().send_messages(messages)
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.user = UserModel.objects.create_user(email='reader@example.com')
+        FlakyEmailBackend.opened = 0
+
+    def test_password_reset_only_queues(self):
+        response = APIClient().post('/api/users/forget-password/', {'email': self.user.email})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        row = EmailOutbox.objects.get()
+        self.assertEqual((row.to, row.status), (self.user.email, EmailOutbox.PENDING))
+        self.assertIn(EmailOtp.objects.get().otp, row.text_body)
+
+    @override_settings(EMAIL_BACKEND='user_management.tests.FlakyEmailBackend')
+    def test_drain_over_one_connection(self):
+        for index in range(5):
+            outbox.enqueue(f'user{index}@example.com', 'Hello', 'Body', '<p>Body</p>')
+
+        output = StringIO()
+        call_command('send_outbox', once=True, batch_size=2, stdout=output)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(mail.outbox[0].alternatives[0][1], 'text/html')
+        self.assertEqual(FlakyEmailBackend.opened, 1)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.SENT).count(), 5)
+        self.assertIn('emails/s', output.getvalue())
+        self.assertIn('lag 0.0s', output.getvalue())
+
+    @override_settings(EMAIL_BACKEND='user_management.tests.FlakyEmailBackend', EMAIL_OUTBOX_MAX_ATTEMPTS=2)
+    def test_retry_backoff_and_dead_letter(self):
+        bounce = outbox.enqueue('bounce@example.com', 'Hello', 'Body')
+        outbox.enqueue('ok@example.com', 'Hello', 'Body')
+
+        self.assertEqual(outbox.drain(), (1, 1, 0))
+        bounce.refresh_from_db()
+        self.assertEqual((bounce.status, bounce.attempts), (EmailOutbox.PENDING, 1))
+        self.assertIn('SMTPRecipientsRefused', bounce.last_error)
+        self.assertGreater(bounce.next_attempt_at, timezone.now())
+        self.assertEqual(outbox.drain(), (0, 0, 0), "not due before the backoff")
+
+        EmailOutbox.objects.filter(pk=bounce.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.drain(), (0, 0, 1))
+        self.assertEqual(EmailOutbox.objects.get(pk=bounce.pk).status, EmailOutbox.DEAD)
+        self.assertEqual(outbox.stats()['dead'], 1)
+
+    def test_claims_do_not_overlap(self):
+        for index in range(3):
+            outbox.enqueue(f'user{index}@example.com', 'Hello', 'Body')
+        first = outbox.claim_batch(2)
+        second = outbox.claim_batch(2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertEqual(outbox.claim_batch(2), [])
+
+        # An expired lease makes the rows due again
+        EmailOutbox.objects.update(next_attempt_at=timezone.now())
+        self.assertEqual(len(outbox.claim_batch(10)), 3)
+
+
+class OtpStoreTests(TestCase):
+    def setUp(self):
+        self.user = UserModel.objects.create_user(email='new@example.com', password='x')
+        self.store = otp.get_store()
+        cache.clear()
+
+    def test_verify_email(self):
+        code = self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        response = APIClient().post('/api/users/verify-otp/', {'email': self.user.email, 'otp': code})
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_verified)
+
+        response = APIClient().post('/api/users/verify-otp/', {'email': self.user.email, 'otp': code})
+        self.assertEqual(response.status_code, 400, "a code is single use")
+
+    def test_expired_code_rejected(self):
+        code = self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        EmailOtp.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        with self.assertRaises(otp.InvalidOtp):
+            self.store.consume(self.user.email, EmailOtp.VERIFY, code)
+
+    def test_reissue_invalidates_previous_code(self):
+        first = self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        second = self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        if first != second:
+            with self.assertRaises(otp.InvalidOtp):
+                self.store.consume(self.user.email, EmailOtp.VERIFY, first)
+        self.assertEqual(self.store.consume(self.user.email, EmailOtp.VERIFY, second), self.user.pk)
+
+    def test_purposes_are_separate(self):
+        code = self.store.issue(self.user, self.user.email, EmailOtp.RESET)
+        with self.assertRaises(otp.InvalidOtp):
+            self.store.consume(self.user.email, EmailOtp.VERIFY, code)
+        self.assertEqual(self.store.consume(self.user.email, EmailOtp.RESET, code), self.user.pk)
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_attempts_are_capped(self):
+        code = self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        wrong = f'{(int(code) + 1) % 10 ** 6:06d}'
+        for _ in range(2):
+            with self.assertRaises(otp.InvalidOtp):
+                self.store.consume(self.user.email, EmailOtp.VERIFY, wrong)
+        with self.assertRaises(otp.TooManyAttempts):
+            self.store.consume(self.user.email, EmailOtp.VERIFY, wrong)
+        with self.assertRaises(otp.TooManyAttempts):
+            self.store.consume(self.user.email, EmailOtp.VERIFY, code)
+
+    @override_settings(OTP_STORE='user_management.otp.CacheOtpStore', OTP_MAX_ATTEMPTS=2)
+    def test_cache_store(self):
+        store = otp.get_store()
+        code = store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        self.assertFalse(EmailOtp.objects.exists())
+        self.assertEqual(store.consume(self.user.email, EmailOtp.VERIFY, code), self.user.pk)
+        with self.assertRaises(otp.InvalidOtp):
+            store.consume(self.user.email, EmailOtp.VERIFY, code)
+
+        code = store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        wrong = f'{(int(code) + 1) % 10 ** 6:06d}'
+        with self.assertRaises(otp.InvalidOtp):
+            store.consume(self.user.email, EmailOtp.VERIFY, wrong)
+        with self.assertRaises(otp.TooManyAttempts):
+            store.consume(self.user.email, EmailOtp.VERIFY, wrong)
+        with self.assertRaises(otp.InvalidOtp):
+            store.consume(self.user.email, EmailOtp.VERIFY, code)
+
+    def test_reset_password(self):
+        APIClient().post('/api/users/forget-password/', {'email': self.user.email})
+        code = EmailOtp.objects.get(purpose=EmailOtp.RESET).otp
+        payload = {'email': self.user.email, 'otp': code, 'new_password': 'short'}
+        response = APIClient().post('/api/users/reset-password/', payload)
+        self.assertEqual(response.status_code, 400)
+
+        payload['new_password'] = 'Better-Passphrase-42'
+        response = APIClient().post('/api/users/reset-password/', payload)
+        self.assertEqual(response.status_code, 200, "a rejected password does not use up the code")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Better-Passphrase-42'))
+
+    def test_busy_hashing_pool_keeps_the_reset_code(self):
+        code = self.store.issue(self.user, self.user.email, EmailOtp.RESET)
+        payload = {'email': self.user.email, 'otp': code, 'new_password': 'Better-Passphrase-42'}
+        with mock.patch.object(hashing, 'make_password', side_effect=hashing.HashingBusy):
+            response = APIClient().post('/api/users/reset-password/', payload)
+        self.assertEqual(response.status_code, 503)
+
+        response = APIClient().post('/api/users/reset-password/', payload)
+        self.assertEqual(response.status_code, 200, "the retry can still use the code")
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('Better-Passphrase-42'))
+
+    def test_wrong_reset_code_counts_an_attempt(self):
+        code = self.store.issue(self.user, self.user.email, EmailOtp.RESET)
+        wrong = f'{(int(code) + 1) % 10 ** 6:06d}'
+        payload = {'email': self.user.email, 'otp': wrong, 'new_password': 'Better-Passphrase-42'}
+        response = APIClient().post('/api/users/reset-password/', payload)
+        self.assertEqual(response.json(), {'otp': ['invalid otp or expired otp']})
+        self.assertEqual(EmailOtp.objects.get().failed_attempts, 1)
+        self.assertFalse(UserModel.objects.get(pk=self.user.pk).check_password('Better-Passphrase-42'))
+
+    def test_purge_command(self):
+        self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        self.store.issue(self.user, self.user.email, EmailOtp.VERIFY)
+        self.store.issue(self.user, self.user.email, EmailOtp.RESET)
+        EmailOtp.objects.filter(purpose=EmailOtp.RESET).update(expires_at=timezone.now())
+
+        output = StringIO()
+        call_command('purge_otps', batch_size=1, stdout=output)
+        self.assertIn('Purged 2 one-time codes', output.getvalue())
+        self.assertEqual(EmailOtp.objects.count(), 1)
+
+
+class AsyncAuthViewTests(TestCase):
+    password = 'Secret-Pass-42'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = UserModel.objects.create_user(email='reader@example.com', password=self.password, is_verified=True)
+
+    def test_login(self):
+        response = self.client.post('/api/users/login/', {'email': self.user.email, 'password': self.password}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['email'], self.user.email)
+        self.assertIn('access', response.json())
+
+        response = self.client.post('/api/users/login/', {'email': self.user.email, 'password': 'wrong'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'non_field_errors': ['Invalid email or password.']})
+
+        response = self.client.post('/api/users/login/', {'email': 'nobody@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_login_rejects_unverified(self):
+        UserModel.objects.filter(pk=self.user.pk).update(is_verified=False)
+        response = self.client.post('/api/users/login/', {'email': self.user.email, 'password': self.password})
+        self.assertEqual(response.json(), {'non_field_errors': ['Email not verified. Please verify your account.']})
+
+    @override_settings(ALLOW_REGISTRATION=True)
+    def test_register_hashes_in_pool(self):
+        completed = hashing.stats()['completed']
+        payload = {
+            'first_name': 'Ada', 'last_name': 'L', 'email': 'ada@example.com',
+            'password': self.password, 'confirm_password': self.password,
+        }
+        with mock.patch('builtins.print'):
+            response = self.client.post('/api/users/register/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(UserModel.objects.get(email='ada@example.com').check_password(self.password))
+        self.assertGreater(hashing.stats()['completed'], completed)
+
+        with mock.patch('builtins.print'):
+            response = self.client.post('/api/users/register/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
+
+    def test_malformed_json(self):
+        response = self.client.post('/api/users/login/', '{', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+    def test_busy_pool_answers_503(self):
+        with mock.patch.dict(hashing._metrics, in_flight=10 ** 6), self.assertLogs('cms.hashing', 'WARNING'):
+            response = self.client.post('/api/users/login/', {'email': self.user.email, 'password': self.password})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    async def test_hashing_does_not_block_the_loop(self):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.ensure_future(ticker())
+        await asyncio.gather(*(hashing.run(time.sleep, 0.1) for _ in range(2)))
+        task.cancel()
+        self.assertGreater(ticks, 5)
+        self.assertGreater(hashing.stats()['avg_hash_ms'], 0)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = UserModel.objects.create_user(email='reader@example.com', is_verified=True)
+        self.admin = UserModel.objects.create_superuser()
+        self.auth = CachedJWTAuthentication()
+
+    def authenticate(self, user):
+        token = get_tokens_for_user(user)['access']
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.auth.authenticate(request)[0]
+
+    def test_user_is_cached(self):
+        with self.assertNumQueries(1):
+            user = self.authenticate(self.user)
+        with self.assertNumQueries(0):
+            cached = self.authenticate(self.user)
+        self.assertEqual(cached, self.user)
+        self.assertTrue(cached.is_verified)
+        self.assertIn('bio', cached.get_deferred_fields())
+
+    def test_lock_invalidates(self):
+        self.authenticate(self.user)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.patch(f'/api/users/{self.user.slug}/lock/')
+        self.assertEqual(response.status_code, 200)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(self.user)
+
+    def test_save_invalidates(self):
+        self.authenticate(self.user)
+        self.user.is_verified = False
+        self.user.save()
+        self.assertFalse(self.authenticate(self.user).is_verified)
+
+    def test_profile_endpoint_serializes_full_row(self):
+        self.user.bio = 'Hello'
+        self.user.save()
+        token = get_tokens_for_user(self.user)['access']
+        response = APIClient().get('/api/users/me/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.json()['bio'], 'Hello')
+
+
+@override_settings(AUTH_TOKEN_CLAIMS=True)
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = UserModel.objects.create_user(email='reader@example.com', is_verified=True)
+        self.auth = ClaimsJWTAuthentication()
+
+    def authenticate(self, method='get', token=None):
+        token = token or get_tokens_for_user(self.user)['access']
+        request = getattr(APIRequestFactory(), method)('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return self.auth.authenticate(request)[0]
+
+    def test_safe_requests_use_claims(self):
+        self.authenticate()
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual((user.pk, user.slug), (self.user.pk, self.user.slug))
+        self.assertTrue(user.is_verified)
+
+        self.assertIsInstance(self.authenticate('post'), UserModel)
+
+    def test_claim_change_bumps_version(self):
+        token = get_tokens_for_user(self.user)['access']
+        self.user.bio = 'Not a claim'
+        self.user.save()
+        self.assertEqual(self.user.claims_version, 0)
+        self.assertIsInstance(self.authenticate(token=token), ClaimsUser)
+
+        self.user.is_verified = False
+        self.user.save()
+        self.assertEqual(UserModel.objects.get(pk=self.user.pk).claims_version, 1)
+        user = self.authenticate(token=token)
+        self.assertIsInstance(user, UserModel, "stale claims fall back to the user row")
+        self.assertFalse(user.is_verified)
+
+    def test_locked_user_rejected(self):
+        token = get_tokens_for_user(self.user)['access']
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate(token=token)
+
+    @override_settings(AUTH_TOKEN_CLAIMS=False)
+    def test_tokens_without_claims(self):
+        self.assertIsInstance(self.authenticate(), UserModel)
+
+
+class AuthRateLimitTests(TestCase):
+    def setUp(self):
+        ratelimit.get_store().clear()
+        self.user = UserModel.objects.create_user(email='reader@example.com', password='Secret-Pass-42', is_verified=True)
+
+    @override_settings(RATELIMIT_RULES={'login': [('email', 2, 60)]})
+    def test_login_limited_per_email(self):
+        client = APIClient()
+        for _ in range(2):
+            response = client.post('/api/users/login/', {'email': 'Reader@example.com', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 400)
+
+        with mock.patch('cms.hashing.run') as run:
+            response = client.post('/api/users/login/', {'email': 'reader@example.com', 'password': 'Secret-Pass-42'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        run.assert_not_called()
+
+        response = client.post('/api/users/login/', {'email': 'other@example.com', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(RATELIMIT_RULES={'password-reset-request': [('ip', 1, 600)]})
+    def test_forget_password_limited_per_ip(self):
+        client = APIClient()
+        self.assertEqual(client.post('/api/users/forget-password/', {'email': self.user.email}).status_code, 200)
+        response = client.post('/api/users/forget-password/', {'email': self.user.email})
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
@@ -1,10 +1,17 @@
-from rest_framework import status, viewsets, generics
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework import status, viewsets
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated , IsAdminUser , IsAuthenticatedOrReadOnly
 from rest_framework.views import APIView
 from rest_framework_simplejwt.tokens import RefreshToken
 from .permissions import IsAdminOrOwner, IsVerifiedUser, IsUserActive
 from rest_framework.decorators import action
+from cms import hashing
+from cms.asyncapi import AsyncAPIView, sync
+from cms.ratelimit import SlidingWindowThrottle
+from cms.queryplan import QueryPlanMixin
+from cms.pagination import UserCursorPagination
 
 from .models import UserModel
 from .serializers import (
@@ -23,30 +30,53 @@ from .serializers import (
 # ---------------------------------
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
+    if settings.AUTH_TOKEN_CLAIMS:
+        # Signed copies for ClaimsJWTAuthentication; claims_version bounds their staleness
+        for name in UserModel.CLAIM_FIELDS:
+            refresh[name] = getattr(user, name)
+        refresh['claims_version'] = user.claims_version
     return {
         'refresh': str(refresh),
         'access': str(refresh.access_token),
     }
 
 
+async def authenticate(email, password):
+    """
+    ``ModelBackend.authenticate`` for the async views, with the password
+    check run in the hashing pool instead of on the request thread.
+    """
+    try:
+        user = await UserModel._default_manager.aget_by_natural_key(email)
+    except UserModel.DoesNotExist:
+        # Hash anyway, so the response time does not reveal unknown emails
+        await hashing.make_password(password)
+        return None
+
+    valid, must_update = await hashing.check_password(password, user.password)
+    if not valid or not user.is_active:
+        return None
+    if must_update:
+        user.password = await hashing.make_password(password)
+        await UserModel.objects.filter(pk=user.pk).aupdate(password=user.password)
+    return user
+
+
 # ---------------------------------
 # Registration API
 # ---------------------------------
-class RegisterView(generics.CreateAPIView):
+class RegisterView(AsyncAPIView):
     """Registers a new user and sends OTP."""
-    serializer_class = RegisterSerializer
-    permission_classes = [AllowAny]
-
-    def create(self, request, *args, **kwargs):
-        print(f"register user method called here {request.data}")
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        print(serializer)
-        user = serializer.save()
-        print(user)
-        return Response({
+    ratelimit_scope = 'register'
+
+    async def post(self, request):
+        serializer = RegisterSerializer(data=self.data)
+        validated = await self.validate(serializer)
+        password_hash = await hashing.make_password(validated['password'])
+        user = await sync(serializer.save, password_hash=password_hash)
+        return JsonResponse({
             "message": "User registered successfully. Please verify your email using the OTP sent.",
-            "user": UserSerializer(user, context=self.get_serializer_context()).data
+            "user": UserSerializer(user, context={"request": request}).data
         }, status=status.HTTP_201_CREATED)
 
 
@@ -56,6 +86,8 @@ class RegisterView(generics.CreateAPIView):
 class VerifyOtpView(APIView):
     """Verifies user's email using OTP."""
     permission_classes = [AllowAny]
+    throttle_classes = [SlidingWindowThrottle]
+    ratelimit_scope = 'otp'
 
     def post(self, request, *args, **kwargs):
         serializer = EmailOtpSerializer(data=request.data)
@@ -68,19 +100,19 @@ class VerifyOtpView(APIView):
 # ---------------------------------
 # Login API (JWT Token)
 # ---------------------------------
-class LoginView(APIView):
+class LoginView(AsyncAPIView):
     """Authenticate user with email & password, returns JWT + user data."""
-    permission_classes = [AllowAny]
+    ratelimit_scope = 'login'
 
-    def post(self, request):
-        serializer = LoginSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+    async def post(self, request):
+        serializer = LoginSerializer(data=self.data)
+        validated = await self.validate(serializer)
+        user = serializer.check_user(await authenticate(validated['email'], validated['password']))
 
-        user = serializer.validated_data['user']
         tokens = get_tokens_for_user(user)
         user_data = UserSerializer(user, context={"request": request}).data
-        
-        return Response({
+
+        return JsonResponse({
             "message": "Login successful",
             "refresh": tokens['refresh'],
             "access": tokens['access'],
@@ -91,12 +123,14 @@ class LoginView(APIView):
 # ---------------------------------
 # User ViewSet (CRUD for profile)
 # ---------------------------------
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(QueryPlanMixin, viewsets.ModelViewSet):
     """ViewSet for managing user profile."""
     queryset = UserModel.objects.filter(is_deleted=False)
     serializer_class = UserSerializer
     lookup_field = 'slug'
     permission_classes = [IsAuthenticated , IsAdminOrOwner]
+    pagination_class = UserCursorPagination
+    query_budget = 1
 
     def perform_destroy(self, instance):
         """Soft delete user."""
@@ -133,6 +167,8 @@ class UserViewSet(viewsets.ModelViewSet):
 
 class ForgetPasswordView(APIView):
     permission_classes = [AllowAny]
+    throttle_classes = [SlidingWindowThrottle]
+    ratelimit_scope = 'password-reset-request'
     def post(self,request):
         serializer = ForgotPasswordRequestSerializer(data = request.data)
         if serializer.is_valid():
@@ -142,19 +178,21 @@ class ForgetPasswordView(APIView):
 
     
 
-class ResetPasswordView(APIView):
-    permission_classes = [AllowAny]
-    def post(self,request):
-        serializer = ResetPasswordSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(status=status.HTTP_200_OK,data={"message":"your password is reset successfully"})
-        return Response(status=status.HTTP_400_BAD_REQUEST,data=serializer.errors)
-    
+class ResetPasswordView(AsyncAPIView):
+    ratelimit_scope = 'password-reset'
+
+    async def post(self,request):
+        serializer = ResetPasswordSerializer(data=self.data)
+        validated = await self.validate(serializer)
+        password_hash = await hashing.make_password(validated['new_password'])
+        await sync(serializer.save, password_hash=password_hash)
+        return JsonResponse(status=status.HTTP_200_OK,data={"message":"your password is reset successfully"})
+
 
 class MyView(APIView):
     permission_classes = [IsAuthenticated , IsVerifiedUser]
     def get(self, request):
-        serializer = UserSerializer(request.user)
+        # request.user only carries the authentication fields; serialize the full row
+        serializer = UserSerializer(UserModel.objects.get(pk=request.user.pk))
         return Response(serializer.data)
         